@@ -0,0 +1,259 @@
+"""Cache of VM results keyed by program and input.
+
+A program's run is fully determined by its code, the machine it runs on
+and its input vector, so a ResultCache keeps the VM's result (output,
+steps, instructions and jump counts) under two hashes: one of the code
+together with the target description, one of the inputs.  Results live
+in an in-memory LRU and, given a directory, in one JSON file per key on
+disk that other processes share; both tiers are bounded in bytes of
+encoded results and drop their least recently used entries first.
+
+    cache = ResultCache("~/.cache/gbl")
+    result, hit = cached_run(cache, program, [7, 3])
+
+Only runs that consumed nothing beyond the given inputs are stored: a
+value typed at the SCAN prompt is not part of the key.
+
+`python -m compiler.cache` runs a program on a batch of input files
+through a cache, and prints or clears a cache directory.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from .machine import load
+from .target import DEFAULT, get_target
+
+
+def program_hash(program, target=DEFAULT):
+    """Hash of a Code and the machine its steps are charged by"""
+    digest = hashlib.sha256(program.to_bytes())
+    digest.update(json.dumps(target.to_dict(), sort_keys=True).encode())
+    return digest.hexdigest()[:32]
+
+
+def input_hash(input_data):
+    return hashlib.sha256(json.dumps(list(input_data)).encode()).hexdigest()[:32]
+
+
+class ResultCache:
+    """Two-tier LRU of run results; stats counts what each lookup found"""
+
+    def __init__(self, directory=None, memory_bytes=16 << 20, disk_bytes=256 << 20):
+        self.memory = {}  # key -> encoded result, least recently used first
+        self.memory_size = 0
+        self.memory_bytes = memory_bytes
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.disk_bytes = disk_bytes
+        self.disk_size = None  # Bytes on disk when last listed, plus what this cache wrote since
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, program, input_data, target=DEFAULT):
+        return f"{program_hash(program, target)}-{input_hash(input_data)}"
+
+    def get(self, program, input_data, target=DEFAULT):
+        """The cached result of running program on input_data, or None"""
+        key = self.key(program, input_data, target)
+        encoded = self.memory.pop(key, None)
+        if encoded is not None:
+            self.memory[key] = encoded
+            self.stats["memory_hits"] += 1
+            return json.loads(encoded)
+
+        encoded = self._read(key)
+        try:
+            result = json.loads(encoded) if encoded is not None else None
+        except ValueError:
+            result = None  # A damaged file is a miss; the next put replaces it
+        if result is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["disk_hits"] += 1
+        self._remember(key, encoded)
+        return result
+
+    def put(self, program, input_data, result, target=DEFAULT):
+        key = self.key(program, input_data, target)
+        encoded = json.dumps(result)
+        self.stats["stores"] += 1
+        self._remember(key, encoded)
+        self._write(key, encoded)
+
+    def _remember(self, key, encoded):
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_size -= len(old)
+        if len(encoded) > self.memory_bytes:
+            return
+        self.memory[key] = encoded
+        self.memory_size += len(encoded)
+        while self.memory_size > self.memory_bytes:
+            evicted = self.memory.pop(next(iter(self.memory)))
+            self.memory_size -= len(evicted)
+            self.stats["evictions"] += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _read(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key)) as f:
+                encoded = f.read()
+            os.utime(self._path(key))  # Recently used
+        except OSError:
+            return None
+        return encoded
+
+    def _write(self, key, encoded):
+        if not self.directory or len(encoded) > self.disk_bytes:
+            return
+        if self.disk_size is None:
+            self.disk_size = sum(size for _, size, _ in self.entries())
+        try:
+            replaced = os.stat(self._path(key)).st_size
+        except OSError:
+            replaced = 0
+        # Readers in other processes see the whole file or none of it
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix=".partial")
+        with os.fdopen(fd, 'w') as f:
+            f.write(encoded)
+        os.replace(partial, self._path(key))
+        # Listing the directory costs a stat per entry, so it only happens over the limit
+        self.disk_size += len(encoded) - replaced
+        if self.disk_size > self.disk_bytes:
+            self._trim()
+
+    def entries(self):
+        """(mtime, bytes, path) of the files on disk, least recently used first"""
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue  # Removed by another process
+                found.append((status.st_mtime, status.st_size, path))
+        return sorted(found)
+
+    def _trim(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            self.stats["evictions"] += 1
+        self.disk_size = total
+
+    def clear(self):
+        self.memory.clear()
+        self.memory_size = 0
+        if self.directory:
+            for _, _, path in self.entries():
+                os.remove(path)
+            self.disk_size = 0
+
+    def report(self):
+        lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        hits = lookups - self.stats["misses"]
+        rate = f" ({hits / lookups:.0%})" if lookups else ""
+        return (f"Result cache: {hits} of {lookups} lookups hit{rate}, {self.stats['memory_hits']} in memory "
+                f"and {self.stats['disk_hits']} on disk; {self.stats['stores']} stored, "
+                f"{self.stats['evictions']} evicted")
+
+
+def replay_output(result):
+    """Print a cached result's values as the VM prints them while running"""
+    for value in result["output"]:
+        print(f"Output: {value}")
+
+
+def cached_run(cache, program, input_data=None, target=DEFAULT, interactive=True, **options):
+    """Run program on input_data through the cache; (result, whether it was a hit).
+
+    options go to the VM on a miss; a hit prints what the VM would have
+    unless quiet is given.  A run that asked for input beyond input_data
+    is returned but not stored; without interactive it fails with
+    RuntimeError instead of asking.
+    """
+    from vm import VM
+
+    given = list(input_data or [])
+    result = cache.get(program, given, target)
+    if result is not None:
+        if not options.get("quiet"):
+            replay_output(result)
+        return result, True
+    vm = VM(program, list(given), target=target, **options)
+    result = vm.run() if interactive else asyncio.run(vm.run_async(yield_every=0))
+    if vm.input_pos <= len(given):
+        cache.put(program, given, result, target)
+    return result, False
+
+
+def read_inputs(path):
+    with open(path) as f:
+        return [int(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run programs through a result cache')
+    commands = parser.add_subparsers(dest='command', required=True)
+    batch = commands.add_parser('batch', help='Run a compiled program on every input file')
+    batch.add_argument('program', help='Compiled program, text or binary')
+    batch.add_argument('inputs', nargs='+', help='Input files, one value per line')
+    batch.add_argument('--cache', metavar='DIR', help='Cache directory (default: memory only)')
+    batch.add_argument('--target', metavar='NAME|FILE', help='Machine description to run on')
+    show = commands.add_parser('stats', help='Print the size of a cache directory')
+    show.add_argument('cache', metavar='DIR')
+    clear = commands.add_parser('clear', help='Remove every result in a cache directory')
+    clear.add_argument('cache', metavar='DIR')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'batch':
+            program, target = load(args.program), get_target(args.target)
+            cache = ResultCache(args.cache)
+            failed = 0
+            print(f"{'input':<24} {'steps':>12} {'instrs':>10} {'cached':>7}  output")
+            for path in args.inputs:
+                try:
+                    result, hit = cached_run(cache, program, read_inputs(path), target, interactive=False,
+                                             quiet=True, verified=True)
+                except RuntimeError as e:
+                    print(f"{path:<24} failed: {e}")
+                    failed += 1
+                    continue
+                print(f"{path:<24} {result['steps']:>12} {result['instructions']:>10} {'yes' if hit else 'no':>7}  "
+                      f"{' '.join(map(str, result['output']))}")
+            print(cache.report())
+            return 1 if failed else 0
+
+        cache = ResultCache(args.cache)
+        if args.command == 'stats':
+            entries = cache.entries()
+            print(f"{len(entries)} results, {sum(size for _, size, _ in entries) / 1024:.1f} KiB")
+        else:
+            cache.clear()
+        return 0
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
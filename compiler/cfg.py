@@ -0,0 +1,139 @@
+"""Control-flow analyses over the blocks of an IRProgram"""
+
+
+class Loop:
+    def __init__(self, header, blocks):
+        self.header = header    # Block whose branch decides whether to iterate
+        self.blocks = blocks    # Labels of every block in the loop, header included
+        self.parent = None      # Innermost enclosing loop
+        self.depth = 1
+
+    def defined_names(self, block_map):
+        """Names assigned or read anywhere inside the loop (nested loops included)"""
+        names = set()
+        for label in self.blocks:
+            for op in block_map[label].ops:
+                if op.dst is not None:
+                    names.add(op.dst)
+        return names
+
+    def __repr__(self):
+        return f"Loop({self.header}, depth={self.depth})"
+
+
+def predecessors(program):
+    preds = {block.label: [] for block in program.blocks}
+    for block in program.blocks:
+        for target in block.successors():
+            preds[target].append(block.label)
+    return preds
+
+
+def reachable(program):
+    block_map = program.block_map()
+    seen = set()
+    stack = [program.entry.label]
+    while stack:
+        label = stack.pop()
+        if label in seen:
+            continue
+        seen.add(label)
+        stack.extend(block_map[label].successors())
+    return seen
+
+
+def dominators(program):
+    """Iterative dominator sets for reachable blocks (label -> set of labels)"""
+    live = reachable(program)
+    preds = predecessors(program)
+    order = [block.label for block in program.blocks if block.label in live]
+    entry = program.entry.label
+
+    dom = {label: set(order) for label in order}
+    dom[entry] = {entry}
+    changed = True
+    while changed:
+        changed = False
+        for label in order:
+            if label == entry:
+                continue
+            incoming = [dom[p] for p in preds[label] if p in live]
+            new = set.intersection(*incoming) | {label} if incoming else {label}
+            if new != dom[label]:
+                dom[label] = new
+                changed = True
+    return dom
+
+
+def natural_loops(program):
+    """Natural loops keyed by header, outermost first.
+
+    Back edges sharing a header are merged into one loop.
+    """
+    dom = dominators(program)
+    preds = predecessors(program)
+    block_map = program.block_map()
+
+    bodies = {}
+    for label in dom:
+        for target in block_map[label].successors():
+            if target in dom[label]:  # back edge label -> target
+                body = bodies.setdefault(target, {target})
+                stack = [label]
+                while stack:
+                    node = stack.pop()
+                    if node not in body:
+                        body.add(node)
+                        stack.extend(p for p in preds[node] if p in dom)
+
+    loops = sorted((Loop(header, body) for header, body in bodies.items()),
+                   key=lambda loop: -len(loop.blocks))
+    for i, loop in enumerate(loops):
+        for outer in reversed(loops[:i]):
+            if loop.header in outer.blocks:
+                loop.parent = outer
+                loop.depth = outer.depth + 1
+                break
+    return loops
+
+
+def block_loops(program, loops=None):
+    """Map each block label to its enclosing loops, outermost first"""
+    loops = natural_loops(program) if loops is None else loops
+    nesting = {block.label: [] for block in program.blocks}
+    for loop in loops:  # Outermost first, so each list stays ordered
+        for label in loop.blocks:
+            nesting[label].append(loop)
+    return nesting
+
+
+def live_variables(program):
+    """Names read before being assigned on some path from each block's entry.
+
+    Backward may-analysis over every block (label -> set of names); nothing
+    is live after a HALT.
+    """
+    uses = {}
+    defs = {}
+    for block in program.blocks:
+        used, defined = set(), set()
+        for op in block.ops:
+            used.update(name for name in op.uses() if name not in defined)
+            if op.dst is not None:
+                defined.add(op.dst)
+        used.update(name for name in block.terminator.uses() if name not in defined)
+        uses[block.label], defs[block.label] = used, defined
+
+    live_in = {block.label: set() for block in program.blocks}
+    changed = True
+    while changed:
+        changed = False
+        for block in reversed(program.blocks):
+            live_out = set()
+            for target in block.successors():
+                live_out |= live_in[target]
+            new = uses[block.label] | (live_out - defs[block.label])
+            if new != live_in[block.label]:
+                live_in[block.label] = new
+                changed = True
+    return live_in
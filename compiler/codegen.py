@@ -1,36 +1,152 @@
-class Instruction:
-    def __init__(self, op, arg=None):
-        self.op = op
-        self.arg = arg
+from .constants import LOOP_WEIGHT, build_sequence, derive_sequence, plan_pool, sequence_cost
+from .cfg import block_loops
+from .ir import IRBuilder, Jump, Branch, Halt, BINARY_OPS, ZERO_TESTS
+from .optimizer import build_pipeline
+from .passes import PassManager
+from .stats import CompileStats
+from .machine import Code, OPCODE, JUMP_OPS
+from .target import DEFAULT
 
-    def __str__(self):
-        if self.arg is not None:
-            return f"{self.op} {self.arg}"
-        return self.op
+LOAD, STORE, JUMP = OPCODE["LOAD"], OPCODE["STORE"], OPCODE["JUMP"]
 
 
 class CodeGenerator:
-    def __init__(self, semantic_analyzer):
+    """Lower programs to machine code.
+
+    generate(ast) builds the three-address IR, runs the optimization passes
+    for the chosen level through a PassManager and lowers the result with
+    lower(program).
+    """
+
+    # Shared routine for each operator in size mode: (body, scratch cell of the result)
+    ROUTINES = {'*': ("multiplication_loop", 0), '/': ("division_loop", 0), '%': ("modulo_loop", 1)}
+
+    # Cells used by the arithmetic templates, named for profiles and allocation
+    SCRATCH = ("%0", "%1", "%2", "%3")
+    SELECTOR = "%sel"
+    # Scratch cells each operator's template loops over
+    TEMPLATE_CELLS = {'*': SCRATCH[:3], '/': SCRATCH, '%': SCRATCH[1:]}
+
+    def __init__(self, semantic_analyzer=None, opt_level=1, passes=None, profile=None, stats=None,
+                 target=None, measure_passes=False):
         self.analyzer = semantic_analyzer
-        self.code = []
+        self.profile = profile  # pgo.Profile from training runs, or None
+        # Machine costs every code choice is weighed against (target.Target)
+        self.target = target if target is not None else DEFAULT
+        # Phase timings and counts (stats.CompileStats), recorded when enabled
+        self.stats = stats if stats is not None else CompileStats(enabled=False)
+        pipeline = build_pipeline(opt_level, profile, self.target) if passes is None else passes
+        # measure_passes records each pass's instruction and step deltas (-v)
+        self.pass_manager = PassManager(pipeline, measure=measure_passes, stats=self.stats, target=self.target)
+        # -Os: emit *, / and % once as shared routines instead of inlining them
+        self.size_opt = opt_level == 's'
+        self.routine_sites = {}  # opcode -> return labels, indexed by selector value
+        self.code = Code()
+        self.label_refs = {}  # Instruction index -> label of a jump not backpatched yet
         self.memory_map = {}
         self.next_memory = 0
         self.label_counter = 0
         self.labels = {}
-
-        # First allocate constants to memory
-        for name in self.analyzer.const_table:
-            self.memory_map[name] = self.next_memory
+        self.label_positions = set()
+        self.block_ranges = {}  # IR block label -> (first, end) instruction index
+        self.terminators = {Jump: self.generate_jump, Branch: self.generate_branch, Halt: self.generate_halt}
+
+        # Source map: the origin of every instruction, where each op starts
+        # and the instruction range and targets of every lowered branch
+        self.origin = None
+        self.origins = []
+        self.op_sites = []      # (origin, first instruction)
+        self.branch_sites = []  # (origin, first, end, true label, false label)
+
+        # Arithmetic templates for cost analysis: inline expansions as
+        # (opcode, first, end, left, right) and shared routines' ranges
+        self.template_sites = []
+        self.routine_ranges = {}  # opcode -> (first, end)
+
+        # Accumulator contents when known at compile time, and the cells
+        # holding a constant for the whole program (value -> address)
+        self.acc = None
+        self.pool = {}
+        self.pool_cells = {}
+
+    def allocate_memory(self, program):
+        # Constants read straight from memory, then user variables and pass
+        # temporaries, then the 4 scratch cells of the arithmetic templates
+        # and the return selector of shared routines.  A CONST that is only
+        # ever materialized in the accumulator needs no cell.
+        read = self.memory_operands(program)
+        names = [name for name in program.consts if name in read]
+        names += list(program.variables) + list(self.SCRATCH)
+        if self.size_opt:
+            names.append(self.SELECTOR)
+
+        # The most accessed cells take the fast addresses: measured accesses
+        # with a profile, loop-weighted uses without one
+        if self.profile is not None:
+            from .pgo import cell_weights
+            weights = cell_weights(program, self.profile)
+        else:
+            weights = self.cell_weights(program)
+        names.sort(key=lambda name: -weights.get(name, 0))
+
+        cells = {}
+        for name in names:
+            cells[name] = self.next_memory
             self.next_memory += 1
-
-        # Allocate user variables to memory
-        for name in self.analyzer.var_table:
-            self.memory_map[name] = self.next_memory
-            self.next_memory += 1
-
-        # Reserve 5 temporary memory locations after user variables
-        self.temp_start = self.next_memory
-        self.next_memory += 5  # Adjust based on maximum temps needed
+        self.scratch = [cells.pop(name) for name in self.SCRATCH]
+        self.selector_addr = cells.pop(self.SELECTOR, None)
+        self.memory_map.update(cells)
+
+    def memory_operands(self, program):
+        """Symbols some instruction reads from memory rather than through load()"""
+        names = set()
+        for block in program.blocks:
+            for op in block.ops:
+                if op.opcode in ('+', '-'):
+                    names.add(op.b)
+                elif op.opcode == 'write':
+                    names.add(op.a)
+            terminator = block.terminator
+            if isinstance(terminator, Branch) and terminator.relop not in ZERO_TESTS:
+                # generate_condition subtracts the right operand for <= and >,
+                # the left one for >= and <, and both for == and !=
+                if terminator.relop not in ('>=', '<'):
+                    names.add(terminator.b)
+                if terminator.relop not in ('<=', '>'):
+                    names.add(terminator.a)
+        return names
+
+    def cell_weights(self, program):
+        """Static estimate of the accesses of every cell.
+
+        Each use or assignment counts LOOP_WEIGHT per enclosing loop, and
+        an arithmetic template counts once more for its own loop on every
+        scratch cell it touches.
+        """
+        nesting = block_loops(program)
+        weights = {}
+        for block in program.blocks:
+            weight = LOOP_WEIGHT ** len(nesting[block.label])
+            for op in block.ops:
+                for name in op.uses() + ((op.dst,) if op.dst is not None else ()):
+                    weights[name] = weights.get(name, 0) + weight
+                for name in self.TEMPLATE_CELLS.get(op.opcode, ()):
+                    weights[name] = weights.get(name, 0) + weight * LOOP_WEIGHT
+                if self.size_opt and op.opcode in self.ROUTINES:
+                    weights[self.SELECTOR] = weights.get(self.SELECTOR, 0) + weight
+            for name in block.terminator.uses():
+                weights[name] = weights.get(name, 0) + weight
+        return weights
+
+    def cell_names(self):
+        """Name of every allocated cell by address; pooled literals are '=value'"""
+        names = {address: name for name, address in self.memory_map.items()}
+        names.update((address, name) for name, address in zip(self.SCRATCH, self.scratch))
+        if self.selector_addr is not None:
+            names[self.selector_addr] = self.SELECTOR
+        for address, value in self.pool_cells.items():
+            names.setdefault(address, f"={value}")
+        return names
 
     def get_new_label(self):
         label = f"L{self.label_counter}"
@@ -38,153 +154,331 @@ class CodeGenerator:
         return label
 
     def emit(self, op, arg=None):
-        self.code.append(Instruction(op, arg))
+        # Reloading the cell that was just stored is a no-op unless a jump lands here
+        code = self.code
+        if (op == "LOAD" and code.ops and code.ops[-1] == STORE
+                and code.args[-1] == arg and len(code) not in self.label_positions):
+            return
+        if isinstance(arg, str):
+            self.label_refs[len(code)] = arg
+            code.append(op)
+        else:
+            code.append(op, arg)
+        self.origins.append(self.origin)
+        self._track_accumulator(op, arg)
 
     def emit_label(self, label):
         self.labels[label] = len(self.code)
+        self.label_positions.add(len(self.code))
+        # Control can arrive here from anywhere
+        self.acc = None
+
+    def _track_accumulator(self, op, arg):
+        """Follow the accumulator value through straight-line code"""
+        acc = self.acc
+        if op == "ZERO":
+            self.acc = 0
+        elif acc is None:
+            if op == "LOAD":
+                self.acc = self.pool_cells.get(arg)
+        elif op == "INC":
+            self.acc = acc + 1
+        elif op == "DEC":
+            self.acc = max(acc - 1, 0)
+        elif op == "SHL":
+            self.acc = acc * 2
+        elif op == "SHR":
+            self.acc = acc // 2
+        elif op == "LOAD":
+            self.acc = self.pool_cells.get(arg)
+        elif op in ("ADD", "SUB"):
+            operand = self.pool_cells.get(arg)
+            if operand is None:
+                self.acc = None
+            elif op == "ADD":
+                self.acc = acc + operand
+            else:
+                self.acc = max(acc - operand, 0)
 
     def backpatch(self):
         """Replace label references with actual instruction indices"""
-        for i, instr in enumerate(self.code):
-            if instr.op in ["JUMP", "JZ", "JG", "JODD"] and isinstance(instr.arg, str):
-                if instr.arg in self.labels:
-                    self.code[i] = Instruction(instr.op, self.labels[instr.arg])
-                else:
-                    raise ValueError(f"Undefined label: {instr.arg}")
+        args = self.code.args
+        for i, label in self.label_refs.items():
+            if label not in self.labels:
+                raise ValueError(f"Undefined label: {label}")
+            args[i] = self.labels[label]
+        self.label_refs = {}
+
+    def thread_jumps(self):
+        """Point every jump whose target is an unconditional JUMP at its final target"""
+        def final(label):
+            seen = set()
+            while label in self.labels and label not in seen:
+                seen.add(label)
+                index = self.labels[label]
+                if index >= len(self.code) or self.code.ops[index] != JUMP or index not in self.label_refs:
+                    break
+                label = self.label_refs[index]
+            return label
+
+        for i, label in self.label_refs.items():
+            self.label_refs[i] = final(label)
 
     def generate(self, ast):
-        # Initialize constants
-        for name, value in self.analyzer.const_table.items():
-            self.emit("ZERO")
-            # Generate code to set accumulator to constant value
-            self.generate_constant(value)
-            # Store the value to memory
-            self.emit("STORE", self.memory_map[name])
+        with self.stats.phase("codegen") as counts:
+            with self.stats.phase("ir") as ir_counts:
+                program = IRBuilder(self.analyzer).build(ast)
+                ir_counts["blocks"] = len(program.blocks)
+                ir_counts["ops"] = sum(len(block.ops) for block in program.blocks)
+            with self.stats.phase("optimize") as pass_counts:
+                self.ir = self.pass_manager.run(program)
+                pass_counts["passes"] = len(self.pass_manager.passes)
+            self.lower(program)
+            counts["instructions"] = len(self.code)
+        return self.code, self.memory_map
 
-        # Generate code for commands
-        self.generate_commands(ast.commands)
-
-        # End program
-        self.emit("HALT")
+    def lower(self, program):
+        """Emit machine code for an IR program, blocks in layout order"""
+        stats = self.stats
+        with stats.phase("allocate") as counts:
+            self.consts = program.consts
+            self.allocate_memory(program)
+            counts["cells"] = self.next_memory
+
+            # Literals used often enough in loops get a cell of their own
+            cell_cost = self.target.memory_cost(self.next_memory)
+            cells = [(self.memory_map[name], value) for name, value in program.consts.items()
+                     if name in self.memory_map]
+            held = {value for _, value in cells}
+            candidates = plan_pool(self.literal_uses(program), cell_cost, cell_cost, self.target)
+            pooled = [value for value in candidates if value not in held]
+            for value in pooled:
+                cells.append((self.next_memory, value))
+                self.next_memory += 1
+            counts["pooled"] = len(pooled)
+
+        # Initialize constant cells, each one derived from the previous where cheaper
+        memory_cost = self.target.memory_cost
+        with stats.phase("emit") as counts:
+            for address, value in cells:
+                self.generate_constant(value)
+                self.emit("STORE", address)
+                self.pool_cells[address] = value
+                if value not in self.pool or memory_cost(address) < memory_cost(self.pool[value]):
+                    self.pool[value] = address
+
+            # In size mode an operator used more than once becomes a shared routine
+            if self.size_opt:
+                uses = {}
+                for block in program.blocks:
+                    for op in block.ops:
+                        if op.opcode in self.ROUTINES:
+                            uses[op.opcode] = uses.get(op.opcode, 0) + 1
+                self.routine_sites = {opcode: [] for opcode, count in uses.items() if count > 1}
+
+            for i, block in enumerate(program.blocks):
+                next_label = program.blocks[i + 1].label if i + 1 < len(program.blocks) else None
+                start = len(self.code)
+                self.emit_label(block.label)
+                for op in block.ops:
+                    self.origin = op.origin
+                    self.op_sites.append((op.origin, len(self.code)))
+                    self.generate_op(op)
+                self.origin = getattr(block.terminator, "origin", None)
+                self.generate_terminator(block.terminator, next_label)
+                self.origin = None
+                self.block_ranges[block.label] = (start, len(self.code))
+            counts["instructions"] = len(self.code)
+
+        with stats.phase("routines") as counts:
+            self.generate_routines()
+            counts["routines"] = len(self.routine_ranges)
 
         # Fix label references
-        self.backpatch()
-
-        return self.code, self.memory_map
+        with stats.phase("thread_jumps"):
+            self.thread_jumps()
+        with stats.phase("backpatch") as counts:
+            self.backpatch()
+            counts["labels"] = len(self.labels)
+            counts["jumps"] = sum(op in JUMP_OPS for op in self.code.ops)
+
+        return self.code
+
+    def literal_uses(self, program):
+        """Map each literal value to the loop depths it is materialized at"""
+        nesting = block_loops(program)
+        uses = {}
+        for block in program.blocks:
+            for op in block.ops:
+                if op.opcode == 'const':
+                    uses.setdefault(op.value, []).append(len(nesting[block.label]))
+        return uses
 
     def generate_constant(self, value):
-        """Generate code to set accumulator to a constant value"""
-        # Special case for 0
-        if value == 0:
-            self.emit("ZERO")
-            return
-
-        # Use binary representation for efficient constant generation
-        binary = bin(value)[2:]  # Remove '0b' prefix
+        """Set the accumulator to a constant with the cheapest sequence.
 
-        self.emit("INC")  # Set accumulator to 1
-
-        for bit in binary[1:]:  # Skip the first bit (already set to 1)
-            self.emit("SHL")  # Double the value
-            if bit == '1':
-                self.emit("INC")  # Add 1 if bit is set
-
-    def generate_commands(self, commands):
-        for command in commands:
-            self.generate_command(command)
-
-    def generate_command(self, command):
-        from .parser import Assignment, IfElse, While, Read, Write
-
-        if isinstance(command, Assignment):
-            self.generate_expression(command.expr)
-            # Store result to the correctly allocated user variable address
-            self.emit("STORE", self.memory_map[command.name])
-
-        elif isinstance(command, IfElse):
-            end_label = self.get_new_label()
-            else_label = self.get_new_label()
-
-            # Generate condition code, jumping to else label if condition fails
-            self.generate_condition(command.condition, else_label)
-
-            # Generate then part commands
-            self.generate_commands(command.then_cmds)
-            self.emit("JUMP", end_label)
-
-            # Generate else part commands
-            self.emit_label(else_label)
-            self.generate_commands(command.else_cmds)
-
-            self.emit_label(end_label)
-
-        elif isinstance(command, While):
-            start_label = self.get_new_label()
-            end_label = self.get_new_label()
-
-            self.emit_label(start_label)
-
-            # Generate the condition, jumping to end label if false
-            self.generate_condition(command.condition, end_label)
-
-            # Generate loop body
-            self.generate_commands(command.commands)
-            self.emit("JUMP", start_label)
-
-            self.emit_label(end_label)
-
-        elif isinstance(command, Read):
+        Candidates are rebuilding it from its bits, loading it from a cell
+        that holds it, and deriving it from the current accumulator value.
+        """
+        target = self.target
+        best = build_sequence(value)
+        if value in self.pool:
+            load = [("LOAD", self.pool[value])]
+            if sequence_cost(load, target) < sequence_cost(best, target):
+                best = load
+        if self.acc is not None:
+            derived = derive_sequence(self.acc, value, sequence_cost(best, target), target)
+            if derived is not None:
+                best = derived
+
+        for op, arg in best:
+            self.emit(op, arg)
+
+    def load(self, name):
+        """Bring a symbol into the accumulator; CONSTs may be materialized instead"""
+        if name in self.consts:
+            self.generate_constant(self.consts[name])
+        else:
+            self.emit("LOAD", self.memory_map[name])
+
+    def generate_op(self, op):
+        if op.opcode == 'const':
+            self.generate_constant(op.value)
+            self.emit("STORE", self.memory_map[op.dst])
+
+        elif op.opcode == 'copy':
+            self.load(op.a)
+            self.emit("STORE", self.memory_map[op.dst])
+
+        elif op.opcode in BINARY_OPS:
+            if op.opcode == '+':
+                self.load(op.a)
+                self.emit("ADD", self.memory_map[op.b])
+            elif op.opcode == '-':
+                self.load(op.a)
+                self.emit("SUB", self.memory_map[op.b])
+            elif op.opcode in self.routine_sites:
+                self.call_routine(op.opcode, op.a, op.b)
+            else:
+                start = len(self.code)
+                if op.opcode == '*':
+                    self.optimize_multiplication(op.a, op.b)
+                elif op.opcode == '/':
+                    self.optimize_division(op.a, op.b)
+                elif op.opcode == '%':
+                    self.optimize_modulo(op.a, op.b)
+                self.template_sites.append((op.opcode, start, len(self.code), op.a, op.b))
+            self.emit("STORE", self.memory_map[op.dst])
+
+        elif op.opcode in ('inc', 'dec'):
+            self.load(op.a)
+            self.emit("INC" if op.opcode == 'inc' else "DEC")
+            self.emit("STORE", self.memory_map[op.dst])
+
+        elif op.opcode == 'read':
             # Read input into the variable's allocated address
-            self.emit("SCAN", self.memory_map[command.name])
+            self.emit("SCAN", self.memory_map[op.dst])
 
-        elif isinstance(command, Write):
+        elif op.opcode == 'write':
             # Write output from the variable's allocated address
-            self.emit("PRINT", self.memory_map[command.name])
+            self.emit("PRINT", self.memory_map[op.a])
+
+    def generate_terminator(self, terminator, next_label):
+        self.terminators[type(terminator)](terminator, next_label)
+
+    def generate_jump(self, terminator, next_label):
+        if terminator.target != next_label:
+            self.emit("JUMP", terminator.target)
+
+    def generate_branch(self, terminator, next_label):
+        a, relop, b = terminator.a, terminator.relop, terminator.b
+        start = len(self.code)
+        if terminator.false_target == next_label:
+            # Invert the test so the false edge falls through
+            self.generate_condition(a, relop, b, terminator.true_target, jump_if=True)
+        else:
+            self.generate_condition(a, relop, b, terminator.false_target)
+            if terminator.true_target != next_label:
+                self.emit("JUMP", terminator.true_target)
+        self.branch_sites.append((terminator.origin, start, len(self.code),
+                                  terminator.true_target, terminator.false_target))
+
+    def generate_halt(self, terminator, next_label):
+        self.emit("HALT")
 
-    def generate_expression(self, expr):
-        from .parser import Number, Identifier, BinOp
+    def call_routine(self, opcode, left, right):
+        """Call the shared routine for opcode and load its result.
 
-        if isinstance(expr, Number):
-            self.emit("ZERO")
-            self.generate_constant(expr.value)
-
-        elif isinstance(expr, Identifier):
-            self.emit("LOAD", self.memory_map[expr.name])
-
-        elif isinstance(expr, BinOp):
-            if expr.op == '+':
-                # For simplicity, use LOAD and ADD for addition
-                self.emit("LOAD", self.memory_map[expr.left.name])
-                self.emit("ADD", self.memory_map[expr.right.name])
-            elif expr.op == '-':
-                self.emit("LOAD", self.memory_map[expr.left.name])
-                self.emit("SUB", self.memory_map[expr.right.name])
-            elif expr.op == '*':
-                self.optimize_multiplication(expr.left.name, expr.right.name)
-            elif expr.op == '/':
-                self.optimize_division(expr.left.name, expr.right.name)
-            elif expr.op == '%':
-                self.optimize_modulo(expr.left.name, expr.right.name)
+        The ISA has no indirect jump, so the call site stores its index in
+        the return-selector cell and the routine dispatches on it.
+        """
+        sites = self.routine_sites[opcode]
+        return_label = self.get_new_label()
+
+        self.load_operands(left, right)
+        self.generate_constant(len(sites))
+        self.emit("STORE", self.selector_addr)
+        self.emit("JUMP", f"routine_{opcode}")
+        sites.append(return_label)
+
+        self.emit_label(return_label)
+        self.emit("LOAD", self.scratch[self.ROUTINES[opcode][1]])
+
+    def generate_routines(self):
+        """Emit each shared routine once, after the program's HALT"""
+        for opcode, return_labels in self.routine_sites.items():
+            body, _ = self.ROUTINES[opcode]
+            start = len(self.code)
+            self.emit_label(f"routine_{opcode}")
+            getattr(self, body)()
+            self.emit("LOAD", self.selector_addr)
+            self.generate_dispatch(list(enumerate(return_labels)))
+            self.routine_ranges[opcode] = (start, len(self.code))
+
+    def generate_dispatch(self, sites):
+        """Jump to the return label whose selector is in the accumulator.
+
+        A JODD/SHR decision tree tests one selector bit per level, so a return
+        costs one LOAD plus about two steps per bit of the call-site count.
+        """
+        if len(sites) == 1:
+            self.emit("JUMP", sites[0][1])
+            return
+
+        odd_label = self.get_new_label()
+        self.emit("JODD", odd_label)
+        self.emit("SHR")
+        self.generate_dispatch([(selector >> 1, label) for selector, label in sites if not selector & 1])
+        self.emit_label(odd_label)
+        self.emit("SHR")
+        self.generate_dispatch([(selector >> 1, label) for selector, label in sites if selector & 1])
+
+    def load_operands(self, left, right):
+        """Copy the operands of *, / and % into the first two scratch cells"""
+        self.load(left)
+        self.emit("STORE", self.scratch[1])
+        self.load(right)
+        self.emit("STORE", self.scratch[2])
 
     def optimize_multiplication(self, left, right):
         """Optimize multiplication using binary method (Russian peasant algorithm)
         with reserved temporary memory.
         """
+        self.load_operands(left, right)
+        self.multiplication_loop()
+        self.emit("LOAD", self.scratch[0])
+
+    def multiplication_loop(self):
+        """Multiply the operand cells, leaving the product in scratch cell 0"""
         # Use reserved temporary addresses
-        result_addr = self.temp_start       # Result storage
-        a_addr = self.temp_start + 1        # Multiplicand
-        b_addr = self.temp_start + 2        # Multiplier
+        result_addr = self.scratch[0]       # Result storage
+        a_addr = self.scratch[1]            # Multiplicand
+        b_addr = self.scratch[2]            # Multiplier
 
         # Initialize result to 0
         self.emit("ZERO")
         self.emit("STORE", result_addr)
 
-        # Load operands from their memory locations
-        self.emit("LOAD", self.memory_map[left])
-        self.emit("STORE", a_addr)
-        self.emit("LOAD", self.memory_map[right])
-        self.emit("STORE", b_addr)
-
         start_label = self.get_new_label()
         end_label = self.get_new_label()
         odd_label = self.get_new_label()
@@ -220,289 +514,188 @@ class CodeGenerator:
         # Jump back to loop start
         self.emit("JUMP", start_label)
 
-        # End loop and load the multiplication result
+        # End loop; the product is in result_addr
         self.emit_label(end_label)
-        self.emit("LOAD", result_addr)
 
     def optimize_division(self, left, right):
         """Optimize division using binary long division algorithm with
         reserved temporary memory.
         """
-        # Reserved addresses:
-        quotient_addr = self.temp_start       # quotient
-        remainder_addr = self.temp_start + 1    # remainder (dividend)
-        divisor_addr = self.temp_start + 2      # divisor
-        temp_addr = self.temp_start + 3         # temporary storage
-        count_addr = self.temp_start + 4        # shift counter
-
-        # Initialize quotient to 0
-        self.emit("ZERO")
-        self.emit("STORE", quotient_addr)
-
-        # Load dividend and divisor operands
-        self.emit("LOAD", self.memory_map[left])
-        self.emit("STORE", remainder_addr)
-        self.emit("LOAD", self.memory_map[right])
-        self.emit("STORE", divisor_addr)
-
-        # Check for division by zero
-        self.emit("LOAD", divisor_addr)
-        zero_div_label = self.get_new_label()
-        normal_div_label = self.get_new_label()
-        end_label = self.get_new_label()
-
-        self.emit("JZ", zero_div_label)
-        self.emit("JUMP", normal_div_label)
-
-        # Handle division by zero: return 0 in remainder
-        self.emit_label(zero_div_label)
-        self.emit("ZERO")
-        self.emit("STORE", remainder_addr)
-        self.emit("JUMP", end_label)
-
-        # Proceed with normal division
-        self.emit_label(normal_div_label)
-
-        # Initialize temporary count to 0
-        self.emit("ZERO")
-        self.emit("STORE", count_addr)
-
-        # Determine the number of left shifts needed for the divisor
-        shift_start_label = self.get_new_label()
-        shift_end_label = self.get_new_label()
-
-        self.emit_label(shift_start_label)
-        self.emit("LOAD", divisor_addr)
-        self.emit("SHL")
-        self.emit("STORE", temp_addr)
-
-        # If shifted divisor is exactly equal to remainder: stop shifting
-        self.emit("LOAD", remainder_addr)
-        self.emit("SUB", temp_addr)
-        self.emit("JZ", shift_end_label)
-
-        # Check if subtraction result is positive (greater than 0)
-        comp_label = self.get_new_label()
-        self.emit("LOAD", remainder_addr)
-        self.emit("SUB", temp_addr)
-        self.emit("JG", comp_label)
-        self.emit("JUMP", shift_end_label)
-
-        self.emit_label(comp_label)
-        self.emit("LOAD", temp_addr)
-        self.emit("STORE", divisor_addr)
-        self.emit("LOAD", count_addr)
-        self.emit("INC")
-        self.emit("STORE", count_addr)
-        self.emit("JUMP", shift_start_label)
-
-        # Division loop: perform subtraction and shift operations
-        self.emit_label(shift_end_label)
-        div_loop_label = self.get_new_label()
-        div_end_label = self.get_new_label()
-
-        self.emit_label(div_loop_label)
-        self.emit("LOAD", count_addr)
-        self.emit("JZ", div_end_label)
-
-        # Attempt subtraction: remainder - divisor
-        self.emit("LOAD", remainder_addr)
-        self.emit("SUB", divisor_addr)
-        sub_possible_label = self.get_new_label()
-        no_sub_label = self.get_new_label()
-
-        self.emit("JG", sub_possible_label)
-        self.emit("JUMP", no_sub_label)
-
-        # If subtraction is possible, update remainder and quotient (append 1)
-        self.emit_label(sub_possible_label)
-        self.emit("STORE", remainder_addr)
-        self.emit("LOAD", quotient_addr)
-        self.emit("SHL")
-        self.emit("INC")
-        self.emit("STORE", quotient_addr)
-        self.emit("JUMP", "shift_divisor_div")  # Jump to divisor shifting
-
-        # If subtraction is not possible, just update quotient (append 0)
-        self.emit_label(no_sub_label)
-        self.emit("LOAD", quotient_addr)
-        self.emit("SHL")
-        self.emit("STORE", quotient_addr)
-
-        # Label for shifting the divisor right
-        shift_divisor_label = self.get_new_label()
-        self.emit_label(shift_divisor_label)
-        self.emit("LOAD", divisor_addr)
-        self.emit("SHR")
-        self.emit("STORE", divisor_addr)
-
-        # Decrement counter and loop back
-        self.emit("LOAD", count_addr)
-        self.emit("DEC")
-        self.emit("STORE", count_addr)
-        self.emit("JUMP", div_loop_label)
-
-        self.emit_label(div_end_label)
-        self.emit_label(end_label)
+        self.load_operands(left, right)
+        self.division_loop()
         # Load the quotient as the result for division
-        self.emit("LOAD", quotient_addr)
+        self.emit("LOAD", self.scratch[0])
+
+    def division_loop(self):
+        """Divide the operand cells, leaving the quotient in scratch cell 0"""
+        # Reserved addresses:
+        quotient_addr = self.scratch[0]     # quotient, half the remainder before that
+        remainder_addr = self.scratch[1]    # remainder (dividend)
+        divisor_addr = self.scratch[2]      # divisor
+        limit_addr = self.scratch[3]        # divisor - 1
+        self.long_division(quotient_addr, remainder_addr, divisor_addr, limit_addr)
 
     def optimize_modulo(self, left, right):
         """Optimize modulo operation using the division algorithm and
         reserved temporary memory.
         """
-        # Reserved addresses (same as for division)
-        quotient_addr = self.temp_start       # quotient (unused for modulo)
-        remainder_addr = self.temp_start + 1    # remainder (result needed)
-        divisor_addr = self.temp_start + 2      # divisor
-        temp_addr = self.temp_start + 3         # temporary storage
-        count_addr = self.temp_start + 4        # shift counter
+        self.load_operands(left, right)
+        # The remainder is the final result and already in the accumulator
+        self.modulo_loop()
 
-        # Initialize quotient to 0 (though for modulo we only care about remainder)
-        self.emit("ZERO")
-        self.emit("STORE", quotient_addr)
-
-        # Load operands for the modulo operation
-        self.emit("LOAD", self.memory_map[left])
-        self.emit("STORE", remainder_addr)
-        self.emit("LOAD", self.memory_map[right])
-        self.emit("STORE", divisor_addr)
-
-        # Check for division by zero
-        self.emit("LOAD", divisor_addr)
-        zero_div_label = self.get_new_label()
-        normal_div_label = self.get_new_label()
+    def modulo_loop(self):
+        """Reduce the operand cells, leaving the remainder in scratch cell 1
+        and in the accumulator"""
+        # Reserved addresses (same as for division)
+        remainder_addr = self.scratch[1]    # remainder (result needed)
+        divisor_addr = self.scratch[2]      # divisor
+        limit_addr = self.scratch[3]        # divisor - 1
+        self.long_division(None, remainder_addr, divisor_addr, limit_addr)
+
+    def long_division(self, quotient_addr, remainder_addr, divisor_addr, limit_addr):
+        """Binary long division of the remainder cell by the divisor cell.
+
+        The remainder is kept as r + 1, so one saturating SUB compares and
+        subtracts at once: (r + 1) - d is 0 exactly when d > r and the next
+        biased remainder otherwise, equality included.  The divisor doubles
+        while it fits, then is halved once per quotient bit until it drops
+        below the original divisor, to at most the limit cell.  With k the
+        number of doublings, at most bits(a) - bits(b), the first loop takes
+        k trips and the second one k + 1, each with a single compare.
+
+        Division tests 2 * divisor <= r against r // 2 + 1, kept in the
+        quotient cell until the quotient starts.  Modulo has no cell to
+        spare in the fast tier: it doubles the divisor in the accumulator
+        and its first halving undoes the doubling that went too far.  The
+        remainder is left in its cell and in the accumulator.  Dividing by
+        zero gives 0 for both.
+        """
+        result_addr = quotient_addr if quotient_addr is not None else remainder_addr
+        nonzero_label = self.get_new_label()
         end_label = self.get_new_label()
-
-        self.emit("JZ", zero_div_label)
-        self.emit("JUMP", normal_div_label)
-
-        # For division-by-zero, modulo is defined as 0
-        self.emit_label(zero_div_label)
-        self.emit("ZERO")
-        self.emit("STORE", remainder_addr)
-        self.emit("JUMP", end_label)
-
-        # Proceed with normal modulo calculation (similar to division)
-        self.emit_label(normal_div_label)
-
-        # Initialize shift counter to 0
-        self.emit("ZERO")
-        self.emit("STORE", count_addr)
-
-        # Determine number of left shifts for the divisor
-        shift_start_label = self.get_new_label()
-        shift_end_label = self.get_new_label()
-
-        self.emit_label(shift_start_label)
         self.emit("LOAD", divisor_addr)
-        self.emit("SHL")
-        self.emit("STORE", temp_addr)
-
-        self.emit("LOAD", remainder_addr)
-        self.emit("SUB", temp_addr)
-        self.emit("JZ", shift_end_label)
+        self.emit("JG", nonzero_label)
+        self.emit("STORE", result_addr)
+        self.emit("JUMP", end_label)
 
-        comp_label = self.get_new_label()
+        self.emit_label(nonzero_label)
+        self.emit("DEC")
+        self.emit("STORE", limit_addr)
         self.emit("LOAD", remainder_addr)
-        self.emit("SUB", temp_addr)
-        self.emit("JG", comp_label)
-        self.emit("JUMP", shift_end_label)
-
-        self.emit_label(comp_label)
-        self.emit("LOAD", temp_addr)
-        self.emit("STORE", divisor_addr)
-        self.emit("LOAD", count_addr)
         self.emit("INC")
-        self.emit("STORE", count_addr)
-        self.emit("JUMP", shift_start_label)
-
-        # Modulo division loop
-        self.emit_label(shift_end_label)
-        div_loop_label = self.get_new_label()
-        div_end_label = self.get_new_label()
-
-        self.emit_label(div_loop_label)
-        self.emit("LOAD", count_addr)
-        self.emit("JZ", div_end_label)
+        self.emit("STORE", remainder_addr)
 
-        # Try to subtract divisor from remainder
+        grow_label = self.get_new_label()
+        bit_label = self.get_new_label()
+        halve_label = self.get_new_label()
+        if quotient_addr is not None:
+            # Double the divisor while it fits in the remainder twice
+            self.emit("INC")
+            self.emit("SHR")
+            self.emit("STORE", quotient_addr)
+            start_label = self.get_new_label()
+            self.emit_label(grow_label)
+            self.emit("LOAD", quotient_addr)
+            self.emit("SUB", divisor_addr)
+            self.emit("JZ", start_label)
+            self.emit("LOAD", divisor_addr)
+            self.emit("SHL")
+            self.emit("STORE", divisor_addr)
+            self.emit("JUMP", grow_label)
+            self.emit_label(start_label)
+            self.emit("ZERO")
+            self.emit("STORE", quotient_addr)
+        else:
+            # Double the divisor until it no longer fits
+            self.emit("LOAD", divisor_addr)
+            self.emit_label(grow_label)
+            self.emit("SHL")
+            self.emit("STORE", divisor_addr)
+            self.emit("LOAD", remainder_addr)
+            self.emit("SUB", divisor_addr)
+            self.emit("JZ", halve_label)
+            self.emit("LOAD", divisor_addr)
+            self.emit("JUMP", grow_label)
+
+        # One quotient bit per halving
+        self.emit_label(bit_label)
         self.emit("LOAD", remainder_addr)
         self.emit("SUB", divisor_addr)
-        sub_possible_label = self.get_new_label()
-        no_sub_label = self.get_new_label()
-
-        self.emit("JG", sub_possible_label)
-        self.emit("JUMP", no_sub_label)
-
-        # If subtraction is possible, update remainder
-        self.emit_label(sub_possible_label)
-        self.emit("STORE", remainder_addr)
-        # We do not update quotient for modulo
-
-        # In all cases, shift the divisor right
-        self.emit_label(no_sub_label)
+        if quotient_addr is not None:
+            zero_bit_label = self.get_new_label()
+            self.emit("JZ", zero_bit_label)
+            # divisor <= remainder: keep the difference and append a 1 bit
+            self.emit("STORE", remainder_addr)
+            self.emit("LOAD", quotient_addr)
+            self.emit("SHL")
+            self.emit("INC")
+            self.emit("STORE", quotient_addr)
+            self.emit("JUMP", halve_label)
+
+            # Otherwise append a 0 bit
+            self.emit_label(zero_bit_label)
+            self.emit("LOAD", quotient_addr)
+            self.emit("SHL")
+            self.emit("STORE", quotient_addr)
+        else:
+            self.emit("JZ", halve_label)
+            self.emit("STORE", remainder_addr)
+
+        self.emit_label(halve_label)
         self.emit("LOAD", divisor_addr)
         self.emit("SHR")
         self.emit("STORE", divisor_addr)
-
-        # Decrement the shift counter and repeat
-        self.emit("LOAD", count_addr)
-        self.emit("DEC")
-        self.emit("STORE", count_addr)
-        self.emit("JUMP", div_loop_label)
-
-        self.emit_label(div_end_label)
+        self.emit("SUB", limit_addr)
+        self.emit("JG", bit_label)
+
+        if quotient_addr is None:
+            # Remove the bias
+            self.emit("LOAD", remainder_addr)
+            self.emit("DEC")
+            self.emit("STORE", remainder_addr)
         self.emit_label(end_label)
-        # For modulo, the remainder is the final result
-        self.emit("LOAD", remainder_addr)
 
-    def generate_condition(self, condition, false_label):
-        """Generate code for conditional expressions.
+    def generate_condition(self, left, relop, right, target, jump_if=False):
+        """Generate code that jumps to target when `left relop right`
+        evaluates to jump_if and falls through otherwise.
 
-        This implementation subtracts the second operand from the first
-        and then uses conditional jumps.
+        SUB saturates at zero, so `a - b` is zero exactly when a <= b; the
+        other relations swap the operands or combine both differences.
+        Zero tests need no operand: JZ or JG on the value itself.
         """
-        left_name = condition.left.name
-        right_name = condition.right.name
-
-        # Load the left operand into the accumulator
-        self.emit("LOAD", self.memory_map[left_name])
-
-        if condition.op == '==':
-            # For a == b, subtract b; if zero then condition is true.
-            self.emit("SUB", self.memory_map[right_name])
-            self.emit("JZ", false_label)
-
-        elif condition.op == '!=':
-            # a != b: subtract b; if zero, then jump to a temporary label
-            self.emit("SUB", self.memory_map[right_name])
-            temp = self.get_new_label()
-            self.emit("JZ", temp)
-            self.emit("JUMP", false_label)
-            self.emit_label(temp)
-
-        elif condition.op == '<':
-            # For a < b, subtract b then adjust before comparing
-            self.emit("SUB", self.memory_map[right_name])
-            self.emit("INC")  # Adjust, so that a - b < 0 becomes <= 0
-            self.emit("JG", false_label)
-
-        elif condition.op == '>':
-            # For a > b, subtract b and jump if equal or greater (not >)
-            self.emit("SUB", self.memory_map[right_name])
-            self.emit("JZ", false_label)
-            self.emit("JG", false_label)
-
-        elif condition.op == '<=':
-            # For a <= b, subtract b and jump if result is positive (i.e., > 0)
-            self.emit("SUB", self.memory_map[right_name])
-            self.emit("JG", false_label)
-
-        elif condition.op == '>=':
-            # For a >= b, subtract b and jump if result is negative
-            self.emit("SUB", self.memory_map[right_name])
-            temp = self.get_new_label()
-            self.emit("JZ", temp)
-            self.emit("JG", false_label)
-            self.emit_label(temp)
+        if relop in ZERO_TESTS:
+            self.load(left)
+            self.emit("JZ" if (relop == 'zero') == jump_if else "JG", target)
+            return
+
+        if relop in ('<=', '>', '>=', '<'):
+            # a - b == 0 iff a <= b, and b - a == 0 iff a >= b
+            if relop in ('<=', '>'):
+                self.load(left)
+                self.emit("SUB", self.memory_map[right])
+            else:
+                self.load(right)
+                self.emit("SUB", self.memory_map[left])
+            zero_means = relop in ('<=', '>=')
+            self.emit("JZ" if zero_means == jump_if else "JG", target)
+            return
+
+        # a == b needs both differences zero; a != b needs either one positive
+        if (relop == '!=') == jump_if:
+            # Jump as soon as one difference is positive
+            self.load(left)
+            self.emit("SUB", self.memory_map[right])
+            self.emit("JG", target)
+            self.load(right)
+            self.emit("SUB", self.memory_map[left])
+            self.emit("JG", target)
+        else:
+            # Jump only when both differences are zero
+            skip_label = self.get_new_label()
+            self.load(left)
+            self.emit("SUB", self.memory_map[right])
+            self.emit("JG", skip_label)
+            self.load(right)
+            self.emit("SUB", self.memory_map[left])
+            self.emit("JZ", target)
+            self.emit_label(skip_label)
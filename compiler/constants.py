@@ -0,0 +1,97 @@
+"""Cost model for materializing constants in the accumulator.
+
+A constant can be rebuilt from its bits (ZERO, INC, then SHL/INC per bit),
+derived from a value already known to be in the accumulator, or loaded from
+a memory cell that holds it for the whole program (a CONST cell or a pooled
+literal).  Every candidate is a list of (op, arg) pairs; the cheapest on
+the target machine (target.Target) wins.
+"""
+
+from .target import DEFAULT
+
+LOOP_WEIGHT = 10   # Assumed iterations per loop level when weighing uses
+
+
+def sequence_cost(ops, target=DEFAULT):
+    return target.sequence_cost(ops)
+
+
+def build_sequence(value):
+    """ZERO/INC/SHL chain that sets the accumulator to value from scratch"""
+    ops = [("ZERO", None)]
+    if value == 0:
+        return ops
+
+    ops.append(("INC", None))
+    for bit in bin(value)[3:]:  # The leading bit is the INC above
+        ops.append(("SHL", None))
+        if bit == '1':
+            ops.append(("INC", None))
+    return ops
+
+
+def build_cost(value, target=DEFAULT):
+    costs = target.costs
+    if value == 0:
+        return costs["ZERO"]
+    ones = bin(value).count('1')
+    return costs["ZERO"] + ones * costs["INC"] + (value.bit_length() - 1) * costs["SHL"]
+
+
+def derive_sequence(known, value, limit, target=DEFAULT):
+    """Cheapest INC/DEC/SHL/SHR chain from a known accumulator value.
+
+    Returns None when every derivation costs at least `limit` steps.
+    """
+    if known == value:
+        return []
+
+    costs = target.costs
+    best = None
+
+    # Step up or down one at a time (DEC saturates at 0, which is fine here)
+    step = "INC" if value > known else "DEC"
+    distance = abs(value - known)
+    if distance * costs[step] < limit:
+        best = [(step, None)] * distance
+        limit = distance * costs[step]
+
+    # The known value is a binary prefix of the target: finish the bits
+    if 0 < known < value:
+        shift = value.bit_length() - known.bit_length()
+        if value >> shift == known:
+            tail = bin(value)[2:][known.bit_length():]
+            if shift * costs["SHL"] + tail.count('1') * costs["INC"] < limit:
+                best = []
+                for bit in tail:
+                    best.append(("SHL", None))
+                    if bit == '1':
+                        best.append(("INC", None))
+                limit = target.sequence_cost(best)
+
+    # The target is a binary prefix of the known value: shift the rest out
+    if 0 < value < known:
+        shift = known.bit_length() - value.bit_length()
+        if known >> shift == value and shift * costs["SHR"] < limit:
+            best = [("SHR", None)] * shift
+
+    return best
+
+
+def plan_pool(uses, load_cost, store_cost, target=DEFAULT):
+    """Pick the literal values worth keeping in a dedicated memory cell.
+
+    `uses` maps a value to the loop depths of the places that need it.
+    Each use is weighted by LOOP_WEIGHT ** depth; a value is pooled when the
+    weighted saving over rebuilding it beats the one-off cost of building
+    and storing it at program start.
+    """
+    pooled = []
+    for value, depths in uses.items():
+        rebuild = build_cost(value, target)
+        if rebuild <= load_cost:
+            continue
+        weight = sum(LOOP_WEIGHT ** depth for depth in depths)
+        if weight * (rebuild - load_cost) > rebuild + store_cost:
+            pooled.append(value)
+    return sorted(pooled)
@@ -0,0 +1,416 @@
+"""Static step-cost analysis of generated machine code.
+
+The code is split into basic blocks whose exact cost comes from the VM's
+cost table (target.Target).  Each natural loop is summarized
+as `trips x iteration + exit`: the cost range of one trip around the loop
+and of the final pass that leaves it, with nested loops and shared-routine
+calls kept as symbolic terms.  Loops of the arithmetic templates are
+bounded by the operand bit length n, which gives closed forms like
+`c + p*n` for every *, / and %.
+
+Nothing is executed; cost regressions show up by diffing the report.
+"""
+
+import json
+
+from .cfg import natural_loops
+from .target import DEFAULT
+
+JUMPS = ("JUMP", "JZ", "JG", "JODD")
+
+# Trip counts of a template's loops in address order.  Multiplication
+# halves the right operand until it is 0; long division doubles the
+# divisor k <= bits(a) - bits(b) times and then halves it back, one
+# quotient bit per trip around its bit loop.
+TEMPLATE_TRIPS = {
+    '*': ("bits({right})",),
+    '/': ("k({left},{right})", "k({left},{right})"),
+    '%': ("k({left},{right})", "k({left},{right})"),
+}
+
+
+class Cost:
+    """A cost range plus symbolic terms: min..max + sum(count x term)"""
+
+    def __init__(self, low=0, high=0, terms=None):
+        self.low = low
+        self.high = high
+        self.terms = dict(terms or {})
+
+    def plus(self, other):
+        terms = dict(self.terms)
+        for name, count in other.terms.items():
+            terms[name] = terms.get(name, 0) + count
+        return Cost(self.low + other.low, self.high + other.high, terms)
+
+    def join(self, other):
+        """Either path: the wider range and every term at its larger count"""
+        terms = dict(self.terms)
+        for name, count in other.terms.items():
+            terms[name] = max(terms.get(name, 0), count)
+        return Cost(min(self.low, other.low), max(self.high, other.high), terms)
+
+    def to_dict(self):
+        return {"min": self.low, "max": self.high, "terms": dict(sorted(self.terms.items()))}
+
+    def __str__(self):
+        text = str(self.low) if self.low == self.high else f"{self.low}..{self.high}"
+        for name, count in sorted(self.terms.items()):
+            text += f" + {name}" if count == 1 else f" + {count}*{name}"
+        return text
+
+
+class MachineBlock:
+    """Straight-line run of instructions [start, end)"""
+
+    def __init__(self, code, start, end, target=DEFAULT):
+        self.label = start
+        self.start = start
+        self.end = end
+        self.costs = [target.instruction_cost(instr.op, instr.arg) for instr in code[start:end]]
+        self.cost = sum(self.costs)
+        self.targets = []   # Successor addresses, inside the function or not
+        self.inside = []    # ... those inside it
+        self.call = None    # Routine opcode when the block ends in a call
+        self.function = None
+        self.loop = None    # Innermost loop
+
+    def successors(self):
+        return self.inside
+
+
+class MachineFunction:
+    """The blocks of an address range, shaped like an IRProgram for cfg.py"""
+
+    def __init__(self, name, start, end, blocks):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.blocks = blocks
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    def block_map(self):
+        return {block.label: block for block in self.blocks}
+
+
+def split_blocks(code, calls=(), cuts=(), target=DEFAULT):
+    """Basic blocks of a program, costed for a target machine.
+
+    calls maps routine opcodes to entry addresses; cuts are extra
+    addresses that must start a block, such as the ends of templates.
+    """
+    entries = {address: opcode for opcode, address in dict(calls).items()}
+    leaders = {0, *cuts}
+    for i, instr in enumerate(code):
+        if instr.op in JUMPS:
+            leaders.update((instr.arg, i + 1))
+        elif instr.op == "HALT":
+            leaders.add(i + 1)
+    leaders = sorted(address for address in leaders if address < len(code))
+
+    blocks = []
+    for start, end in zip(leaders, leaders[1:] + [len(code)]):
+        block = MachineBlock(code, start, end, target)
+        last = code[end - 1]
+        if last.op == "JUMP" and last.arg in entries:
+            # A call returns to the instruction after its JUMP
+            block.call = entries[last.arg]
+            block.targets = [end] if end < len(code) else []
+        elif last.op == "JUMP":
+            block.targets = [last.arg]
+        elif last.op in JUMPS:
+            block.targets = [last.arg] + ([end] if end < len(code) else [])
+        elif last.op != "HALT" and end < len(code):
+            block.targets = [end]
+        blocks.append(block)
+    return blocks
+
+
+class LoopCost:
+    def __init__(self, loop, name, trips):
+        self.loop = loop
+        self.name = name        # Symbol standing for the loop's total cost
+        self.trips = trips      # Symbol for the number of trips around it
+        self.iteration = None   # Cost of one trip back to the header
+        self.exit = None        # Cost of the pass from the header out of the loop
+
+    @property
+    def header(self):
+        return self.loop.header
+
+    def expression(self):
+        iteration = str(self.iteration) if self.iteration else "0"
+        exit_cost = str(self.exit) if self.exit else "0"
+        return f"{self.trips} * ({iteration}) + {exit_cost}"
+
+
+class CostReport:
+    """Costs of every block, loop, function and arithmetic template"""
+
+    def __init__(self, code, blocks, functions, loops, templates):
+        self.code = code
+        self.blocks = blocks
+        self.functions = functions    # name -> (MachineFunction, Cost)
+        self.loops = loops            # symbol -> LoopCost, outermost first
+        self.templates = templates
+
+    def bound(self, trips=None, bits=None):
+        """Upper bound on a run's steps given trip counts and operand bits.
+
+        trips maps loop trip symbols (e.g. 'n[3]') to the largest number of
+        trips; bits bounds every template operand.  Returns None when a
+        needed trip count is missing.
+        """
+        trips = dict(trips or {})
+        values = {}
+
+        def trip_count(symbol):
+            if symbol in trips:
+                return trips[symbol]
+            if bits is not None and symbol.startswith(("k(", "bits(")):
+                return bits
+            return None
+
+        def value(cost):
+            total = cost.high
+            for name, count in cost.terms.items():
+                term = evaluate(name)
+                if term is None:
+                    return None
+                total += count * term
+            return total
+
+        def evaluate(name):
+            if name not in values:
+                if name in self.loops:
+                    loop = self.loops[name]
+                    count, per_trip, leave = (trip_count(loop.trips), value(loop.iteration or Cost()),
+                                              value(loop.exit or Cost()))
+                    values[name] = (None if None in (count, per_trip, leave)
+                                    else count * per_trip + leave)
+                else:
+                    values[name] = value(self.functions[name][1])
+            return values[name]
+
+        return evaluate("main")
+
+    def to_dict(self):
+        return {
+            "instructions": len(self.code),
+            "functions": [{"name": name, "start": function.start, "end": function.end,
+                           "cost": cost.to_dict(), "expression": str(cost)}
+                          for name, (function, cost) in self.functions.items()],
+            "blocks": [{"start": block.start, "end": block.end, "cost": block.cost,
+                        "function": block.function, "loop": block.loop, "call": block.call}
+                       for block in self.blocks],
+            "loops": [{"name": name, "header": loop.header, "trips": loop.trips,
+                       "depth": loop.loop.depth, "blocks": sorted(loop.loop.blocks),
+                       "iteration": loop.iteration.to_dict() if loop.iteration else None,
+                       "exit": loop.exit.to_dict() if loop.exit else None,
+                       "expression": loop.expression()}
+                      for name, loop in self.loops.items()],
+            "templates": self.templates,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1)
+
+    def annotate(self):
+        """Assembly text with each instruction's cost and a header per block.
+
+        Annotations are ';' comments, so vm.parse_program still reads it.
+        """
+        lines = []
+        for name, (function, cost) in self.functions.items():
+            lines.append(f"; {name} [{function.start}, {function.end}): {cost} steps")
+        for name, loop in self.loops.items():
+            lines.append(f"; {name} = {loop.expression()}")
+        for template in self.templates:
+            left, right = template['operands'] or ("a", "b")
+            lines.append(f"; {left} {template['op']} {right} at [{template['start']}, {template['end']}): "
+                         f"<= {template['bound']} steps for n-bit operands")
+
+        for block in self.blocks:
+            loop = f", in {block.loop}" if block.loop else ""
+            call = f", calls routine {block.call}" if block.call else ""
+            lines.append(f"; block {block.start}: {block.cost} steps{loop}{call}")
+            for address in range(block.start, block.end):
+                instr = self.code[address]
+                text = f"{instr.op} {instr.arg}" if instr.arg is not None else instr.op
+                lines.append(f"{text:<16}; {address}: {block.costs[address - block.start]}")
+        return "\n".join(lines) + "\n"
+
+
+def _path_costs(function, region, loop_costs, children):
+    """Cost from a region's start to each way out of it.
+
+    The region is a loop (start at its header, 'back' when a trip returns
+    to it) or a whole function (start at its entry).  Child loops are
+    single nodes worth their symbol.  Returns {'back'|'exit': Cost}.
+    """
+    block_map = function.block_map()
+    header = region.header if region is not None else function.entry.label
+    blocks = region.blocks if region is not None else set(block_map)
+
+    def node_of(address):
+        if address not in blocks or address not in block_map:
+            return "exit"
+        if region is not None and address == header:
+            return "back"
+        for child in children:
+            if address in child.blocks:
+                return child
+        return address
+
+    def successors(node):
+        if isinstance(node, int):
+            return {node_of(target) for target in block_map[node].targets} or {"exit"}
+        outside = {target for label in node.blocks for target in block_map[label].targets
+                   if target not in node.blocks}
+        return {node_of(target) for target in outside} or {"exit"}
+
+    def own_cost(node):
+        if isinstance(node, int):
+            block = block_map[node]
+            terms = {f"call {block.call}": 1} if block.call else {}
+            return Cost(block.cost, block.cost, terms)
+        return Cost(0, 0, {loop_costs[node.header].name: 1})
+
+    # Postorder over the region's DAG (back edges end at 'back'); a
+    # function may start with a loop
+    start = header if region is not None else node_of(header)
+    order, seen, stack = [], set(), [(start, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+            continue
+        key = node if isinstance(node, int) else ("loop", node.header)
+        if key in seen:
+            continue
+        seen.add(key)
+        stack.append((node, True))
+        for succ in successors(node):
+            if succ not in ("back", "exit"):
+                stack.append((succ, False))
+
+    costs = {}
+    for node in order:
+        key = node if isinstance(node, int) else ("loop", node.header)
+        ways = {}
+        for succ in successors(node):
+            if succ in ("back", "exit"):
+                found = {succ: Cost()}
+            else:
+                found = costs[succ if isinstance(succ, int) else ("loop", succ.header)]
+            for sink, cost in found.items():
+                ways[sink] = ways[sink].join(cost) if sink in ways else cost
+        mine = own_cost(node)
+        costs[key] = {sink: mine.plus(cost) for sink, cost in ways.items()}
+    return costs[start if isinstance(start, int) else ("loop", start.header)]
+
+
+def analyze(code, generator=None):
+    """Analyze machine code; pass the CodeGenerator to name loops and templates.
+
+    Costs are those of the generator's target machine, or DEFAULT without one.
+    """
+    target = getattr(generator, "target", DEFAULT)
+    routine_ranges = dict(getattr(generator, "routine_ranges", {}) or {})
+    entries = {opcode: start for opcode, (start, _) in routine_ranges.items()}
+    sites = getattr(generator, "template_sites", [])
+    blocks = split_blocks(code, entries, [address for site in sites for address in site[1:3]], target)
+
+    ranges = [("main", 0, min([start for start, _ in routine_ranges.values()] + [len(code)]))]
+    ranges += [(f"call {opcode}", start, end) for opcode, (start, end) in sorted(routine_ranges.items(),
+                                                                                key=lambda item: item[1])]
+    origins = getattr(generator, "origins", None)
+    template_trips = {}
+    for opcode, start, end, left, right in sites:
+        template_trips[(start, end)] = [trip.format(left=left, right=right) for trip in TEMPLATE_TRIPS[opcode]]
+    for opcode, (start, end) in routine_ranges.items():
+        template_trips[(start, end)] = [trip.format(left="a", right="b") for trip in TEMPLATE_TRIPS[opcode]]
+
+    functions, loops = {}, {}
+    for name, start, end in ranges:
+        members = [block for block in blocks if start <= block.start < end]
+        if not members:
+            continue
+        for block in members:
+            block.function = name
+            block.inside = [target for target in block.targets if start <= target < end]
+        function = MachineFunction(name, start, end, members)
+        found = natural_loops(function)
+
+        # Name every loop and its trip count
+        for loop in sorted(found, key=lambda loop: loop.header):
+            trips = None
+            for (first, last), symbols in template_trips.items():
+                if all(first <= label < last for label in loop.blocks):
+                    inside = sorted(other.header for other in found
+                                    if all(first <= label < last for label in other.blocks))
+                    trips = symbols[min(inside.index(loop.header), len(symbols) - 1)]
+            if trips is None:
+                trips = _source_trips(function, loop, found, code, origins)
+            loops[f"L{loop.header}"] = LoopCost(loop, f"L{loop.header}", trips)
+        by_header = {cost.header: cost for cost in loops.values() if cost.loop in found}
+        block_map = function.block_map()
+        for loop in found:  # Outermost first, so inner loops win
+            for label in loop.blocks:
+                block_map[label].loop = by_header[loop.header].name
+
+        # Innermost loops first so their symbols exist for their parents
+        for loop in sorted(found, key=lambda loop: -loop.depth):
+            children = [other for other in found if other.parent is loop]
+            paths = _path_costs(function, loop, by_header, children)
+            cost = by_header[loop.header]
+            cost.iteration = paths.get("back")
+            cost.exit = paths.get("exit")
+        top = [loop for loop in found if loop.parent is None]
+        functions[name] = (function, _path_costs(function, None, by_header, top).get("exit", Cost()))
+
+    loops = dict(sorted(loops.items(), key=lambda item: (item[1].loop.depth, item[1].header)))
+    templates = _template_bounds(code, generator, loops, functions)
+    return CostReport(code, blocks, functions, loops, templates)
+
+
+def _source_trips(function, loop, found, code, origins):
+    """Trip symbol of a source WHILE: n[path] after the command it came from"""
+    if origins:
+        block_map = function.block_map()
+        nested = {label for other in found if other.parent is loop for label in other.blocks}
+        for label in [loop.header] + sorted(loop.blocks - nested):
+            block = block_map[label]
+            origin = origins[block.end - 1]
+            if origin is not None and code[block.end - 1].op in JUMPS:
+                return f"n[{origin}]"
+    return f"n{loop.header}"
+
+
+def _template_bounds(code, generator, loops, functions):
+    """Closed-form upper bound c + p*n of every template, n the operand bit length"""
+    if generator is None:
+        return []
+    sites = [(opcode, start, end, [left, right])
+             for opcode, start, end, left, right in generator.template_sites]
+    sites += [(opcode, start, end, None) for opcode, (start, end) in generator.routine_ranges.items()]
+
+    templates = []
+    for opcode, start, end, operands in sorted(sites, key=lambda site: site[1]):
+        inner = [loop for loop in loops.values() if all(start <= label < end for label in loop.loop.blocks)]
+        in_loops = {address for loop in inner for address in loop.loop.blocks}
+        blocks = [block for block in functions["main" if operands else f"call {opcode}"][0].blocks
+                  if block.start not in in_loops]
+        constant = sum(cost for block in blocks
+                       for address, cost in zip(range(block.start, block.end), block.costs)
+                       if start <= address < end)
+        constant += sum(loop.exit.high for loop in inner if loop.exit)
+        per_bit = sum(loop.iteration.high for loop in inner if loop.iteration)
+        templates.append({"op": opcode, "start": start, "end": end, "operands": operands,
+                          "loops": [loop.name for loop in inner],
+                          "constant": constant, "per_bit": per_bit,
+                          "bound": f"{constant} + {per_bit}*n"})
+    return templates
@@ -0,0 +1,210 @@
+"""Incremental recompilation from cached per-command fragments.
+
+Each top-level command is compiled on its own into a relocatable
+fragment: jump targets are offsets into the fragment (its length meaning
+"the next fragment") and memory arguments are symbol names.  Symbols get
+a stable allocation: constants, variables and scratch cells in
+declaration order, then temporaries as fragments introduce them.  The
+declarations fix every address a fragment's code choices depend on, so
+fragments are cached by the structure of the command's subtree and
+the cache is dropped when the declarations change.  After an edit only
+the changed commands are compiled again; linking lays the fragments out
+after the constant prologue and resolves their symbols and jumps, and a
+fragment keeps its resolved code while its base address stays the same.
+
+Optimizations that cross command boundaries are given up in exchange:
+CSE and accumulator tracking stop at each fragment, literals are not
+pooled, and -Os routines and profiles are not supported.  The linked
+program computes the same output as CodeGenerator.generate.
+
+    compiler = IncrementalCompiler(opt_level=1)
+    program = compiler.compile(ast, analyzer)    # compiles everything
+    program = compiler.compile(edited, analyzer)  # compiles what changed
+"""
+
+from .codegen import CodeGenerator
+from .machine import Code
+from .optimizer import DeadCodeElimination
+from .parser import Program
+from .pgo import JUMPS, MEMORY_OPS
+from .visitor import Visitor
+
+
+class CommandKeys(Visitor):
+    """Hashable structure of a command subtree; layout and comments do not change it.
+
+    Every top-level command is keyed on every build, so this is written
+    out per node type rather than walking the fields like pgo.fingerprint.
+    Expressions are keyed with the name they are assigned to.
+    """
+
+    prefix = "key_"
+
+    def body(self, commands):
+        return tuple(map(self.visit, commands))
+
+    def key_assignment(self, command):
+        return self.visit(command.expr, command.name)
+
+    def key_number(self, expr, dst):
+        return ("set", dst, expr.value)
+
+    def key_identifier(self, expr, dst):
+        return ("copy", dst, expr.name)
+
+    def key_binop(self, expr, dst):
+        return (expr.op, dst, expr.left.name, expr.right.name)
+
+    def key_if(self, command):
+        condition = command.condition
+        return ("if", condition.left.name, condition.op, condition.right.name,
+                self.body(command.then_cmds), self.body(command.else_cmds))
+
+    def key_while(self, command):
+        condition = command.condition
+        return ("while", condition.left.name, condition.op, condition.right.name, self.body(command.commands))
+
+    def key_for(self, command):
+        return ("downto" if command.downto else "for", command.iterator,
+                self.visit(command.start, None), self.visit(command.end, None), self.body(command.commands))
+
+    def key_read(self, command):
+        return ("read", command.name)
+
+    def key_write(self, command):
+        return ("write", command.name)
+
+    def generic_visit(self, node, *args):
+        raise ValueError(f"Unknown command {node!r}")
+
+
+command_key = CommandKeys().visit
+
+
+class Fragment:
+    """Relocatable code of one command.
+
+    code holds (op, arg) pairs: jump arguments are offsets into the
+    fragment and memory arguments symbol names.
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self.jumps = [i for i, (op, _) in enumerate(code) if op in JUMPS]
+        self.resolved = None  # (base, Code)
+
+    def __len__(self):
+        return len(self.code)
+
+    def link(self, base, addresses):
+        """Code of the fragment placed at base"""
+        if self.resolved is not None:
+            # Moving the fragment only moves its jump targets
+            old_base, code = self.resolved
+            if old_base != base:
+                code = code[:]
+                for i in self.jumps:
+                    code.args[i] += base - old_base
+                self.resolved = (base, code)
+            return code
+
+        code = Code()
+        for op, arg in self.code:
+            if op in JUMPS:
+                arg = base + arg
+            elif op in MEMORY_OPS:
+                arg = addresses[arg]
+            code.append(op, arg)
+        self.resolved = (base, code)
+        return code
+
+
+class FragmentGenerator(CodeGenerator):
+    """CodeGenerator that allocates from a shared symbol table and pools no literals"""
+
+    def __init__(self, semantic_analyzer, opt_level, addresses, target=None):
+        super().__init__(semantic_analyzer, opt_level=opt_level, target=target)
+        # Values a fragment leaves behind are read by the fragments after it
+        self.pass_manager.passes = [ir_pass for ir_pass in self.pass_manager.passes
+                                    if not isinstance(ir_pass, DeadCodeElimination)]
+        self.addresses = addresses
+
+    def allocate_memory(self, program):
+        names = list(program.consts) + list(program.variables) + list(self.SCRATCH)
+        for name in names:
+            self.addresses.setdefault(name, len(self.addresses))
+        self.memory_map.update((name, self.addresses[name]) for name in names[:-len(self.SCRATCH)])
+        self.scratch = [self.addresses[name] for name in self.SCRATCH]
+        self.selector_addr = None
+        self.next_memory = len(self.addresses)
+
+    def literal_uses(self, program):
+        # A pooled literal's cell is set in the prologue, which fragments drop
+        return {}
+
+    def fragment(self, ast):
+        """Compile a program and return the relocatable code after its prologue"""
+        code, _ = self.generate(ast)
+        start = min(first for first, _ in self.block_ranges.values())
+        names = {address: name for name, address in self.addresses.items()}
+
+        body = code[start:]
+        if body and body[-1].op == "HALT":
+            body = body[:-1]  # Falling off the end reaches the next fragment
+        relocatable = []
+        for instr in body:
+            if instr.op == "HALT":
+                relocatable.append(("JUMP", len(body)))
+            elif instr.op in JUMPS:
+                relocatable.append((instr.op, instr.arg - start))
+            elif instr.op in MEMORY_OPS:
+                relocatable.append((instr.op, names[instr.arg]))
+            else:
+                relocatable.append((instr.op, instr.arg))
+        return Fragment(relocatable)
+
+
+class IncrementalCompiler:
+    """Compile programs, reusing the fragments of unchanged top-level commands"""
+
+    def __init__(self, opt_level=1, target=None):
+        if opt_level not in (0, 1):
+            raise ValueError(f"Incremental compilation supports -O0 and -O1, not -O{opt_level}")
+        self.opt_level = opt_level
+        self.target = target  # target.Target the fragments are compiled for
+        self.declarations = None
+        self.addresses = {}  # Symbol -> cell, shared by every fragment
+        self.prologue = Code()
+        self.fragments = {}  # Cache key -> Fragment, for the latest build
+        self.stats = {}
+
+    def compile(self, ast, analyzer):
+        """Return the linked program as a Code"""
+        declarations = (tuple(analyzer.const_table.items()), tuple(analyzer.var_table))
+        if declarations != self.declarations:
+            # Declarations fix the allocation; new ones start from scratch
+            self.declarations = declarations
+            self.addresses = {}
+            self.fragments = {}
+            generator = FragmentGenerator(analyzer, self.opt_level, self.addresses, self.target)
+            code, _ = generator.generate(Program(ast.const_decls, ast.var_decls, []))
+            self.prologue = code[:-1]  # Everything but the HALT
+
+        fragments, reused = {}, 0
+        program = self.prologue[:]
+        for command in ast.commands:
+            key = command_key(command)
+            fragment = fragments.get(key, self.fragments.get(key))
+            if fragment is None:
+                generator = FragmentGenerator(analyzer, self.opt_level, self.addresses, self.target)
+                fragment = generator.fragment(Program(ast.const_decls, ast.var_decls, [command]))
+            else:
+                reused += 1
+            fragments[key] = fragment
+            program.extend(fragment.link(len(program), self.addresses))
+        program.append("HALT")
+
+        self.fragments = fragments
+        self.stats = {"commands": len(ast.commands), "reused": reused,
+                      "compiled": len(ast.commands) - reused}
+        return program
@@ -0,0 +1,141 @@
+"""Reference interpreter over the statement AST.
+
+Runs a parsed program directly with Python integers, following the
+language semantics the machine implements: values are natural numbers,
+`a - b` saturates at 0, and division or modulo by 0 gives 0.  Variables
+start at 0 like the machine's memory.  It is the oracle the differential
+fuzzer (tests/fuzz.py) compares compiled code against.
+"""
+
+from .visitor import Visitor
+
+
+class InterpreterError(Exception):
+    pass
+
+
+class LimitExceeded(InterpreterError):
+    """The program ran longer or grew values larger than the caller allowed"""
+
+
+def _sub(a, b):
+    return a - b if a > b else 0
+
+
+def _div(a, b):
+    return a // b if b else 0
+
+
+def _mod(a, b):
+    return a % b if b else 0
+
+
+OPERATORS = {
+    '+': lambda a, b: a + b,
+    '-': _sub,
+    '*': lambda a, b: a * b,
+    '/': _div,
+    '%': _mod,
+}
+
+RELATIONS = {
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '>': lambda a, b: a > b,
+    '<=': lambda a, b: a <= b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+class Interpreter(Visitor):
+    """Execute a Program AST.
+
+    max_steps bounds the number of commands and condition tests executed,
+    max_bits the size of any value; exceeding either raises LimitExceeded.
+    """
+
+    prefix = "exec_"
+
+    def __init__(self, ast, input_data=None, max_steps=None, max_bits=None):
+        super().__init__()
+        self.ast = ast
+        self.input_data = list(input_data or [])
+        self.input_pos = 0
+        self.output = []
+        self.max_steps = max_steps
+        self.max_bits = max_bits
+        self.steps = 0
+
+        self.values = {decl.name: decl.value for decl in ast.const_decls}
+        self.values.update((decl.name, 0) for decl in ast.var_decls)
+
+    def run(self):
+        self.exec_commands(self.ast.commands)
+        return {"output": self.output, "steps": self.steps}
+
+    def tick(self):
+        self.steps += 1
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise LimitExceeded(f"Step limit of {self.max_steps} exceeded")
+
+    def exec_commands(self, commands):
+        for command in commands:
+            self.tick()
+            self.dispatch[type(command)](command)
+
+    def generic_visit(self, node, *args):
+        raise InterpreterError(f"Unsupported node {node!r}")
+
+    def exec_number(self, expr):
+        return expr.value
+
+    def exec_identifier(self, expr):
+        return self.values[expr.name]
+
+    def exec_binop(self, expr):
+        return OPERATORS[expr.op](self.values[expr.left.name], self.values[expr.right.name])
+
+    def exec_assignment(self, command):
+        value = self.dispatch[type(command.expr)](command.expr)
+        if self.max_bits is not None and value.bit_length() > self.max_bits:
+            raise LimitExceeded(f"Value of {command.name} exceeds {self.max_bits} bits")
+        self.values[command.name] = value
+
+    def test(self, condition):
+        return RELATIONS[condition.op](self.values[condition.left.name], self.values[condition.right.name])
+
+    def exec_if(self, command):
+        self.exec_commands(command.then_cmds if self.test(command.condition) else command.else_cmds)
+
+    def exec_while(self, command):
+        while self.test(command.condition):
+            self.tick()
+            self.exec_commands(command.commands)
+
+    def exec_for(self, command):
+        # Both bounds are read once, before the first iteration
+        start, end = self.visit(command.start), self.visit(command.end)
+        values = range(start, end - 1, -1) if command.downto else range(start, end + 1)
+        for value in values:
+            self.tick()
+            self.values[command.iterator] = value
+            self.exec_commands(command.commands)
+        self.values.pop(command.iterator, None)
+
+    def exec_read(self, command):
+        if self.input_pos >= len(self.input_data):
+            raise InterpreterError(f"READ {command.name}: input exhausted")
+        value = self.input_data[self.input_pos]
+        self.input_pos += 1
+        if self.max_bits is not None and value.bit_length() > self.max_bits:
+            raise LimitExceeded(f"Input for {command.name} exceeds {self.max_bits} bits")
+        self.values[command.name] = value
+
+    def exec_write(self, command):
+        self.output.append(self.values[command.name])
+
+
+def interpret(ast, input_data=None, **limits):
+    """Run a program and return its output values"""
+    return Interpreter(ast, input_data, **limits).run()["output"]
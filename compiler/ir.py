@@ -0,0 +1,398 @@
+"""Three-address intermediate representation.
+
+A program is a list of basic blocks in layout order.  Each block holds
+straight-line ops and ends in exactly one terminator (Jump, Branch or
+Halt).  Operands are symbol names: CONST names, variables and temporaries
+introduced by passes.  Memory addresses are only assigned when the code
+generator lowers the IR.
+
+Ops and branches carry an `origin`: the path of the source command they
+came from ("2" is the third top-level command, "2.b0" the first command
+of its WHILE or FOR body, "2.t1"/"2.e0" lead into IF branches; a FOR's
+setup is "2.f" and its step to the next iteration "2.n").  Passes keep the
+origin of the op they rewrite, so lowered code can be mapped back to the
+source for profiling.
+"""
+
+from .parser import Number, Identifier
+from .visitor import Visitor
+
+BINARY_OPS = ('+', '-', '*', '/', '%')
+UNARY_OPS = ('inc', 'dec')
+RELOPS = ('==', '!=', '<', '>', '<=', '>=')
+ZERO_TESTS = ('zero', 'nonzero')  # Branches on one symbol, b is None
+
+
+class IRError(Exception):
+    pass
+
+
+class Op:
+    """A three-address operation.
+
+    opcode is one of:
+      'const'               dst := value
+      'copy'                dst := a
+      '+' '-' '*' '/' '%'   dst := a op b
+      'inc' 'dec'           dst := a + 1, dst := a - 1 (saturating)
+      'read'                READ dst
+      'write'               WRITE a
+    """
+
+    def __init__(self, opcode, dst=None, a=None, b=None, value=None, origin=None):
+        self.opcode = opcode
+        self.dst = dst
+        self.a = a
+        self.b = b
+        self.value = value
+        self.origin = origin
+
+    def uses(self):
+        if self.opcode in BINARY_OPS:
+            return (self.a, self.b)
+        if self.opcode in ('copy', 'write') + UNARY_OPS:
+            return (self.a,)
+        return ()
+
+    def __str__(self):
+        if self.opcode == 'const':
+            return f"{self.dst} := {self.value}"
+        if self.opcode == 'copy':
+            return f"{self.dst} := {self.a}"
+        if self.opcode == 'read':
+            return f"READ {self.dst}"
+        if self.opcode == 'write':
+            return f"WRITE {self.a}"
+        if self.opcode in UNARY_OPS:
+            return f"{self.dst} := {self.a} {'+' if self.opcode == 'inc' else '-'} 1"
+        return f"{self.dst} := {self.a} {self.opcode} {self.b}"
+
+
+class Jump:
+    def __init__(self, target):
+        self.target = target
+
+    def targets(self):
+        return [self.target]
+
+    def uses(self):
+        return ()
+
+    def __str__(self):
+        return f"JUMP {self.target}"
+
+
+class Branch:
+    """IF a relop b GOTO true_target ELSE false_target.
+
+    With a zero test as relop ('zero' or 'nonzero') only a is tested.
+    """
+
+    def __init__(self, a, relop, b, true_target, false_target, origin=None):
+        self.a = a
+        self.relop = relop
+        self.b = b
+        self.true_target = true_target
+        self.false_target = false_target
+        self.origin = origin
+
+    def targets(self):
+        return [self.true_target, self.false_target]
+
+    def uses(self):
+        return (self.a,) if self.relop in ZERO_TESTS else (self.a, self.b)
+
+    def __str__(self):
+        if self.relop in ZERO_TESTS:
+            test = f"{self.a} {'==' if self.relop == 'zero' else '>'} 0"
+        else:
+            test = f"{self.a} {self.relop} {self.b}"
+        return f"IF {test} THEN {self.true_target} ELSE {self.false_target}"
+
+
+class Halt:
+    def targets(self):
+        return []
+
+    def uses(self):
+        return ()
+
+    def __str__(self):
+        return "HALT"
+
+
+class BasicBlock:
+    def __init__(self, label):
+        self.label = label
+        self.ops = []
+        self.terminator = None
+
+    def successors(self):
+        return self.terminator.targets() if self.terminator else []
+
+    def __repr__(self):
+        return self.label
+
+
+class IRProgram:
+    def __init__(self, consts, variables):
+        self.consts = dict(consts)        # name -> value
+        self.variables = list(variables)  # user variables, then temporaries
+        self.blocks = []                  # layout order; blocks[0] is the entry
+        self.next_block = 0
+        self.next_temp = 0
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    def new_block(self):
+        block = BasicBlock(f"B{self.next_block}")
+        self.next_block += 1
+        self.blocks.append(block)
+        return block
+
+    def new_temp(self):
+        """Declare a temporary; the '$' prefix keeps it out of reach of user identifiers"""
+        name = f"${self.next_temp}"
+        self.next_temp += 1
+        self.variables.append(name)
+        return name
+
+    def block_map(self):
+        return {block.label: block for block in self.blocks}
+
+    def instruction_count(self):
+        return sum(len(block.ops) + 1 for block in self.blocks)
+
+    def verify(self):
+        """Check the structural invariants every pass must preserve"""
+        labels = self.block_map()
+        if len(labels) != len(self.blocks):
+            raise IRError("Duplicate block labels")
+        if not self.blocks:
+            raise IRError("Program has no blocks")
+
+        symbols = set(self.consts) | set(self.variables)
+        if len(set(self.variables)) != len(self.variables) or set(self.consts) & set(self.variables):
+            raise IRError("Symbol declared twice")
+
+        for block in self.blocks:
+            if not isinstance(block.terminator, (Jump, Branch, Halt)):
+                raise IRError(f"Block {block.label} has no terminator")
+            for target in block.terminator.targets():
+                if target not in labels:
+                    raise IRError(f"Block {block.label} jumps to unknown block {target}")
+            if isinstance(block.terminator, Branch) and block.terminator.relop not in RELOPS + ZERO_TESTS:
+                raise IRError(f"Block {block.label} has unknown relation {block.terminator.relop}")
+
+            for op in block.ops:
+                if op.opcode not in BINARY_OPS + UNARY_OPS + ('const', 'copy', 'read', 'write'):
+                    raise IRError(f"Unknown opcode '{op.opcode}' in {block.label}")
+                if op.opcode == 'const' and not (isinstance(op.value, int) and op.value >= 0):
+                    raise IRError(f"Bad constant in {block.label}: {op}")
+                if op.opcode == 'write':
+                    if op.dst is not None:
+                        raise IRError(f"WRITE with a destination in {block.label}: {op}")
+                elif op.dst not in self.variables:
+                    raise IRError(f"Assignment to non-variable in {block.label}: {op}")
+                for name in op.uses():
+                    if name not in symbols:
+                        raise IRError(f"Use of undeclared symbol '{name}' in {block.label}")
+            for name in block.terminator.uses():
+                if name not in symbols:
+                    raise IRError(f"Use of undeclared symbol '{name}' in {block.label}")
+
+    def __str__(self):
+        lines = []
+        for block in self.blocks:
+            lines.append(f"{block.label}:")
+            lines.extend(f"    {op}" for op in block.ops)
+            lines.append(f"    {block.terminator}")
+        return "\n".join(lines)
+
+
+class Mentions(Visitor):
+    """Whether a node reads a name, nested bodies included"""
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+    def any(self, commands):
+        return any(self.visit(command) for command in commands)
+
+    def visit_assignment(self, command):
+        return self.visit(command.expr)
+
+    def visit_if(self, command):
+        return self.visit(command.condition) or self.any(command.then_cmds) or self.any(command.else_cmds)
+
+    def visit_while(self, command):
+        return self.visit(command.condition) or self.any(command.commands)
+
+    def visit_for(self, command):
+        return self.visit(command.start) or self.visit(command.end) or self.any(command.commands)
+
+    def visit_read(self, command):
+        return False
+
+    def visit_write(self, command):
+        return command.name == self.name
+
+    def visit_number(self, expr):
+        return False
+
+    def visit_identifier(self, expr):
+        return expr.name == self.name
+
+    def visit_binop(self, expr):
+        return self.visit(expr.left) or self.visit(expr.right)
+
+    visit_condition = visit_binop
+
+
+def mentions(commands, name):
+    """Whether any command reads name, nested bodies included"""
+    return Mentions(name).any(commands)
+
+
+class IRBuilder(Visitor):
+    """Lower the statement AST into three-address IR"""
+
+    def __init__(self, semantic_analyzer):
+        super().__init__()
+        self.analyzer = semantic_analyzer
+
+    def build(self, ast):
+        # FOR iterators are variables of their own once lowered
+        program = IRProgram(self.analyzer.const_table, list(self.analyzer.var_table) + self.analyzer.iterators)
+        self.program = program
+        end = self.build_commands(ast.commands, program.new_block(), "")
+        end.terminator = Halt()
+        return program
+
+    def build_commands(self, commands, current, prefix):
+        """Append commands to the current block; return the block control ends in"""
+        dispatch = self.dispatch
+        for i, command in enumerate(commands):
+            current = dispatch[type(command)](command, current, f"{prefix}{i}")
+        return current
+
+    def build_command(self, command, current, path):
+        return self.dispatch[type(command)](command, current, path)
+
+    def visit_assignment(self, command, current, path):
+        op = self.build_expression(command.name, command.expr)
+        op.origin = path
+        current.ops.append(op)
+        return current
+
+    def visit_if(self, command, current, path):
+        program = self.program
+        then_block = program.new_block()
+        then_end = self.build_commands(command.then_cmds, then_block, f"{path}.t")
+        else_block = program.new_block()
+        else_end = self.build_commands(command.else_cmds, else_block, f"{path}.e")
+        current.terminator = self.build_branch(command.condition, then_block, else_block, path)
+
+        current = program.new_block()
+        then_end.terminator = Jump(current.label)
+        else_end.terminator = Jump(current.label)
+        return current
+
+    def visit_while(self, command, current, path):
+        program = self.program
+        header = program.new_block()
+        body = program.new_block()
+        current.terminator = Jump(header.label)
+
+        body_end = self.build_commands(command.commands, body, f"{path}.b")
+        body_end.terminator = Jump(header.label)
+
+        current = program.new_block()
+        header.terminator = self.build_branch(command.condition, body, current, path)
+        return current
+
+    def visit_read(self, command, current, path):
+        current.ops.append(Op('read', dst=command.name, origin=path))
+        return current
+
+    def visit_write(self, command, current, path):
+        current.ops.append(Op('write', a=command.name, origin=path))
+        return current
+
+    def visit_for(self, command, current, path):
+        """Lower a FOR loop onto a hidden trip counter.
+
+        The counter is set to the number of iterations on entry, so the
+        test is a zero check and each iteration a DEC.  This relies on the
+        iterator being read-only in the body: the trip count is fixed when
+        the loop starts, like the bounds.
+        """
+        program = self.program
+        iterator, start, end = command.iterator, command.start, command.end
+        counter = program.new_temp()
+        setup = f"{path}.f"
+
+        # Iterations: end - start + 1 (start - end + 1 downwards), 0 if the
+        # range is empty; `(last + 1) - first` saturates to exactly that
+        current.ops.append(self.build_expression(iterator, start))
+        current.ops[-1].origin = setup
+        if isinstance(start, Number) and isinstance(end, Number):
+            low, high = (end.value, start.value) if command.downto else (start.value, end.value)
+            current.ops.append(Op('const', dst=counter, value=max(high - low + 1, 0), origin=setup))
+        elif command.downto:
+            current.ops.append(Op('inc', dst=counter, a=iterator, origin=setup))
+            if not (isinstance(end, Number) and end.value == 0):
+                current.ops.append(Op('-', dst=counter, a=counter, b=self.symbol(end, current, setup),
+                                      origin=setup))
+        else:
+            if isinstance(end, Number):
+                current.ops.append(Op('const', dst=counter, value=end.value + 1, origin=setup))
+            else:
+                current.ops.append(Op('inc', dst=counter, a=end.name, origin=setup))
+            current.ops.append(Op('-', dst=counter, a=counter, b=iterator, origin=setup))
+
+        header = program.new_block()
+        body = program.new_block()
+        current.terminator = Jump(header.label)
+
+        body_end = self.build_commands(command.commands, body, f"{path}.b")
+        step = f"{path}.n"
+        # A body that never reads the iterator only needs the count
+        if mentions(command.commands, iterator):
+            body_end.ops.append(Op('dec' if command.downto else 'inc', dst=iterator, a=iterator, origin=step))
+        body_end.ops.append(Op('dec', dst=counter, a=counter, origin=step))
+        body_end.terminator = Jump(header.label)
+
+        current = program.new_block()
+        header.terminator = Branch(counter, 'nonzero', None, body.label, current.label, path)
+        return current
+
+    def symbol(self, value, current, origin):
+        """Name holding a bound: an Identifier's own, or a temporary set to a Number"""
+        if isinstance(value, Identifier):
+            return value.name
+        temp = self.program.new_temp()
+        current.ops.append(Op('const', dst=temp, value=value.value, origin=origin))
+        return temp
+
+    def build_expression(self, dst, expr):
+        return self.dispatch[type(expr)](expr, dst)
+
+    def visit_number(self, expr, dst):
+        return Op('const', dst=dst, value=expr.value)
+
+    def visit_identifier(self, expr, dst):
+        return Op('copy', dst=dst, a=expr.name)
+
+    def visit_binop(self, expr, dst):
+        return Op(expr.op, dst=dst, a=expr.left.name, b=expr.right.name)
+
+    def generic_visit(self, node, *args):
+        raise IRError(f"Unsupported node {node!r}")
+
+    def build_branch(self, condition, true_block, false_block, origin):
+        return Branch(condition.left.name, condition.op, condition.right.name,
+                      true_block.label, false_block.label, origin)
@@ -0,0 +1,164 @@
+"""Control-flow layout passes: jump threading, loop rotation and block placement.
+
+Lowering emits a jump for every edge that does not fall through to the
+next block in layout order, so these passes shape the CFG and its layout
+to keep taken jumps off the hot paths.
+"""
+
+from .ir import Jump, Branch
+from .cfg import natural_loops, block_loops, predecessors, reachable
+from .constants import LOOP_WEIGHT
+from .passes import Pass
+
+TARGET_ATTRS = ("target", "true_target", "false_target")
+
+
+def retarget(terminator, old, new):
+    for attr in TARGET_ATTRS:
+        if getattr(terminator, attr, None) == old:
+            setattr(terminator, attr, new)
+
+
+class JumpThreading(Pass):
+    """Send jumps that land on an empty forwarding block straight to its target.
+
+    Blocks left unreachable are dropped and branches whose targets coincide
+    become plain jumps.
+    """
+
+    name = "thread"
+
+    def __init__(self):
+        super().__init__()
+        self.stats = {"threaded": 0, "removed": 0}
+
+    def run(self, program):
+        forward = {block.label: block.terminator.target for block in program.blocks
+                   if not block.ops and isinstance(block.terminator, Jump)
+                   and block is not program.entry}
+
+        def final(label):
+            seen = set()
+            while label in forward and label not in seen:
+                seen.add(label)
+                label = forward[label]
+            return label
+
+        for block in program.blocks:
+            for attr in TARGET_ATTRS:
+                target = getattr(block.terminator, attr, None)
+                if target is not None and final(target) != target:
+                    setattr(block.terminator, attr, final(target))
+                    self.stats["threaded"] += 1
+            terminator = block.terminator
+            if isinstance(terminator, Branch) and terminator.true_target == terminator.false_target:
+                block.terminator = Jump(terminator.true_target)
+
+        live = reachable(program)
+        self.stats["removed"] += len(program.blocks) - len(live)
+        program.blocks = [block for block in program.blocks if block.label in live]
+
+
+class LoopRotation(Pass):
+    """Move the loop test to the bottom of the loop.
+
+    The header's test stays in front of the loop as a guard and every latch
+    that jumped back to it gets its own copy of the test.  An iteration then
+    ends in one conditional jump instead of a JUMP to the top followed by
+    the test.
+    """
+
+    name = "rotate"
+
+    def __init__(self):
+        super().__init__()
+        self.stats = {"rotated": 0}
+
+    def run(self, program):
+        block_map = program.block_map()
+        for loop in natural_loops(program):
+            header = block_map[loop.header]
+            test = header.terminator
+            if header.ops or not isinstance(test, Branch):
+                continue
+            # Exactly one way into the body and one way out
+            if (test.true_target in loop.blocks) == (test.false_target in loop.blocks):
+                continue
+
+            latches = [block_map[label] for label in predecessors(program)[loop.header]
+                       if label in loop.blocks]
+            if not all(isinstance(latch.terminator, Jump) for latch in latches):
+                continue
+            for latch in latches:
+                latch.terminator = Branch(test.a, test.relop, test.b, test.true_target, test.false_target,
+                                          test.origin)
+            self.stats["rotated"] += 1
+
+
+def edge_weights(program, profile=None):
+    """Estimated execution count of every CFG edge: {(src, dst): weight}.
+
+    Without a profile a block runs LOOP_WEIGHT times per enclosing loop and
+    a branch that stays in its loop is taken (LOOP_WEIGHT - 1) times out of
+    LOOP_WEIGHT; other branches split evenly.
+    """
+    loops = natural_loops(program)
+    nesting = block_loops(program, loops)
+    weights = {}
+    for block in program.blocks:
+        frequency = float(LOOP_WEIGHT ** len(nesting[block.label]))
+        terminator = block.terminator
+        if isinstance(terminator, Jump):
+            weights[(block.label, terminator.target)] = frequency
+        elif isinstance(terminator, Branch):
+            stay = [target in nesting[block.label][-1].blocks if nesting[block.label] else False
+                    for target in (terminator.true_target, terminator.false_target)]
+            if stay[0] != stay[1]:
+                likely = (LOOP_WEIGHT - 1) / LOOP_WEIGHT
+                p_true = likely if stay[0] else 1 - likely
+            else:
+                p_true = 0.5
+            weights[(block.label, terminator.true_target)] = frequency * p_true
+            weights[(block.label, terminator.false_target)] = frequency * (1 - p_true)
+    return weights
+
+
+class BlockLayout(Pass):
+    """Order blocks so the heaviest edges fall through.
+
+    Greedy chain formation: edges are visited heaviest first and join two
+    chains when the source ends one and the target starts another.  The
+    entry chain goes first; the rest keep their original relative order.
+    """
+
+    name = "layout"
+
+    def __init__(self, weights=None):
+        super().__init__()
+        self.weights = weights  # callable(program) -> edge weights
+        self.stats = {"fallthroughs": 0}
+
+    def run(self, program):
+        weights = (self.weights or edge_weights)(program)
+        entry = program.entry.label
+        order = {block.label: i for i, block in enumerate(program.blocks)}
+
+        chain_of = {label: [label] for label in order}
+        for (src, dst), _ in sorted(weights.items(), key=lambda item: (-item[1], order[item[0][0]])):
+            head, tail = chain_of[src], chain_of[dst]
+            if dst == entry or head is tail or head[-1] != src or tail[0] != dst:
+                continue
+            head.extend(tail)
+            for label in tail:
+                chain_of[label] = head
+
+        chains = []
+        for label in order:
+            chain = chain_of[label]
+            if chain[0] == label:
+                chains.append(chain)
+        chains.sort(key=lambda chain: (chain[0] != entry, order[chain[0]]))
+
+        block_map = program.block_map()
+        program.blocks = [block_map[label] for chain in chains for label in chain]
+        self.stats["fallthroughs"] = sum(len(chain) - 1 for chain in chains)
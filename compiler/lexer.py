@@ -19,6 +19,10 @@ reserved = {
     'else': 'ELSE',
     'while': 'WHILE',
     'do': 'DO',
+    'for': 'FOR',
+    'from': 'FROM',
+    'to': 'TO',
+    'downto': 'DOWNTO',
     'read': 'READ',
     'write': 'WRITE'
 }
@@ -56,8 +60,8 @@ def t_NUMBER(t):
 
 
 def t_COMMENT(t):
-    r'\(\*.*?\*\)'
-    pass
+    r'\(\*(?:.|\n)*?\*\)'
+    t.lexer.lineno += t.value.count('\n')
 
 
 def t_newline(t):
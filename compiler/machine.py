@@ -0,0 +1,296 @@
+"""Compact machine program representation shared by the compiler and the VM.
+
+A Code holds a program as two parallel arrays: opcode numbers in a
+bytearray and arguments in a signed 64-bit array, NO_ARG marking
+instructions without one.  Nothing is allocated per instruction, so a
+program of millions of instructions takes 9 bytes each, and the VM runs
+straight off the arrays.
+
+Indexing or iterating a Code yields Instruction views (op name and
+argument) for debugging and analysis; they are copies, so changing one
+does not change the program.  Programs are stored as text, one
+`OP [arg]` per line with ';' comments, or in a binary form holding the
+two arrays; a CodeWriter writes either form without holding the program.
+"""
+
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+OPCODES = ("HALT", "ZERO", "INC", "DEC", "SHL", "SHR", "LOAD", "STORE", "ADD", "SUB",
+           "SCAN", "PRINT", "JUMP", "JZ", "JG", "JODD")
+OPCODE = {name: number for number, name in enumerate(OPCODES)}
+JUMP_OPS = frozenset(OPCODE[name] for name in ("JUMP", "JZ", "JG", "JODD"))
+MEMORY_OPS = frozenset(OPCODE[name] for name in ("LOAD", "STORE", "ADD", "SUB", "SCAN", "PRINT"))
+
+NO_ARG = -1
+MEMORY_SIZE = 1000  # Cells of the VM's memory
+
+MAGIC = b"GBLC"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sBI")  # magic, version, instruction count
+
+
+class Instruction:
+    """View of one instruction"""
+
+    __slots__ = ("op", "arg")
+
+    def __init__(self, op, arg=None):
+        self.op = op
+        self.arg = arg
+
+    def __eq__(self, other):
+        return isinstance(other, Instruction) and (self.op, self.arg) == (other.op, other.arg)
+
+    def __repr__(self):
+        return f"Instruction({self.op!r}, {self.arg!r})"
+
+    def __str__(self):
+        if self.arg is not None:
+            return f"{self.op} {self.arg}"
+        return self.op
+
+
+class Code:
+    """A machine program as parallel opcode and argument arrays"""
+
+    __slots__ = ("ops", "args")
+
+    def __init__(self, ops=None, args=None):
+        self.ops = bytearray() if ops is None else ops
+        self.args = array('q') if args is None else args
+
+    @classmethod
+    def from_instructions(cls, instructions):
+        """Code from Instruction-like objects or (op, arg) pairs"""
+        if isinstance(instructions, Code):
+            return instructions
+        code = cls()
+        for instr in instructions:
+            op, arg = (instr.op, instr.arg) if hasattr(instr, "op") else instr
+            code.append(op, arg)
+        return code
+
+    def append(self, op, arg=None):
+        self.ops.append(OPCODE[op])
+        self.args.append(NO_ARG if arg is None else arg)
+
+    def extend(self, other):
+        self.ops += other.ops
+        self.args += other.args
+
+    def op(self, index):
+        return OPCODES[self.ops[index]]
+
+    def arg(self, index):
+        arg = self.args[index]
+        return None if arg == NO_ARG else arg
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Code(self.ops[index], self.args[index])
+        return Instruction(self.op(index), self.arg(index))
+
+    def __iter__(self):
+        for number, arg in zip(self.ops, self.args):
+            yield Instruction(OPCODES[number], None if arg == NO_ARG else arg)
+
+    def __eq__(self, other):
+        return isinstance(other, Code) and self.ops == other.ops and self.args == other.args
+
+    def __repr__(self):
+        return f"<Code of {len(self)} instructions>"
+
+    # Text form
+
+    def to_text(self):
+        lines = []
+        for number, arg in zip(self.ops, self.args):
+            lines.append(OPCODES[number] if arg == NO_ARG else f"{OPCODES[number]} {arg}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    @classmethod
+    def from_text(cls, text):
+        """Parse `OP [arg]` lines; ';' starts a comment"""
+        ops, args = bytearray(), array('q')
+        for number, line in enumerate(text.split('\n'), 1):
+            parts = line.split(';', 1)[0].split()
+            if not parts:
+                continue
+            if parts[0] not in OPCODE or len(parts) > 2:
+                raise ValueError(f"Line {number}: cannot parse '{line.strip()}'")
+            ops.append(OPCODE[parts[0]])
+            args.append(int(parts[1]) if len(parts) > 1 else NO_ARG)
+        return cls(ops, args)
+
+    # Binary form: header, opcode bytes, little-endian 64-bit arguments
+
+    def to_bytes(self):
+        args = array('q', self.args)
+        if sys.byteorder == "big":
+            args.byteswap()
+        return _HEADER.pack(MAGIC, FORMAT_VERSION, len(self)) + bytes(self.ops) + args.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, count = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("Not a binary program of a supported version")
+        start = _HEADER.size
+        ops = bytearray(data[start:start + count])
+        args = array('q')
+        args.frombytes(data[start + count:start + count + 8 * count])
+        if len(ops) != count or len(args) != count:
+            raise ValueError("Truncated binary program")
+        if sys.byteorder == "big":
+            args.byteswap()
+        return cls(ops, args)
+
+
+class VerificationError(ValueError):
+    """A program the VM must not run; problems lists every finding"""
+
+    def __init__(self, problems):
+        self.problems = problems
+        shown = "; ".join(problems[:5])
+        more = f" (and {len(problems) - 5} more)" if len(problems) > 5 else ""
+        super().__init__(f"Invalid program: {shown}{more}")
+
+
+def verify(code, memory_size=MEMORY_SIZE):
+    """Check a program before it runs.
+
+    Every opcode must be known and carry an argument exactly when it takes
+    one, jump targets must be instructions and memory arguments cells; a
+    HALT must be reachable from the entry and no reachable instruction may
+    run off the end.  Loops that never exit are allowed.  Raises
+    VerificationError listing the problems.
+    """
+    ops, args = code.ops, code.args
+    end = len(ops)
+    problems = []
+    for address, (op, arg) in enumerate(zip(ops, args)):
+        if op >= len(OPCODES):
+            problems.append(f"[{address}] unknown opcode {op}")
+        elif (op in JUMP_OPS or op in MEMORY_OPS) and arg == NO_ARG:
+            problems.append(f"[{address}] {OPCODES[op]} needs an argument")
+        elif op in JUMP_OPS:
+            if not 0 <= arg < end:
+                problems.append(f"[{address}] {OPCODES[op]} target {arg} outside 0..{end - 1}")
+        elif op in MEMORY_OPS:
+            if not 0 <= arg < memory_size:
+                problems.append(f"[{address}] {OPCODES[op]} address {arg} outside 0..{memory_size - 1}")
+        elif arg != NO_ARG:
+            problems.append(f"[{address}] {OPCODES[op]} takes no argument, got {arg}")
+    if problems:
+        raise VerificationError(problems)
+
+    # Successors of every reachable instruction, then which of them lead to HALT
+    halt, jump = OPCODE["HALT"], OPCODE["JUMP"]
+    successors = {}
+    pending = [0] if end else []
+    while pending:
+        address = pending.pop()
+        if address in successors:
+            continue
+        op = ops[address]
+        if op == halt:
+            following = ()
+        elif op == jump:
+            following = (args[address],)
+        elif op in JUMP_OPS:
+            following = (address + 1, args[address])
+        else:
+            following = (address + 1,)
+        if end in following:
+            problems.append(f"[{address}] {OPCODES[op]} runs off the end of the program")
+            following = tuple(target for target in following if target != end)
+        successors[address] = following
+        pending.extend(following)
+
+    predecessors = {address: [] for address in successors}
+    for address, following in successors.items():
+        for target in following:
+            predecessors[target].append(address)
+    halting = {address for address in successors if ops[address] == halt}
+    pending = list(halting)
+    while pending:
+        for source in predecessors[pending.pop()]:
+            if source not in halting:
+                halting.add(source)
+                pending.append(source)
+    if not end:
+        problems.append("empty program has no HALT")
+    elif 0 not in halting:
+        problems.append("no HALT is reachable from the entry")
+    if problems:
+        raise VerificationError(problems)
+
+
+def load(path):
+    """Read a program file in either form"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data.startswith(MAGIC):
+        return Code.from_bytes(data)
+    return Code.from_text(data.decode())
+
+
+def save(code, path, binary=False):
+    if binary:
+        with open(path, 'wb') as f:
+            f.write(code.to_bytes())
+    else:
+        with open(path, 'w') as f:
+            f.write(code.to_text())
+
+
+class CodeWriter:
+    """Write a program to a file piece by piece, holding none of it.
+
+    The binary form puts all opcodes before all arguments, so arguments
+    are spooled to a temporary file and appended, and the header's count
+    filled in, when the writer is closed.
+    """
+
+    def __init__(self, path, binary=False):
+        self.binary = binary
+        self.count = 0
+        if binary:
+            self.file = open(path, 'w+b')
+            self.file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0))
+            self.args = tempfile.TemporaryFile()
+        else:
+            self.file = open(path, 'w')
+
+    def write(self, code):
+        if self.binary:
+            self.file.write(bytes(code.ops))
+            args = array('q', code.args)
+            if sys.byteorder == "big":
+                args.byteswap()
+            self.args.write(args.tobytes())
+        else:
+            self.file.write(code.to_text())
+        self.count += len(code)
+
+    def close(self):
+        if self.binary:
+            self.args.seek(0)
+            shutil.copyfileobj(self.args, self.file)
+            self.args.close()
+            self.file.seek(0)
+            self.file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, self.count))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
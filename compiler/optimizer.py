@@ -0,0 +1,250 @@
+from .ir import Op, Jump, BasicBlock
+from .cfg import natural_loops, block_loops, predecessors, live_variables
+from .passes import Pass
+
+COMMUTATIVE_OPS = ('+', '*')
+
+
+def expression_key(op):
+    """Value-numbering key of a binary op; commutative operands are ordered"""
+    left, right = op.a, op.b
+    if op.opcode in COMMUTATIVE_OPS and right < left:
+        left, right = right, left
+    return (op.opcode, left, right)
+
+
+def _kill(avail, name):
+    """Drop every available expression that reads name"""
+    for key in [k for k in avail if name in k[1:]]:
+        avail.discard(key)
+
+
+def loop_preheader(program, loop):
+    """The block entering the loop from outside, created if there is none"""
+    block_map = program.block_map()
+    outside = [label for label in predecessors(program)[loop.header] if label not in loop.blocks]
+    if len(outside) == 1:
+        candidate = block_map[outside[0]]
+        if candidate.successors() == [loop.header]:
+            return candidate
+
+    preheader = BasicBlock(f"B{program.next_block}")
+    program.next_block += 1
+    preheader.terminator = Jump(loop.header)
+    for label in outside:
+        terminator = block_map[label].terminator
+        for attr in ("target", "true_target", "false_target"):
+            if getattr(terminator, attr, None) == loop.header:
+                setattr(terminator, attr, preheader.label)
+    program.blocks.insert(program.blocks.index(block_map[loop.header]), preheader)
+    return preheader
+
+
+class LoopInvariantCodeMotion(Pass):
+    """Hoist binary ops whose operands a loop never changes.
+
+    The value is computed once into a temporary in the loop preheader and
+    the op inside the loop becomes a copy from it.
+    """
+
+    name = "licm"
+
+    # Any operator pays for itself once the loop runs a few times
+    OPS = ('+', '-', '*', '/', '%')
+
+    def __init__(self):
+        super().__init__()
+        self.stats = {"hoisted": 0, "temps": 0}
+
+    def run(self, program):
+        loops = natural_loops(program)
+        if not loops:
+            return
+        nesting = block_loops(program, loops)
+        block_map = program.block_map()
+        loop_defs = {loop.header: loop.defined_names(block_map) for loop in loops}
+
+        preheaders = {}
+        temps = {}  # (loop header, key) -> temp
+        for block in program.blocks:
+            for i, op in enumerate(block.ops):
+                if not nesting[block.label] or op.opcode not in self.OPS:
+                    continue
+
+                # Hoist to the outermost loop that leaves both operands alone
+                target = next((loop for loop in nesting[block.label]
+                               if not {op.a, op.b} & loop_defs[loop.header]), None)
+                if target is None:
+                    continue
+
+                key = (target.header, expression_key(op))
+                if key not in temps:
+                    if target.header not in preheaders:
+                        preheaders[target.header] = loop_preheader(program, target)
+                    temps[key] = program.new_temp()
+                    preheaders[target.header].ops.append(Op(op.opcode, dst=temps[key], a=op.a, b=op.b,
+                                                             origin=op.origin))
+                    self.stats["temps"] += 1
+                block.ops[i] = Op('copy', dst=op.dst, a=temps[key], origin=op.origin)
+                self.stats["hoisted"] += 1
+
+
+class CommonSubexpressionElimination(Pass):
+    """Global CSE driven by an available-expressions analysis.
+
+    READ and assignments kill every expression over their target.  When a
+    computation is redundant, every computation of the same expression keeps
+    a copy in a shared temporary and the redundant one copies from it.
+    """
+
+    name = "cse"
+
+    # Only pays when recomputing costs more than the extra STORE of a copy
+    OPS = ('*', '/', '%')
+
+    def __init__(self):
+        super().__init__()
+        self.stats = {"reused": 0, "temps": 0}
+
+    def run(self, program):
+        avail_in = self.available_expressions(program)
+
+        redundant = {}  # (label, index) -> key
+        for block in program.blocks:
+            avail = set(avail_in[block.label])
+            for i, op in enumerate(block.ops):
+                if op.opcode in self.OPS and expression_key(op) in avail:
+                    redundant[(block.label, i)] = expression_key(op)
+                self.transfer(op, avail)
+        if not redundant:
+            return
+
+        temps = {}
+        for key in sorted(set(redundant.values())):
+            temps[key] = program.new_temp()
+            self.stats["temps"] += 1
+
+        for block in program.blocks:
+            ops = []
+            for i, op in enumerate(block.ops):
+                if (block.label, i) in redundant:
+                    ops.append(Op('copy', dst=op.dst, a=temps[redundant[(block.label, i)]], origin=op.origin))
+                    self.stats["reused"] += 1
+                    continue
+                key = expression_key(op) if op.opcode in self.OPS else None
+                # An op that overwrites its own operand kills the value at once
+                if key in temps and op.dst not in key[1:]:
+                    ops.append(Op(op.opcode, dst=temps[key], a=op.a, b=op.b, origin=op.origin))
+                    ops.append(Op('copy', dst=op.dst, a=temps[key], origin=op.origin))
+                else:
+                    ops.append(op)
+            block.ops = ops
+
+    def available_expressions(self, program):
+        """Forward must-analysis of OPS expressions at block entry"""
+        universe = {expression_key(op) for block in program.blocks for op in block.ops
+                    if op.opcode in self.OPS}
+        preds = predecessors(program)
+        entry = program.entry.label
+
+        avail_in = {block.label: set() if block.label == entry else set(universe)
+                    for block in program.blocks}
+        avail_out = {}
+        changed = True
+        while changed:
+            changed = False
+            for block in program.blocks:
+                if block.label != entry and preds[block.label]:
+                    new_in = set.intersection(*(avail_out.get(p, universe) for p in preds[block.label]))
+                    if new_in != avail_in[block.label]:
+                        avail_in[block.label] = new_in
+                        changed = True
+                out = set(avail_in[block.label])
+                for op in block.ops:
+                    self.transfer(op, out)
+                if avail_out.get(block.label) != out:
+                    avail_out[block.label] = out
+                    changed = True
+        return avail_in
+
+    def transfer(self, op, avail):
+        if op.dst is None:
+            return
+        if op.opcode in self.OPS:
+            avail.add(expression_key(op))
+        _kill(avail, op.dst)
+
+
+class DeadCodeElimination(Pass):
+    """Drop assignments nobody reads, then the symbols nothing mentions.
+
+    An op whose destination is dead when it runs is removed, which can kill
+    the ops feeding it, so the liveness analysis is repeated until nothing
+    changes.  READ always stays: it consumes input even when its value is
+    never used.  CONSTs and variables no op or branch mentions any more
+    lose their declaration, and with it their memory cell and the STORE
+    that initializes a CONST.
+    """
+
+    name = "dce"
+
+    def __init__(self):
+        super().__init__()
+        self.stats = {"stores": 0, "consts": 0, "variables": 0}
+
+    def run(self, program):
+        changed = True
+        while changed:
+            changed = False
+            live_in = live_variables(program)
+            for block in program.blocks:
+                live = set()
+                for target in block.successors():
+                    live |= live_in[target]
+                live.update(block.terminator.uses())
+
+                kept = []
+                for op in reversed(block.ops):
+                    if op.dst is not None and op.opcode != 'read' and op.dst not in live:
+                        self.stats["stores"] += 1
+                        changed = True
+                        continue
+                    live.discard(op.dst)
+                    live.update(op.uses())
+                    kept.append(op)
+                kept.reverse()
+                block.ops = kept
+
+        mentioned = set()
+        for block in program.blocks:
+            for op in block.ops:
+                mentioned.update(op.uses())
+                mentioned.add(op.dst)
+            mentioned.update(block.terminator.uses())
+
+        for name in [name for name in program.consts if name not in mentioned]:
+            del program.consts[name]
+            self.stats["consts"] += 1
+        variables = [name for name in program.variables if name in mentioned]
+        self.stats["variables"] += len(program.variables) - len(variables)
+        program.variables = variables
+
+
+def build_pipeline(opt_level, profile=None, target=None):
+    """IR passes run at an optimization level (0, 1 or 's').
+
+    A training profile adds loop promotion and drives block layout with
+    measured branch counts; promotion fills the target's fast cells.
+    """
+    from .layout import JumpThreading, LoopRotation, BlockLayout
+
+    if opt_level == 0:
+        return []
+    if profile is None:
+        return [LoopInvariantCodeMotion(), CommonSubexpressionElimination(), DeadCodeElimination(),
+                JumpThreading(), LoopRotation(), BlockLayout()]
+
+    from .pgo import LoopPromotion, profile_edge_weights
+    return [LoopInvariantCodeMotion(), CommonSubexpressionElimination(), LoopPromotion(profile, target),
+            DeadCodeElimination(), JumpThreading(), LoopRotation(),
+            BlockLayout(weights=profile_edge_weights(profile))]
@@ -5,10 +5,28 @@ from .lexer import tokens
 
 
 class Node:
-    pass
+    """Base of the AST node classes.
+
+    Nodes keep their fields in __slots__, in constructor order, and name
+    their node type in the class attribute `kind`; compiler.visitor
+    dispatches on it.
+    """
+
+    __slots__ = ()
+    kind = None
+
+    def fields(self):
+        """(name, value) pairs of the node's fields"""
+        return [(name, getattr(self, name)) for name in self.__slots__]
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={value!r}' for name, value in self.fields())})"
 
 
 class Program(Node):
+    kind = 'program'
+    __slots__ = ('const_decls', 'var_decls', 'commands')
+
     def __init__(self, const_decls, var_decls, commands):
         self.const_decls = const_decls
         self.var_decls = var_decls
@@ -16,23 +34,35 @@ class Program(Node):
 
 
 class ConstDecl(Node):
+    kind = 'const_decl'
+    __slots__ = ('name', 'value')
+
     def __init__(self, name, value):
         self.name = name
         self.value = value
 
 
 class VarDecl(Node):
+    kind = 'var_decl'
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
 
 class Assignment(Node):
+    kind = 'assignment'
+    __slots__ = ('name', 'expr')
+
     def __init__(self, name, expr):
         self.name = name
         self.expr = expr
 
 
 class IfElse(Node):
+    kind = 'if'
+    __slots__ = ('condition', 'then_cmds', 'else_cmds')
+
     def __init__(self, condition, then_cmds, else_cmds):
         self.condition = condition
         self.then_cmds = then_cmds
@@ -40,32 +70,68 @@ class IfElse(Node):
 
 
 class While(Node):
+    kind = 'while'
+    __slots__ = ('condition', 'commands')
+
     def __init__(self, condition, commands):
         self.condition = condition
         self.commands = commands
 
 
+class For(Node):
+    """FOR iterator FROM start TO end (DOWNTO when downto) DO commands END.
+
+    The bounds are Number or Identifier nodes, evaluated once on entry;
+    the iterator is local to the loop and read-only in its body.
+    """
+
+    kind = 'for'
+    __slots__ = ('iterator', 'start', 'end', 'downto', 'commands')
+
+    def __init__(self, iterator, start, end, downto, commands):
+        self.iterator = iterator
+        self.start = start
+        self.end = end
+        self.downto = downto
+        self.commands = commands
+
+
 class Read(Node):
+    kind = 'read'
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
 
 class Write(Node):
+    kind = 'write'
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
 
 class Number(Node):
+    kind = 'number'
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 
 class Identifier(Node):
+    kind = 'identifier'
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
 
 class BinOp(Node):
+    kind = 'binop'
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
@@ -73,17 +139,53 @@ class BinOp(Node):
 
 
 class Condition(Node):
+    kind = 'condition'
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
 
+
+NODE_TYPES = (Program, ConstDecl, VarDecl, Assignment, IfElse, While, For, Read, Write,
+              Number, Identifier, BinOp, Condition)
+
 # Grammar rules
 
 
 def p_program(p):
-    'program : CONST cdeclarations VAR vdeclarations BEGIN commands END'
-    p[0] = Program(p[2], p[4], p[6])
+    'program : header body END'
+    p[0] = Program(p[1][0], p[1][1], p[2])
+
+
+def p_header(p):
+    'header : CONST cdeclarations VAR vdeclarations BEGIN'
+    p[0] = (p[2], p[4])
+    if p.parser.listener is not None:
+        p.parser.listener.declare(p[2], p[4])
+
+
+# Top-level commands: a listener takes each one as it is reduced, and
+# the Program is then left without them
+
+
+def p_body_multiple(p):
+    'body : body command'
+    p[0] = p[1]
+    if p.parser.listener is not None:
+        p.parser.listener.command(p[2])
+    else:
+        p[0].append(p[2])
+
+
+def p_body_single(p):
+    'body : command'
+    p[0] = []
+    if p.parser.listener is not None:
+        p.parser.listener.command(p[1])
+    else:
+        p[0].append(p[1])
 
 
 def p_cdeclarations_empty(p):
@@ -131,6 +233,12 @@ def p_command_while(p):
     p[0] = While(p[2], p[4])
 
 
+def p_command_for(p):
+    '''command : FOR IDENTIFIER FROM value TO value DO commands END
+               | FOR IDENTIFIER FROM value DOWNTO value DO commands END'''
+    p[0] = For(p[2], p[4], p[6], p[5].upper() == 'DOWNTO', p[8])
+
+
 def p_command_read(p):
     'command : READ IDENTIFIER SEMICOLON'
     p[0] = Read(p[2])
@@ -141,6 +249,16 @@ def p_command_write(p):
     p[0] = Write(p[2])
 
 
+def p_value_number(p):
+    'value : NUMBER'
+    p[0] = Number(p[1])
+
+
+def p_value_identifier(p):
+    'value : IDENTIFIER'
+    p[0] = Identifier(p[1])
+
+
 def p_expression_number(p):
     'expression : NUMBER'
     p[0] = Number(p[1])
@@ -197,7 +315,19 @@ def p_error(p):
 
 # Build the parser
 parser = yacc.yacc()
-
-
-def parse(data, lexer=None):
-    return parser.parse(data, lexer=lexer)
+parser.listener = None
+
+
+def parse(data, lexer=None, listener=None):
+    """Parse a program into a Program AST, None after a syntax error.
+
+    A listener is called while parsing: listener.declare(const_decls,
+    var_decls) once BEGIN is read, then listener.command(command) for each
+    top-level command as soon as it is complete.  Those commands are not
+    kept, so the AST returned holds only the declarations.
+    """
+    parser.listener = listener
+    try:
+        return parser.parse(data, lexer=lexer)
+    finally:
+        parser.listener = None
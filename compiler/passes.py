@@ -0,0 +1,104 @@
+"""Pass manager for IR transformations"""
+
+import time
+
+from .cfg import block_loops
+from .constants import LOOP_WEIGHT
+from .stats import CompileStats
+from .target import DEFAULT
+
+
+class Pass:
+    """Base class for IR passes.
+
+    Subclasses set `name` and implement run(program), mutating the program in
+    place.  Counters worth reporting go into self.stats.
+    """
+
+    name = "pass"
+
+    def __init__(self):
+        self.stats = {}
+
+    def run(self, program):
+        raise NotImplementedError
+
+
+class PassRecord:
+    def __init__(self, name, seconds, before, after, stats):
+        self.name = name
+        self.seconds = seconds
+        self.instructions = after[0] - before[0]
+        self.steps = after[1] - before[1]
+        self.before = before
+        self.after = after
+        self.stats = stats
+
+
+def measure_program(program, target=DEFAULT):
+    """Lower the program and return (machine instructions, estimated steps).
+
+    Steps are a static estimate: the constant prologue once plus each
+    block's instruction costs weighted by LOOP_WEIGHT per enclosing loop.
+    Loops inside arithmetic templates count once.
+    """
+    from .codegen import CodeGenerator
+
+    generator = CodeGenerator(target=target)
+    code = generator.lower(program)
+    cost = target.instruction_cost
+    nesting = block_loops(program)
+
+    prologue = generator.block_ranges[program.entry.label][0]
+    steps = sum(cost(instr.op, instr.arg) for instr in code[:prologue])
+    for label, (start, end) in generator.block_ranges.items():
+        weight = LOOP_WEIGHT ** len(nesting[label])
+        steps += weight * sum(cost(instr.op, instr.arg) for instr in code[start:end])
+    return len(code), steps
+
+
+class PassManager:
+    """Run registered passes in order and verify the IR between them.
+
+    For each pass it records wall time and, with measure, the change in
+    machine instructions and estimated steps; measuring lowers the whole
+    program after every pass, so it is only on for the per-pass report.
+    """
+
+    def __init__(self, passes=(), verify=True, measure=False, stats=None, target=DEFAULT):
+        self.passes = list(passes)
+        self.target = target  # Machine the step estimates are for
+        self.verify = verify
+        self.measure = measure
+        self.records = []
+        self.stats = stats if stats is not None else CompileStats(enabled=False)
+
+    def register(self, ir_pass):
+        self.passes.append(ir_pass)
+        return ir_pass
+
+    def run(self, program):
+        if self.verify:
+            program.verify()
+        current = measure_program(program, self.target) if self.measure else (0, 0)
+
+        for ir_pass in self.passes:
+            with self.stats.phase(ir_pass.name) as counts:
+                start = time.perf_counter()
+                ir_pass.run(program)
+                seconds = time.perf_counter() - start
+                counts.update(ir_pass.stats)
+
+            if self.verify:
+                program.verify()
+            before, current = current, measure_program(program, self.target) if self.measure else (0, 0)
+            self.records.append(PassRecord(ir_pass.name, seconds, before, current, dict(ir_pass.stats)))
+        return program
+
+    def report(self):
+        lines = [f"{'pass':<8} {'time ms':>8} {'instrs':>8} {'steps':>10}  stats"]
+        for record in self.records:
+            stats = ", ".join(f"{key}={value}" for key, value in record.stats.items())
+            lines.append(f"{record.name:<8} {record.seconds * 1000:>8.2f} {record.instructions:>+8} "
+                         f"{record.steps:>+10}  {stats}")
+        return "\n".join(lines)
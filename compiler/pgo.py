@@ -0,0 +1,382 @@
+"""Profile-guided optimization.
+
+A training run executes the compiled program on the VM with per-instruction
+counters and folds the counts back onto source commands through the code
+generator's source map.  Profiles are JSON keyed by command path (see
+ir.py), so runs with different inputs or at different optimization levels
+merge by adding their counts.
+
+A later compile with the profile:
+  - gives the fast cells (p[0..2] by default) to the most accessed cells,
+  - lays blocks out by measured branch outcomes,
+  - promotes the symbols of hot loops to loop-private fast copies.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+
+from .cfg import natural_loops
+from .ir import Op, Branch, BasicBlock, Jump
+from .layout import edge_weights, retarget
+from .optimizer import loop_preheader
+from .parser import Node
+from .passes import Pass
+from .target import DEFAULT
+
+FORMAT_VERSION = 1
+
+JUMPS = ("JUMP", "JZ", "JG", "JODD")
+MEMORY_OPS = ("LOAD", "STORE", "ADD", "SUB", "SCAN", "PRINT")
+COUNTERS = ("count", "true", "false", "instructions", "steps")
+
+
+class ProfileError(Exception):
+    pass
+
+
+def _structure(node):
+    if isinstance(node, list):
+        return [_structure(item) for item in node]
+    if isinstance(node, Node):
+        return (type(node).__name__, [(key, _structure(value)) for key, value in sorted(node.fields())])
+    return node
+
+
+def fingerprint(ast):
+    """Hash of the program's structure; layout and comments do not change it"""
+    return hashlib.sha256(repr(_structure(ast)).encode()).hexdigest()[:16]
+
+
+class Profile:
+    """Execution counts summed over training runs.
+
+    nodes maps a command path to its counters: `count` executions (for IF
+    and WHILE, condition evaluations), `true`/`false` condition outcomes,
+    and the `instructions` and `steps` spent in its code.  cells maps a
+    memory cell name (symbol, '%n' scratch cell, '%sel', '=value' pooled
+    literal) to its number of accesses.  All counts are totals; divide by
+    `runs` for a per-run figure.
+    """
+
+    def __init__(self, program, runs=0, nodes=None, cells=None):
+        self.program = program
+        self.runs = runs
+        self.nodes = nodes if nodes is not None else {}
+        self.cells = cells if cells is not None else {}
+
+    def node(self, path):
+        return self.nodes.setdefault(path, dict.fromkeys(COUNTERS, 0))
+
+    def frequency(self, path):
+        """Executions of a command per run (0 if it never ran)"""
+        if path not in self.nodes or not self.runs:
+            return 0.0
+        return self.nodes[path]["count"] / self.runs
+
+    def outcomes(self, path):
+        """Per-run (true, false) outcomes of a condition, or None if unknown"""
+        node = self.nodes.get(path)
+        if node is None or not self.runs or not node["true"] + node["false"]:
+            return None
+        return node["true"] / self.runs, node["false"] / self.runs
+
+    def merge(self, other):
+        if other.program != self.program:
+            raise ProfileError(f"Profile is for program {other.program}, expected {self.program}")
+        self.runs += other.runs
+        for path, counters in other.nodes.items():
+            node = self.node(path)
+            for key in COUNTERS:
+                node[key] += counters.get(key, 0)
+        for name, count in other.cells.items():
+            self.cells[name] = self.cells.get(name, 0) + count
+        return self
+
+    def to_dict(self):
+        return {"version": FORMAT_VERSION, "program": self.program, "runs": self.runs,
+                "nodes": self.nodes, "cells": self.cells}
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != FORMAT_VERSION:
+            raise ProfileError(f"Unsupported profile version {data.get('version')}")
+        nodes = {path: {key: counters.get(key, 0) for key in COUNTERS}
+                 for path, counters in data["nodes"].items()}
+        return cls(data["program"], data["runs"], nodes, dict(data["cells"]))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1, sort_keys=True)
+            f.write("\n")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+def collect(generator, vm, program):
+    """Build a one-run profile from a lowered program and the VM that ran it.
+
+    `vm` must have been created with profile=True and `program` is the
+    fingerprint of the source.
+    """
+    code, counts, taken = generator.code, vm.counts, vm.taken
+    profile = Profile(program, runs=1)
+
+    # A command runs as often as the first instruction of its op; a hoisted
+    # copy in a preheader runs less often, so take the maximum
+    for origin, start in generator.op_sites:
+        if origin is not None and start < len(code):
+            node = profile.node(origin)
+            node["count"] = max(node["count"], counts[start])
+
+    def resolve(address):
+        seen = set()
+        while address < len(code) and code[address].op == "JUMP" and address not in seen:
+            seen.add(address)
+            address = code[address].arg
+        return address
+
+    # Each lowered branch leaves its code through jumps to one of its two
+    # targets or by falling through the end
+    for origin, start, end, true_label, false_label in generator.branch_sites:
+        node = profile.node(origin)
+        sides = {resolve(generator.labels[true_label]): "true",
+                 resolve(generator.labels[false_label]): "false"}
+        before = node["true"] + node["false"]
+        for i in range(start, end):
+            if code[i].op in JUMPS:
+                side = sides.get(resolve(code[i].arg))
+                if side:
+                    node[side] += taken[i]
+        if code[end - 1].op != "JUMP":
+            side = sides.get(resolve(end))
+            if side:
+                node[side] += counts[end - 1] - taken[end - 1]
+        node["count"] += node["true"] + node["false"] - before
+
+    for i, origin in enumerate(generator.origins):
+        if origin is not None and counts[i]:
+            node = profile.node(origin)
+            node["instructions"] += counts[i]
+            node["steps"] += counts[i] * generator.target.instruction_cost(code[i].op, code[i].arg)
+
+    names = generator.cell_names()
+    for i, instr in enumerate(code):
+        if instr.op in MEMORY_OPS and counts[i]:
+            name = names.get(instr.arg, f"@{instr.arg}")
+            profile.cells[name] = profile.cells.get(name, 0) + counts[i]
+    return profile
+
+
+def merge_profiles(paths):
+    profiles = [Profile.load(path) for path in paths]
+    merged = Profile(profiles[0].program)
+    for profile in profiles:
+        merged.merge(profile)
+    return merged
+
+
+def block_frequency(block, profile):
+    """Per-run executions of a block's ops, or None if none came from source.
+
+    Every op of a block runs equally often, and an op runs at most as often
+    as its command (a hoisted op runs less), so the least frequent command
+    bounds the block best.
+    """
+    frequencies = [profile.frequency(op.origin) for op in block.ops if op.origin is not None]
+    return min(frequencies) if frequencies else None
+
+
+def symbol_accesses(program, profile, labels=None):
+    """Per-run accesses of each symbol by the ops and branches of some blocks.
+
+    labels limits the count to those blocks.  A condition evaluated by
+    several branches (a rotated loop's guard and latch) has its count split
+    between them.
+    """
+    copies = {}
+    for block in program.blocks:
+        if isinstance(block.terminator, Branch):
+            copies[block.terminator.origin] = copies.get(block.terminator.origin, 0) + 1
+
+    accesses = {}
+    for block in program.blocks:
+        if labels is not None and block.label not in labels:
+            continue
+        frequency = block_frequency(block, profile) or 0
+        for op in block.ops:
+            for name in op.uses() + ((op.dst,) if op.dst is not None else ()):
+                accesses[name] = accesses.get(name, 0) + frequency
+        terminator = block.terminator
+        if isinstance(terminator, Branch):
+            frequency = profile.frequency(terminator.origin) / copies[terminator.origin]
+            for name in terminator.uses():
+                accesses[name] = accesses.get(name, 0) + frequency
+    return accesses
+
+
+def cell_weights(program, profile):
+    """Expected accesses per run of every cell an IR program allocates.
+
+    Symbols are weighed by how often the ops and branches that use them
+    run; the arithmetic scratch cells and the return selector by their
+    measured accesses.
+    """
+    weights = symbol_accesses(program, profile)
+    if profile.runs:
+        for name, count in profile.cells.items():
+            if name.startswith('%'):
+                weights[name] = count / profile.runs
+    return weights
+
+
+def profile_edge_weights(profile):
+    """Edge weights for BlockLayout from measured branch outcomes.
+
+    Branches with recorded outcomes and blocks whose ops ran use measured
+    per-run counts; the rest keep the static estimate.
+    """
+    def weights(program):
+        result = edge_weights(program)
+        for block in program.blocks:
+            terminator = block.terminator
+            if isinstance(terminator, Branch):
+                outcomes = profile.outcomes(terminator.origin)
+                if outcomes is not None:
+                    result[(block.label, terminator.true_target)] = outcomes[0]
+                    result[(block.label, terminator.false_target)] = outcomes[1]
+            elif isinstance(terminator, Jump) and block_frequency(block, profile) is not None:
+                result[(block.label, terminator.target)] = block_frequency(block, profile)
+        return result
+    return weights
+
+
+class LoopPromotion(Pass):
+    """Run hot loops on fast copies of the symbols they use most.
+
+    Inside the loop every use of a promoted symbol goes to a temporary,
+    copied in at the preheader and back out on every exit edge if the loop
+    writes it.  Loops that do not overlap share the same temporaries, one
+    per fast cell of the target, so their summed accesses rank them first
+    when the profile hands out the fast cells.  A symbol is promoted when its saving inside the loop
+    beats the copies paid on every entry and exit; where loops nest, the
+    one with the larger total saving wins.
+    """
+
+    name = "promote"
+
+    def __init__(self, profile, target=None):
+        super().__init__()
+        self.profile = profile
+        self.target = target if target is not None else DEFAULT
+        self.stats = {"loops": 0, "promoted": 0}
+
+    def run(self, program):
+        if not self.profile.runs:
+            return
+        block_map = program.block_map()
+        fast, memory_cost = self.target.fast_cells, self.target.memory_cost
+        saving = memory_cost(fast) - memory_cost(0)
+        copy = memory_cost(0) + memory_cost(fast)
+
+        plans = []
+        for loop in natural_loops(program):
+            test = block_map[loop.header].terminator
+            outcomes = self.profile.outcomes(getattr(test, "origin", None))
+            if outcomes is None:
+                continue
+            entries = outcomes[1] if test.true_target in loop.blocks else outcomes[0]
+            written = loop.defined_names(block_map)
+            accesses = symbol_accesses(program, self.profile, loop.blocks)
+            profits = {name: count * saving - entries * copy * (2 if name in written else 1)
+                       for name, count in accesses.items()}
+            names = sorted((name for name in profits if profits[name] > 0),
+                           key=lambda name: (-profits[name], name))[:fast]
+            if names:
+                plans.append((sum(profits[name] for name in names), loop, names))
+
+        chosen = []
+        for _, loop, names in sorted(plans, key=lambda plan: -plan[0]):
+            if not any(other.blocks & loop.blocks for other, _ in chosen):
+                chosen.append((loop, names))
+
+        slots = []
+        for loop, names in chosen:
+            while len(slots) < len(names):
+                slots.append(program.new_temp())
+            self.promote(program, loop, dict(zip(names, slots)))
+            self.stats["loops"] += 1
+            self.stats["promoted"] += len(names)
+
+    def promote(self, program, loop, copies):
+        """Rename symbols inside the loop to their copies (name -> temporary)"""
+        block_map = program.block_map()
+        written = loop.defined_names(block_map)
+        names = list(copies)
+
+        def rename(name):
+            return copies.get(name, name)
+
+        for label in loop.blocks:
+            block = block_map[label]
+            for op in block.ops:
+                op.a, op.b, op.dst = rename(op.a), rename(op.b), rename(op.dst)
+            if isinstance(block.terminator, Branch):
+                block.terminator.a = rename(block.terminator.a)
+                block.terminator.b = rename(block.terminator.b)
+
+        preheader = loop_preheader(program, loop)
+        preheader.ops.extend(Op('copy', dst=copies[name], a=name) for name in names)
+
+        stores = [Op('copy', dst=name, a=copies[name]) for name in names if name in written]
+        if not stores:
+            return
+        for label in sorted(loop.blocks):
+            block = block_map[label]
+            for target in block.successors():
+                if target in loop.blocks:
+                    continue
+                exit_block = BasicBlock(f"B{program.next_block}")
+                program.next_block += 1
+                exit_block.ops = [Op('copy', dst=op.dst, a=op.a) for op in stores]
+                exit_block.terminator = Jump(target)
+                retarget(block.terminator, target, exit_block.label)
+                program.blocks.append(exit_block)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge and inspect execution profiles')
+    commands = parser.add_subparsers(dest='command', required=True)
+    merge = commands.add_parser('merge', help='Add up the counts of several profiles')
+    merge.add_argument('profiles', nargs='+')
+    merge.add_argument('--output', '-o', required=True)
+    show = commands.add_parser('show', help='List the commands that took the most steps')
+    show.add_argument('profile')
+    show.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'merge':
+            merged = merge_profiles(args.profiles)
+            merged.save(args.output)
+            print(f"Merged {len(args.profiles)} profiles ({merged.runs} runs) into {args.output}")
+        else:
+            profile = Profile.load(args.profile)
+            print(f"Program {profile.program}, {profile.runs} runs")
+            print(f"{'command':<12} {'count':>10} {'true':>10} {'false':>10} {'steps':>12}")
+            hottest = sorted(profile.nodes.items(), key=lambda item: -item[1]["steps"])[:args.top]
+            for path, node in hottest:
+                print(f"{path:<12} {node['count']:>10} {node['true']:>10} {node['false']:>10} "
+                      f"{node['steps']:>12}")
+    except (OSError, ValueError, KeyError, ProfileError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Source text of a statement AST.
+
+The inverse of the parser for the trees it builds: formatting a parsed
+program and parsing the text again gives the same tree.  The fuzzer
+prints its reproducers with it and the specializer its residual
+programs.
+"""
+
+from .parser import Assignment, IfElse, While, For, Read, Write, Number, Identifier
+
+
+def format_program(ast):
+    """Source text of a Program AST"""
+    lines = ["CONST"]
+    lines += [f"{decl.name} := {decl.value}" for decl in ast.const_decls]
+    lines += ["VAR", " ".join(decl.name for decl in ast.var_decls), "BEGIN"]
+    lines += _format_commands(ast.commands, 1)
+    lines.append("END")
+    return "\n".join(lines) + "\n"
+
+
+def _format_commands(commands, depth):
+    pad = "  " * depth
+    lines = []
+    for command in commands:
+        if isinstance(command, Assignment):
+            expr = command.expr
+            if isinstance(expr, Number):
+                text = str(expr.value)
+            elif isinstance(expr, Identifier):
+                text = expr.name
+            else:
+                text = f"{expr.left.name} {expr.op} {expr.right.name}"
+            lines.append(f"{pad}{command.name} := {text};")
+        elif isinstance(command, IfElse):
+            condition = command.condition
+            lines.append(f"{pad}IF {condition.left.name} {condition.op} {condition.right.name} THEN")
+            lines += _format_commands(command.then_cmds, depth + 1)
+            lines.append(f"{pad}ELSE")
+            lines += _format_commands(command.else_cmds, depth + 1)
+            lines.append(f"{pad}END")
+        elif isinstance(command, While):
+            condition = command.condition
+            lines.append(f"{pad}WHILE {condition.left.name} {condition.op} {condition.right.name} DO")
+            lines += _format_commands(command.commands, depth + 1)
+            lines.append(f"{pad}END")
+        elif isinstance(command, For):
+            start, end = (str(bound.value) if isinstance(bound, Number) else bound.name
+                          for bound in (command.start, command.end))
+            direction = "DOWNTO" if command.downto else "TO"
+            lines.append(f"{pad}FOR {command.iterator} FROM {start} {direction} {end} DO")
+            lines += _format_commands(command.commands, depth + 1)
+            lines.append(f"{pad}END")
+        elif isinstance(command, Read):
+            lines.append(f"{pad}READ {command.name};")
+        elif isinstance(command, Write):
+            lines.append(f"{pad}WRITE {command.name};")
+    return lines
@@ -0,0 +1,133 @@
+"""Single-pass scanner built on one compiled master regex.
+
+An alternative to the PLY lexer in compiler.lexer for large sources.  It
+produces the same token types and values and plugs into the parser the
+same way:
+
+    ast = parse(source, lexer=Scanner())
+
+The source may be a str, bytes or a memory-mapped file; the scanner works
+on bytes and only decodes names and operators, once per distinct
+spelling.  Tokens are produced lazily, so parsing a mapped file never
+holds all of its tokens.  Comments `(* ... *)` may span lines, and every
+token carries its line and column (both from 1) besides its offset.
+"""
+
+import mmap
+import re
+from contextlib import contextmanager
+
+from .lexer import reserved
+
+OPERATORS = {
+    ':=': 'ASSIGN', '+': 'PLUS', '-': 'MINUS', '*': 'TIMES', '/': 'DIVIDE', '%': 'MODULO',
+    '==': 'EQUAL', '!=': 'NOTEQUAL', '<': 'LESS', '>': 'GREATER', '<=': 'LESSEQUAL',
+    '>=': 'GREATEREQUAL', ';': 'SEMICOLON',
+}
+
+# Blanks are skipped in front of every token, and a newline takes the
+# indentation after it along; two-character operators come first
+TOKEN_RE = re.compile(rb"""
+    [ \t\r]*
+    (?:
+        (?P<name>[A-Za-z_][A-Za-z0-9_]*)
+      | (?P<op>:=|==|!=|<=|>=|[-+*/%<>;])
+      | (?P<number>[0-9]+)
+      | (?P<newline>\n[ \t\r\n]*)
+      | (?P<comment>\(\*.*?\*\))
+      | (?P<unterminated>\(\*)
+      | (?P<error>.)
+    )
+""", re.VERBOSE | re.DOTALL)
+NAME, OP, NUMBER, NEWLINE, COMMENT, UNTERMINATED = (
+    TOKEN_RE.groupindex[group] for group in ("name", "op", "number", "newline", "comment", "unterminated"))
+
+
+class Token:
+    """A token with the attributes the PLY parser reads; it sets lexer on errors"""
+
+    __slots__ = ("type", "value", "lineno", "column", "lexpos", "lexer")
+
+    def __init__(self, type, value, lineno, column, lexpos):
+        self.type = type
+        self.value = value
+        self.lineno = lineno
+        self.column = column
+        self.lexpos = lexpos
+
+    def __repr__(self):
+        return f"Token({self.type}, {self.value!r}, {self.lineno}:{self.column})"
+
+
+def _spelling(raw):
+    """(type, value) of a name or operator spelled as raw bytes"""
+    text = raw.decode('ascii')
+    if text in OPERATORS:
+        return OPERATORS[text], text
+    return reserved.get(text.lower(), 'IDENTIFIER'), text
+
+
+def scan(data):
+    """Yield the Tokens of a str, bytes or mmap source.
+
+    Illegal characters are reported and skipped like the PLY lexer does;
+    a comment left open runs to the end of the source.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    spellings = {}  # Raw bytes -> (type, value), so each spelling is decoded once
+    line, line_start = 1, 0
+
+    for match in TOKEN_RE.finditer(data):
+        kind = match.lastindex
+        if kind <= OP:
+            raw = match.group(kind)
+            start = match.start(kind)
+            spelling = spellings.get(raw)
+            if spelling is None:
+                spelling = spellings[raw] = _spelling(raw)
+            yield Token(spelling[0], spelling[1], line, start - line_start + 1, start)
+        elif kind == NUMBER:
+            start = match.start(kind)
+            yield Token('NUMBER', int(match.group(kind)), line, start - line_start + 1, start)
+        elif kind == NEWLINE or kind == COMMENT:
+            raw = match.group(kind)
+            newlines = raw.count(b'\n')
+            if newlines:
+                line += newlines
+                line_start = match.start(kind) + raw.rindex(b'\n') + 1
+        elif kind == UNTERMINATED:
+            print(f"Unterminated comment at line {line}, column {match.start(kind) - line_start + 1}")
+            return
+        else:
+            character = match.group(kind).decode('utf-8', 'replace')
+            print(f"Illegal character '{character}' at line {line}, column {match.start(kind) - line_start + 1}")
+
+
+class Scanner:
+    """Lexer object for parse(): tokens are pulled from scan() one at a time"""
+
+    def __init__(self):
+        self.tokens = iter(())
+
+    def input(self, data):
+        self.tokens = scan(data)
+
+    def token(self):
+        return next(self.tokens, None)
+
+    def clone(self):
+        return Scanner()
+
+
+@contextmanager
+def mapped(path):
+    """The contents of a file, memory-mapped; empty files give b''"""
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # An empty file cannot be mapped
+            yield b''
+            return
+        with data:
+            yield data
@@ -1,87 +1,111 @@
 from .parser import *
+from .visitor import Visitor
 
 
-class SemanticAnalyzer:
+class SemanticAnalyzer(Visitor):
     def __init__(self):
+        super().__init__()
         self.const_table = {}  # name -> value
         self.var_table = {}    # name -> address
         self.next_address = 0  # Memory allocation counter
+        self.iterators = []    # FOR iterators in declaration order, each named once
+        self.active = []       # Iterators of the FOR loops being checked, outermost first
         self.errors = []
 
     def analyze(self, ast):
+        self.declare(ast.const_decls, ast.var_decls)
+        # Check commands recursively
+        self._check_commands(ast.commands)
+
+        return len(self.errors) == 0, self.errors
+
+    def declare(self, const_decls, var_decls):
         # Process constant declarations
-        for const_decl in ast.const_decls:
+        for const_decl in const_decls:
             if const_decl.name in self.const_table or const_decl.name in self.var_table:
                 self.errors.append(f"Duplicate declaration of identifier '{const_decl.name}'")
             else:
                 self.const_table[const_decl.name] = const_decl.value
 
         # Process variable declarations
-        for var_decl in ast.var_decls:
+        for var_decl in var_decls:
             if var_decl.name in self.const_table or var_decl.name in self.var_table:
                 self.errors.append(f"Duplicate declaration of identifier '{var_decl.name}'")
             else:
                 self.var_table[var_decl.name] = self.next_address
                 self.next_address += 1
 
-        # Check commands recursively
-        self._check_commands(ast.commands)
-
-        return len(self.errors) == 0, self.errors
+    def check(self, command):
+        """Check one more top-level command after declare(); True if it has no errors"""
+        errors = len(self.errors)
+        self.dispatch[type(command)](command)
+        return len(self.errors) == errors
 
     def _check_commands(self, commands):
-        for cmd in commands:
-            self._check_command(cmd)
-
-    def _check_command(self, cmd):
-        if isinstance(cmd, Assignment):
-            # Check if the target variable exists
-            if cmd.name not in self.var_table:
-                self.errors.append(f"Assignment to undeclared variable '{cmd.name}'")
-            # Check the expression
-            self._check_expression(cmd.expr)
-
-        elif isinstance(cmd, IfElse):
-            self._check_condition(cmd.condition)
-            self._check_commands(cmd.then_cmds)
-            self._check_commands(cmd.else_cmds)
-
-        elif isinstance(cmd, While):
-            self._check_condition(cmd.condition)
-            self._check_commands(cmd.commands)
-
-        elif isinstance(cmd, Read):
-            if cmd.name not in self.var_table:
-                self.errors.append(f"READ into undeclared variable '{cmd.name}'")
-
-        elif isinstance(cmd, Write):
-            if cmd.name not in self.var_table and cmd.name not in self.const_table:
-                self.errors.append(f"WRITE undeclared identifier '{cmd.name}'")
-
-    def _check_expression(self, expr):
-        if isinstance(expr, Number):
-            # Numbers are always valid
-            pass
-
-        elif isinstance(expr, Identifier):
-            # Check if the identifier exists
-            if expr.name not in self.var_table and expr.name not in self.const_table:
-                self.errors.append(f"Reference to undeclared identifier '{expr.name}'")
-
-        elif isinstance(expr, BinOp):
-            # Check both operands
-            if isinstance(expr.left, Identifier):
-                if expr.left.name not in self.var_table and expr.left.name not in self.const_table:
-                    self.errors.append(f"Reference to undeclared identifier '{expr.left.name}'")
-
-            if isinstance(expr.right, Identifier):
-                if expr.right.name not in self.var_table and expr.right.name not in self.const_table:
-                    self.errors.append(f"Reference to undeclared identifier '{expr.right.name}'")
-
-    def _check_condition(self, condition):
-        # Check both sides of the condition
-        if condition.left.name not in self.var_table and condition.left.name not in self.const_table:
-            self.errors.append(f"Reference to undeclared identifier '{condition.left.name}'")
-
-        if condition.right.name not in self.var_table and condition.right.name not in self.const_table:
-            self.errors.append(f"Reference to undeclared identifier '{condition.right.name}'")
+        self.visit_all(commands)
+
+    def _is_declared(self, name):
+        return name in self.var_table or name in self.const_table or name in self.active
+
+    def visit_assignment(self, cmd):
+        # Check if the target variable exists
+        if cmd.name in self.active:
+            self.errors.append(f"Assignment to loop iterator '{cmd.name}'")
+        elif cmd.name not in self.var_table:
+            self.errors.append(f"Assignment to undeclared variable '{cmd.name}'")
+        # Check the expression
+        self.dispatch[type(cmd.expr)](cmd.expr)
+
+    def visit_if(self, cmd):
+        self.visit_condition(cmd.condition)
+        self._check_commands(cmd.then_cmds)
+        self._check_commands(cmd.else_cmds)
+
+    def visit_while(self, cmd):
+        self.visit_condition(cmd.condition)
+        self._check_commands(cmd.commands)
+
+    def visit_for(self, cmd):
+        # Bounds are evaluated before the iterator exists
+        self.visit(cmd.start)
+        self.visit(cmd.end)
+        if cmd.iterator in self.var_table or cmd.iterator in self.const_table:
+            self.errors.append(f"Loop iterator '{cmd.iterator}' shadows a declared identifier")
+        elif cmd.iterator in self.active:
+            self.errors.append(f"Loop iterator '{cmd.iterator}' is already the iterator of an enclosing loop")
+        elif cmd.iterator not in self.iterators:
+            self.iterators.append(cmd.iterator)
+        # The body may read the iterator but never assign it
+        self.active.append(cmd.iterator)
+        self._check_commands(cmd.commands)
+        self.active.pop()
+
+    def visit_read(self, cmd):
+        if cmd.name in self.active:
+            self.errors.append(f"READ into loop iterator '{cmd.name}'")
+        elif cmd.name not in self.var_table:
+            self.errors.append(f"READ into undeclared variable '{cmd.name}'")
+
+    def visit_write(self, cmd):
+        if not self._is_declared(cmd.name):
+            self.errors.append(f"WRITE undeclared identifier '{cmd.name}'")
+
+    def visit_number(self, expr):
+        # Numbers are always valid
+        pass
+
+    def visit_identifier(self, expr):
+        # Check if the identifier exists
+        if not self._is_declared(expr.name):
+            self.errors.append(f"Reference to undeclared identifier '{expr.name}'")
+
+    def visit_binop(self, expr):
+        # Both operands are identifiers; check them without dispatching
+        if not self._is_declared(expr.left.name):
+            self.errors.append(f"Reference to undeclared identifier '{expr.left.name}'")
+
+        if not self._is_declared(expr.right.name):
+            self.errors.append(f"Reference to undeclared identifier '{expr.right.name}'")
+
+    # Check both sides of the condition
+    visit_condition = visit_binop
@@ -0,0 +1,434 @@
+"""Partial evaluation of a program on inputs known at compile time.
+
+The specializer runs a program like the interpreter does, except that a
+value is either known (a Python integer) or only known at run time.
+Variables start known at 0 and CONSTs are known; a READ is known while
+there is a given input left for it.  Commands whose operands are all
+known are evaluated and disappear, an IF on a known condition is replaced
+by the branch it takes, and WHILE and FOR loops are unrolled for as long
+as their conditions stay known, which removes them when the trip count
+is known outright.  Everything else is kept in a residual program that
+the ordinary pipeline compiles:
+
+    specialization = specialize(ast, [10])
+    program, _ = CodeGenerator(analyzer_of(specialization.program)).generate(specialization.program)
+    VM(program, specialization.leftover + later_inputs).run()
+
+A known value is only stored into its variable when residual code reads
+it, so a program whose inputs are all given compiles to the assignments
+of the values it prints and their WRITEs.
+
+Residual code keeps the input order: once a READ sits in an IF or a loop
+that stays in the residual program, the number of values read before any
+later READ is only known at run time, so every later READ is left to run
+time as well, and the given inputs not used by then are `leftover`, to
+be passed first when the residual program runs.
+
+Unrolling is bounded: each loop emits at most max_unroll residual
+commands, the whole specialization evaluates at most max_steps commands,
+and values over max_bits are left to run time.  A loop that hits a bound
+continues as a residual loop from the state it reached.
+"""
+
+from collections import Counter
+
+from .interpreter import OPERATORS, RELATIONS
+from .parser import (Program, VarDecl, Assignment, IfElse, While, For, Read, Write, Number, Identifier, BinOp,
+                     Condition)
+from .printer import format_program
+from .visitor import Visitor
+
+NEGATED = {'==': '!=', '!=': '==', '<': '>=', '>=': '<', '>': '<=', '<=': '>'}
+
+
+class Effects(Visitor):
+    """Names a command list reads and writes, and whether it READs"""
+
+    def __init__(self):
+        super().__init__()
+        self.reads = set()
+        self.writes = set()
+        self.inputs = False
+
+    def visit_assignment(self, command):
+        self.writes.add(command.name)
+        self.visit(command.expr)
+
+    def visit_if(self, command):
+        self.visit(command.condition)
+        self.visit_all(command.then_cmds)
+        self.visit_all(command.else_cmds)
+
+    def visit_while(self, command):
+        self.visit(command.condition)
+        self.visit_all(command.commands)
+
+    def visit_for(self, command):
+        self.writes.add(command.iterator)
+        self.visit(command.start)
+        self.visit(command.end)
+        self.visit_all(command.commands)
+
+    def visit_read(self, command):
+        self.writes.add(command.name)
+        self.inputs = True
+
+    def visit_write(self, command):
+        self.reads.add(command.name)
+
+    def visit_number(self, expr):
+        pass
+
+    def visit_identifier(self, expr):
+        self.reads.add(expr.name)
+
+    def visit_binop(self, expr):
+        self.reads.add(expr.left.name)
+        self.reads.add(expr.right.name)
+
+    visit_condition = visit_binop
+
+
+def _label(command):
+    if isinstance(command, Assignment):
+        return f"{command.name} :="
+    if isinstance(command, (Read, Write)):
+        return f"{command.kind.upper()} {command.name}"
+    if isinstance(command, For):
+        return f"FOR {command.iterator}"
+    return command.kind.upper()
+
+
+def count_commands(commands):
+    """Commands in a list, nested bodies included"""
+    total = 0
+    for command in commands:
+        total += 1
+        if isinstance(command, IfElse):
+            total += count_commands(command.then_cmds) + count_commands(command.else_cmds)
+        elif isinstance(command, (While, For)):
+            total += count_commands(command.commands)
+    return total
+
+
+class Specialization:
+    """Result of specialize(): the residual program and what became of each command.
+
+    commands maps a command path (see ir.py) to its label and a Counter
+    of what happened to it, summed over every time it was specialized.
+    """
+
+    def __init__(self, program, consumed, leftover, commands, steps):
+        self.program = program
+        self.consumed = consumed
+        self.leftover = leftover
+        self.commands = commands
+        self.steps = steps
+
+    def count(self, action):
+        return sum(actions[action] for _, actions in self.commands.values())
+
+    def source(self):
+        return format_program(self.program)
+
+    def report(self):
+        given = self.consumed + len(self.leftover)
+        lines = [f"Specialized on {self.consumed} of {given} known inputs"
+                 + (f" ({len(self.leftover)} passed to the run)" if self.leftover else "")
+                 + f"; assignments evaluated: {self.count('evaluated')}, loops resolved: {self.count('resolved')}, "
+                 f"residual commands: {count_commands(self.program.commands)}"]
+        for path, (label, actions) in self.commands.items():
+            done = ", ".join(f"{action} ({count})" for action, count in actions.items())
+            lines.append(f"  {path:<12} {label:<14} {done}")
+        return "\n".join(lines)
+
+
+class Specializer(Visitor):
+    """Specialize a Program AST on a prefix of its inputs"""
+
+    prefix = "spec_"
+
+    def __init__(self, ast, input_data, max_steps=100000, max_unroll=256, max_bits=4096):
+        super().__init__()
+        self.ast = ast
+        self.input_data = list(input_data)
+        self.input_pos = 0
+        self.inputs_static = True  # Whether the next READ's input position is known
+        self.max_steps = max_steps
+        self.max_unroll = max_unroll
+        self.max_bits = max_bits
+        self.steps = 0
+
+        self.known = {decl.name: decl.value for decl in ast.const_decls}
+        self.known.update((decl.name, 0) for decl in ast.var_decls)
+        self.stale = set()  # Known names whose cells do not hold their known value
+        self.unrolled = set()  # Iterators of the FOR loops being unrolled
+        self.aliases = {}  # Iterator -> variable its value is stored in when residual code reads it
+        self.var_decls = list(ast.var_decls)
+        self.taken = {decl.name for decl in ast.const_decls + ast.var_decls}
+        self.taken.update(command.iterator for command in self._loops(ast.commands) if isinstance(command, For))
+        self.effects = {}  # id(command) -> Effects of an IF or loop
+        self.commands = {}
+        self.out = []
+
+    def run(self):
+        self.spec_commands(self.ast.commands, "")
+        program = Program(self.ast.const_decls, self.var_decls, self.out)
+        return Specialization(program, self.input_pos, self.input_data[self.input_pos:], self.commands, self.steps)
+
+    def _loops(self, commands):
+        for command in commands:
+            if isinstance(command, IfElse):
+                yield from self._loops(command.then_cmds)
+                yield from self._loops(command.else_cmds)
+            elif isinstance(command, (While, For)):
+                yield command
+                yield from self._loops(command.commands)
+
+    def record(self, path, action, count=1):
+        if count:
+            self.commands[path][1][action] += count
+
+    def spec_commands(self, commands, prefix):
+        dispatch, seen = self.dispatch, self.commands
+        for i, command in enumerate(commands):
+            self.steps += 1
+            path = f"{prefix}{i}"
+            if path not in seen:  # The report lists commands in source order
+                seen[path] = (_label(command), Counter())
+            dispatch[type(command)](command, path)
+
+    def generic_visit(self, node, *args):
+        raise TypeError(f"Cannot specialize {node!r}")
+
+    # Values
+
+    def value(self, expr):
+        """The known value of an expression, or None"""
+        if isinstance(expr, Number):
+            return expr.value
+        if isinstance(expr, Identifier):
+            return self.known.get(expr.name)
+        left, right = self.known.get(expr.left.name), self.known.get(expr.right.name)
+        if left is None or right is None:
+            return None
+        value = OPERATORS[expr.op](left, right)
+        return value if value.bit_length() <= self.max_bits else None
+
+    def test(self, condition):
+        left, right = self.known.get(condition.left.name), self.known.get(condition.right.name)
+        if left is None or right is None:
+            return None
+        return RELATIONS[condition.op](left, right)
+
+    def use(self, name):
+        """Name of the cell holding name's value for residual code, stored there first if needed"""
+        cell = self.alias(name) if name in self.unrolled else name
+        if name in self.stale:
+            self.out.append(Assignment(cell, Number(self.known[name])))
+            self.stale.discard(name)
+        return cell
+
+    def alias(self, iterator):
+        if iterator not in self.aliases:
+            self.aliases[iterator] = self.fresh(iterator)
+        return self.aliases[iterator]
+
+    def fresh(self, base):
+        """Declare a variable named after base that nothing else uses"""
+        number = 1
+        while f"{base}_{number}" in self.taken:
+            number += 1
+        name = f"{base}_{number}"
+        self.taken.add(name)
+        self.var_decls.append(VarDecl(name))
+        return name
+
+    def forget(self, name):
+        self.known.pop(name, None)
+        self.stale.discard(name)
+
+    def flush(self, names):
+        """Store the known values of names and treat them as run-time values from here"""
+        for name in sorted(names):
+            if name in self.known and name not in self.unrolled:
+                self.use(name)
+                self.forget(name)
+
+    def effects_of(self, command):
+        effects = self.effects.get(id(command))
+        if effects is None:
+            effects = self.effects[id(command)] = Effects()
+            effects.visit(command)
+        return effects
+
+    def residual_condition(self, condition):
+        left, right = self.use(condition.left.name), self.use(condition.right.name)
+        return Condition(Identifier(left), condition.op, Identifier(right))
+
+    def exhausted(self):
+        return self.steps >= self.max_steps
+
+    # Commands
+
+    def spec_assignment(self, command, path):
+        value = self.value(command.expr)
+        if value is not None:
+            self.known[command.name] = value
+            self.stale.add(command.name)
+            self.record(path, "evaluated")
+            return
+        expr = command.expr
+        if isinstance(expr, Identifier):
+            expr = Identifier(self.use(expr.name))
+        elif isinstance(expr, BinOp):
+            expr = BinOp(Identifier(self.use(expr.left.name)), expr.op, Identifier(self.use(expr.right.name)))
+        self.out.append(Assignment(command.name, expr))
+        self.forget(command.name)
+        self.record(path, "residual")
+
+    def spec_read(self, command, path):
+        if self.inputs_static and self.input_pos < len(self.input_data):
+            self.known[command.name] = self.input_data[self.input_pos]
+            self.stale.add(command.name)
+            self.input_pos += 1
+            self.record(path, "from input")
+            return
+        self.out.append(Read(command.name))
+        self.forget(command.name)
+        self.record(path, "residual")
+
+    def spec_write(self, command, path):
+        self.record(path, "constant" if command.name in self.known else "residual")
+        self.out.append(Write(self.use(command.name)))
+
+    def spec_if(self, command, path):
+        taken = self.test(command.condition)
+        if taken is not None:
+            self.record(path, "took THEN" if taken else "took ELSE")
+            if taken:
+                self.spec_commands(command.then_cmds, f"{path}.t")
+            else:
+                self.spec_commands(command.else_cmds, f"{path}.e")
+            return
+
+        self.record(path, "residual")
+        effects = self.effects_of(command)
+        if effects.inputs:
+            self.inputs_static = False
+        condition = self.residual_condition(command.condition)
+        out, entry = self.out, (dict(self.known), set(self.stale))
+
+        self.out = then_cmds = []
+        self.spec_commands(command.then_cmds, f"{path}.t")
+        then_state = (self.known, self.stale)
+        self.known, self.stale = dict(entry[0]), set(entry[1])
+        self.out = else_cmds = []
+        self.spec_commands(command.else_cmds, f"{path}.e")
+        else_state = (self.known, self.stale)
+
+        # After the join a name stays known only if both branches agree on it;
+        # a branch that knows a value the other does not stores it first
+        known, stale = {}, set()
+        for name in set(then_state[0]) | set(else_state[0]):
+            value = then_state[0].get(name)
+            if value is not None and value == else_state[0].get(name):
+                known[name] = value
+                if name in then_state[1] or name in else_state[1]:
+                    stale.add(name)
+        for branch, (branch_known, branch_stale) in ((then_cmds, then_state), (else_cmds, else_state)):
+            self.out, self.known, self.stale = branch, branch_known, branch_stale
+            self.flush(set(branch_known) - set(known))
+        self.out, self.known, self.stale = out, known, stale
+
+        if not then_cmds and not else_cmds:
+            return
+        if not then_cmds:  # The grammar has no empty branches
+            condition.op = NEGATED[condition.op]
+            then_cmds, else_cmds = else_cmds, []
+        self.out.append(IfElse(condition, then_cmds, else_cmds or [self.filler()]))
+
+    def filler(self):
+        """A command with no effect, for a residual body left empty"""
+        name = self.var_decls[0].name if self.var_decls else self.fresh("t")
+        return Assignment(name, Identifier(name))
+
+    def spec_while(self, command, path):
+        start, iterations = len(self.out), 0
+        while True:
+            taken = self.test(command.condition)
+            if taken is False:
+                self.record(path, "unrolled iterations", iterations)
+                self.record(path, "resolved")
+                return
+            if taken is None or self.exhausted() or len(self.out) - start > self.max_unroll:
+                break
+            self.steps += 1
+            iterations += 1
+            self.spec_commands(command.commands, f"{path}.b")
+
+        self.record(path, "unrolled iterations", iterations)
+        self.record(path, "residual")
+        effects = self.enter_loop(command)
+        condition = self.residual_condition(command.condition)
+        body = self.residual_body(command.commands, path, effects)
+        self.out.append(While(condition, body or [self.filler()]))
+
+    def spec_for(self, command, path):
+        start, end = self.value(command.start), self.value(command.end)
+        iterator = command.iterator
+        if start is not None and end is not None:
+            values = range(start, end - 1, -1) if command.downto else range(start, end + 1)
+            first, iterations = len(self.out), 0
+            self.unrolled.add(iterator)
+            for value in values:
+                if self.exhausted() or len(self.out) - first > self.max_unroll:
+                    start = value
+                    break
+                self.steps += 1
+                iterations += 1
+                self.known[iterator] = value
+                self.stale.add(iterator)
+                self.spec_commands(command.commands, f"{path}.b")
+            else:
+                start = None
+            self.unrolled.discard(iterator)
+            self.forget(iterator)
+            self.record(path, "unrolled iterations", iterations)
+            if start is None:
+                self.record(path, "resolved")
+                return
+
+        self.record(path, "residual")
+        # Known bounds become literals; the others are read from their cells
+        bounds = [Number(value) if value is not None else Identifier(self.use(bound.name))
+                  for bound, value in ((command.start, start), (command.end, end))]
+        effects = self.enter_loop(command)
+        body = self.residual_body(command.commands, path, effects)
+        if body:
+            self.out.append(For(iterator, bounds[0], bounds[1], command.downto, body))
+
+    def enter_loop(self, loop):
+        """Prepare the state for a residual loop: what its body writes is only known at run time"""
+        effects = self.effects_of(loop)
+        if effects.inputs:
+            self.inputs_static = False
+        for name in sorted(effects.reads | effects.writes):
+            if name in self.known:
+                self.use(name)
+        self.flush(effects.writes)
+        return effects
+
+    def residual_body(self, commands, path, effects):
+        """Specialize a loop body once for every iteration; the state after it is the state before"""
+        out, known, stale = self.out, dict(self.known), set(self.stale)
+        self.out = body = []
+        self.spec_commands(commands, f"{path}.b")
+        self.flush(effects.writes)
+        self.out, self.known, self.stale = out, known, stale
+        return body
+
+
+def specialize(ast, input_data, **limits):
+    """Specialize a Program AST on the given leading inputs; returns a Specialization"""
+    return Specializer(ast, input_data, **limits).run()
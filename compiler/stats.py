@@ -0,0 +1,167 @@
+"""Per-phase compiler statistics.
+
+CompileStats records, for every phase of the pipeline, wall time, CPU
+time, peak memory and item counts.  Phases nest: the optimization passes
+and the lowering stages of CodeGenerator appear under "codegen".  Peak
+memory is the most memory tracemalloc saw allocated above the level at
+the start of the phase.
+
+    stats = CompileStats()
+    program = compile_source(source, stats=stats)
+    print(stats.report())
+
+A disabled CompileStats costs nothing, so the pipeline can always be
+written against one.
+"""
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from .parser import parse, Node
+from .scanner import Scanner, scan
+from .semantic import SemanticAnalyzer
+
+
+class PhaseRecord:
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_memory = None  # Bytes, None without tracemalloc
+        self.counts = {}
+
+    def to_dict(self):
+        return {"name": self.name, "depth": self.depth, "wall": self.wall, "cpu": self.cpu,
+                "peak_memory": self.peak_memory, "counts": self.counts}
+
+
+class CompileStats:
+    """Records of every phase in the order they started"""
+
+    def __init__(self, enabled=True, memory=True):
+        self.enabled = enabled
+        self.memory = memory
+        self.records = []
+        self._active = []  # [(record, memory at start, highest peak seen by nested phases)]
+
+    @contextmanager
+    def phase(self, name):
+        """Time a phase; the body fills the yielded dict with item counts"""
+        if not self.enabled:
+            yield {}
+            return
+
+        record = PhaseRecord(name, len(self._active))
+        self.records.append(record)
+        started_tracing = self.memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.memory:
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+        else:
+            current = 0
+        self._active.append([record, current, current])
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record.counts
+        finally:
+            record.wall = time.perf_counter() - wall
+            record.cpu = time.process_time() - cpu
+            _, start, peak = self._active.pop()
+            if self.memory:
+                # Nested phases reset the peak, so take theirs into account
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record.peak_memory = peak - start
+                if self._active:
+                    self._active[-1][2] = max(self._active[-1][2], peak)
+            if started_tracing:
+                tracemalloc.stop()
+
+    def __getitem__(self, name):
+        for record in self.records:
+            if record.name == name:
+                return record
+        raise KeyError(name)
+
+    def to_dict(self):
+        return {"phases": [record.to_dict() for record in self.records]}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1)
+
+    def report(self):
+        lines = [f"{'phase':<20} {'wall ms':>9} {'cpu ms':>9} {'peak KiB':>9}  counts"]
+        for record in self.records:
+            name = "  " * record.depth + record.name
+            peak = f"{record.peak_memory / 1024:.1f}" if record.peak_memory is not None else "-"
+            counts = ", ".join(f"{key}={value}" for key, value in record.counts.items())
+            lines.append(f"{name:<20} {record.wall * 1000:>9.2f} {record.cpu * 1000:>9.2f} {peak:>9}  {counts}")
+        return "\n".join(lines)
+
+
+class TokenStream:
+    """Replays tokens lexed up front, so parsing can be timed on its own"""
+
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+
+    def input(self, data):
+        pass
+
+    def token(self):
+        return next(self.tokens, None)
+
+
+def tokenize(source):
+    return list(scan(source))
+
+
+def count_nodes(node):
+    """Number of AST nodes under (and including) node"""
+    if isinstance(node, list):
+        return sum(count_nodes(item) for item in node)
+    if not isinstance(node, Node):
+        return 0
+    return 1 + sum(count_nodes(value) for _, value in node.fields())
+
+
+def parse_source(source, stats):
+    """Lex and parse as two phases; without stats tokens stream into the parser.
+
+    source may be a str, bytes or a memory-mapped file.
+    """
+    if not stats.enabled:
+        return parse(source, lexer=Scanner())
+    with stats.phase("lex") as counts:
+        tokens = tokenize(source)
+        counts["tokens"] = len(tokens)
+    with stats.phase("parse") as counts:
+        ast = parse(source, lexer=TokenStream(tokens))
+        counts["nodes"] = count_nodes(ast)
+    return ast
+
+
+def analyze_source(ast, stats):
+    with stats.phase("semantic") as counts:
+        analyzer = SemanticAnalyzer()
+        is_valid, errors = analyzer.analyze(ast)
+        counts["symbols"] = len(ast.const_decls) + len(ast.var_decls)
+    if not is_valid:
+        raise Exception(f"Semantic errors: {errors}")
+    return analyzer
+
+
+def compile_source(source, opt_level=1, profile=None, stats=None):
+    """Compile source to a Code, recording phases in stats"""
+    from .codegen import CodeGenerator
+
+    stats = stats if stats is not None else CompileStats(enabled=False)
+    ast = parse_source(source, stats)
+    analyzer = analyze_source(ast, stats)
+    program, _ = CodeGenerator(analyzer, opt_level=opt_level, profile=profile, stats=stats).generate(ast)
+    return program
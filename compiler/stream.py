@@ -0,0 +1,112 @@
+"""Streaming compilation: each top-level command is compiled as it is parsed.
+
+The parser hands a StreamCompiler the declarations as soon as BEGIN is
+read and then every top-level command the moment it is reduced (see
+parser.parse's listener).  The declarations fix the allocation, like in
+compiler.incremental, so each command is checked, compiled into a
+fragment, linked at the current end of the program and written out
+before the next one is parsed.  Labels only live inside the command
+being compiled, which resolves its own IF, WHILE and FOR jumps.
+
+What outlives a command is the symbol table, the output position and a
+bounded cache of the fragments of recent commands (generated programs
+repeat themselves), so memory stays flat however long the program is:
+
+    with scanner.mapped("huge.gbl") as source:
+        counts = compile_stream(source, "huge.out")
+
+The code is what IncrementalCompiler produces: no optimization crosses a
+command boundary, and only -O0 and -O1 are supported.  Output goes to a
+temporary file next to the destination, which replaces it only once the
+whole program compiled.
+"""
+
+import os
+import tempfile
+
+from .incremental import FragmentGenerator, command_key
+from .machine import Code, CodeWriter
+from .parser import parse, Program
+from .scanner import Scanner
+from .semantic import SemanticAnalyzer
+
+
+class StreamError(Exception):
+    pass
+
+
+class StreamCompiler:
+    """Parse listener that compiles every top-level command into a CodeWriter"""
+
+    def __init__(self, writer, opt_level=1, target=None, cache_size=256):
+        if opt_level not in (0, 1):
+            raise ValueError(f"Streaming compilation supports -O0 and -O1, not -O{opt_level}")
+        self.writer = writer
+        self.opt_level = opt_level
+        self.target = target
+        self.analyzer = SemanticAnalyzer()
+        self.addresses = {}  # Symbol -> cell, shared by every fragment
+        self.const_decls = self.var_decls = None
+        self.fragments = {}  # command_key -> Fragment, least recently used first
+        self.cache_size = cache_size
+        self.length = 0  # Instructions written so far
+        self.commands = 0
+
+    def generator(self):
+        return FragmentGenerator(self.analyzer, self.opt_level, self.addresses, self.target)
+
+    def declare(self, const_decls, var_decls):
+        self.analyzer.declare(const_decls, var_decls)
+        self.const_decls, self.var_decls = const_decls, var_decls
+        if not self.analyzer.errors:
+            code, _ = self.generator().generate(Program(const_decls, var_decls, []))
+            self.emit(code[:-1])  # Everything but the HALT
+
+    def command(self, command):
+        self.commands += 1
+        self.analyzer.check(command)
+        # After the first error the rest of the program is only checked
+        if not self.analyzer.errors:
+            self.emit(self.fragment(command).link(self.length, self.addresses))
+
+    def fragment(self, command):
+        key = command_key(command)
+        fragment = self.fragments.pop(key, None)
+        if fragment is None:
+            fragment = self.generator().fragment(Program(self.const_decls, self.var_decls, [command]))
+            if len(self.fragments) >= self.cache_size:
+                del self.fragments[next(iter(self.fragments))]
+        self.fragments[key] = fragment
+        return fragment
+
+    def finish(self):
+        code = Code()
+        code.append("HALT")
+        self.emit(code)
+
+    def emit(self, code):
+        self.writer.write(code)
+        self.length += len(code)
+
+
+def compile_stream(source, path, opt_level=1, target=None, binary=False):
+    """Compile a str, bytes or mmap source into the program file at path.
+
+    Returns the number of top-level commands and of instructions written;
+    raises StreamError, leaving path untouched, if the program is invalid.
+    """
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".partial")
+    os.close(fd)
+    try:
+        with CodeWriter(partial, binary=binary) as writer:
+            compiler = StreamCompiler(writer, opt_level, target)
+            if parse(source, lexer=Scanner(), listener=compiler) is None:
+                raise StreamError("Syntax error")
+            if compiler.analyzer.errors:
+                raise StreamError(f"Semantic errors: {compiler.analyzer.errors}")
+            compiler.finish()
+        os.replace(partial, path)
+    except BaseException:
+        os.remove(partial)
+        raise
+    return {"commands": compiler.commands, "instructions": compiler.length}
@@ -0,0 +1,130 @@
+"""Machine descriptions: what every instruction costs on a target machine.
+
+The VM charges steps from a Target and the compiler makes its choices
+against the same one: which cells count as fast when allocating and
+promoting, which way of materializing a constant is cheapest, whether a
+literal is worth a cell.  Memory is split into tiers starting at address
+0, each with the latency LOAD, STORE, ADD and SUB pay for an address in
+it; every other opcode has a fixed cost.
+
+Targets are plain JSON, so a new machine needs no code changes:
+
+    {"name": "wide", "tiers": [[8, 10], [null, 100]], "costs": {"SCAN": 50}}
+
+`tiers` lists (cells, latency) pairs, the last one's size null to cover
+the rest of memory; `costs` overrides the per-opcode costs of DEFAULT.
+"""
+
+import json
+
+from .machine import OPCODE, OPCODES, MEMORY_SIZE
+
+# Opcodes whose cost is the latency of the cell they address
+TIERED_OPS = ("LOAD", "STORE", "ADD", "SUB")
+
+OP_COSTS = {
+    "HALT": 0, "ZERO": 1, "INC": 1, "DEC": 1, "SHL": 1, "SHR": 1,
+    "SCAN": 100, "PRINT": 100, "JUMP": 1, "JZ": 1, "JG": 1, "JODD": 1,
+}
+
+
+class TargetError(ValueError):
+    pass
+
+
+class Target:
+    """Per-opcode costs, memory size and memory-tier latencies of a machine"""
+
+    def __init__(self, name="default", tiers=((3, 10), (None, 100)), costs=None, memory_size=MEMORY_SIZE):
+        if not tiers or any(size is None for size, _ in tiers[:-1]):
+            raise TargetError("Only the last memory tier may be unbounded")
+        unknown = set(costs or ()) - set(OP_COSTS)
+        if unknown:
+            raise TargetError(f"No fixed cost for {', '.join(sorted(unknown))}")
+
+        self.name = name
+        self.tiers = [(size, latency) for size, latency in tiers]
+        self.costs = dict(OP_COSTS, **(costs or {}))
+        self.memory_size = memory_size
+
+        # Latency of every address, so lookups stay a list index
+        self.latencies = []
+        for size, latency in self.tiers:
+            cells = memory_size - len(self.latencies) if size is None else size
+            self.latencies.extend([latency] * cells)
+        self.latencies = self.latencies[:memory_size]
+        self.latencies.extend([self.tiers[-1][1]] * (memory_size - len(self.latencies)))
+
+    @property
+    def fast_cells(self):
+        """Size of the first memory tier"""
+        size = self.tiers[0][0]
+        return self.memory_size if size is None else min(size, self.memory_size)
+
+    def memory_cost(self, address):
+        """Steps taken by a LOAD, STORE, ADD or SUB at the given address"""
+        if 0 <= address < len(self.latencies):
+            return self.latencies[address]
+        return self.tiers[-1][1]
+
+    def instruction_cost(self, op, arg):
+        """Steps charged for one instruction, op given by name"""
+        if op in TIERED_OPS:
+            return self.memory_cost(arg)
+        return self.costs[op]
+
+    def sequence_cost(self, ops):
+        return sum(self.instruction_cost(op, arg) for op, arg in ops)
+
+    def code_costs(self, code):
+        """Cost of every instruction of a Code, for the VM's accounting.
+
+        Opcodes the machine does not know cost nothing; the VM stops on them.
+        """
+        tiered = {OPCODE[name] for name in TIERED_OPS}
+        fixed = [self.costs.get(name, 0) for name in OPCODES]
+        return [self.memory_cost(arg) if op in tiered else fixed[op] if op < len(fixed) else 0
+                for op, arg in zip(code.ops, code.args)]
+
+    def to_dict(self):
+        changed = {op: cost for op, cost in self.costs.items() if OP_COSTS[op] != cost}
+        data = {"name": self.name, "tiers": [list(tier) for tier in self.tiers], "costs": changed}
+        if self.memory_size != MEMORY_SIZE:
+            data["memory_size"] = self.memory_size
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        try:
+            return cls(data.get("name", "custom"), [tuple(tier) for tier in data["tiers"]],
+                       data.get("costs"), data.get("memory_size", MEMORY_SIZE))
+        except (KeyError, TypeError, ValueError) as e:
+            raise TargetError(f"Bad target description: {e}") from e
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def __repr__(self):
+        return f"Target({self.name!r}, tiers={self.tiers})"
+
+
+# The machine of the assignment: p[0..2] cost 10 steps, the rest 100
+DEFAULT = Target()
+
+TARGETS = {"default": DEFAULT}
+
+
+def get_target(spec):
+    """A registered target by name, or one loaded from a JSON file"""
+    if spec is None:
+        return DEFAULT
+    if spec in TARGETS:
+        return TARGETS[spec]
+    try:
+        return Target.load(spec)
+    except OSError as e:
+        raise TargetError(f"No target named {spec!r} and no file to load it from: {e}") from e
+    except json.JSONDecodeError as e:
+        raise TargetError(f"{spec} is not JSON: {e}") from e
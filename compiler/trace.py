@@ -0,0 +1,370 @@
+"""Binary execution traces of the VM.
+
+A TraceRecorder passed to VM(trace=...) records one fixed-size record per
+executed instruction: its address (pc), opcode, the accumulator before it
+runs and the cell it touches.  For SCAN the touched value is the number
+read and for PRINT the number printed; memory and jump instructions
+record their argument.  Values that do not fit in 64 bits keep their low
+64 bits and set TRUNCATED in the opcode byte.
+
+Records go to preallocated arrays the VM fills in place.  With a path the
+recorder writes them out every `capacity` records; without one the arrays
+are a ring buffer that keeps the last `capacity` records, to be saved
+after a failure.  `sample=n` keeps every n-th instruction only.
+
+    recorder = TraceRecorder(capacity=1 << 20)
+    try:
+        VM(program, inputs, trace=recorder).run()
+    finally:
+        recorder.save("last.trace")
+
+`python -m compiler.trace` shows, replays, diffs and summarizes traces.
+"""
+
+import argparse
+import struct
+import sys
+from array import array
+from collections import Counter
+
+from .machine import OPCODE, OPCODES, NO_ARG, load
+
+MAGIC = b"GBLT"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<4sBIQ")  # magic, version, sample, index of the first record
+_CHUNK = struct.Struct("<I")       # records in the chunk that follows
+
+TRUNCATED = 0x80
+MASK = (1 << 64) - 1
+RECORD_SIZE = 4 + 1 + 8 + 8  # Bytes per record in a file
+
+
+class TraceError(Exception):
+    pass
+
+
+class Record:
+    __slots__ = ("index", "pc", "op", "a", "x", "truncated")
+
+    def __init__(self, index, pc, op, a, x):
+        self.index = index
+        self.pc = pc
+        self.op = OPCODES[op & ~TRUNCATED]
+        self.a = a
+        self.x = x
+        self.truncated = bool(op & TRUNCATED)
+
+    def __eq__(self, other):
+        return (self.pc, self.op, self.a, self.x) == (other.pc, other.op, other.a, other.x)
+
+    def __str__(self):
+        if self.op in ("SCAN", "PRINT"):
+            x = f" value={self.x}"
+        else:
+            x = "" if self.x == NO_ARG else f" {self.x}"
+        mark = " (truncated)" if self.truncated else ""
+        return f"{self.index:>10}  [{self.pc}] {self.op}{x}  a={self.a}{mark}"
+
+
+class Trace:
+    """Records read back from a recorder or a file, in execution order"""
+
+    def __init__(self, pcs, ops, accumulators, touched, sample=1, first=0):
+        self.pcs = pcs
+        self.ops = ops
+        self.accumulators = accumulators
+        self.touched = touched
+        self.sample = sample
+        self.first = first  # Instructions executed before the first record
+
+    def __len__(self):
+        return len(self.pcs)
+
+    def __getitem__(self, i):
+        return Record(self.first + i * self.sample, self.pcs[i], self.ops[i], self.accumulators[i], self.touched[i])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def position(self, instruction):
+        """Record of the given instruction number"""
+        return (instruction - self.first) // self.sample
+
+    def inputs(self):
+        """Values read by SCAN, in order"""
+        scan = OPCODE["SCAN"]
+        return [self.touched[i] for i, op in enumerate(self.ops) if op & ~TRUNCATED == scan]
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise TraceError(f"{path} is not a trace")
+        magic, version, sample, first = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise TraceError(f"{path} is not a trace of a supported version")
+        columns = _empty_columns()
+        offset = _HEADER.size
+        while offset < len(data):
+            (count,) = _CHUNK.unpack_from(data, offset)
+            offset += _CHUNK.size
+            for column in columns:
+                size = getattr(column, "itemsize", 1) * count
+                if offset + size > len(data):
+                    raise TraceError(f"{path} is truncated")
+                _from_little_endian(column, data[offset:offset + size])
+                offset += size
+        return cls(*columns, sample=sample, first=first)
+
+
+def _empty_columns():
+    return array('I'), bytearray(), array('Q'), array('q')
+
+
+def _from_little_endian(column, data):
+    if isinstance(column, bytearray):
+        column += data
+        return
+    chunk = array(column.typecode)
+    chunk.frombytes(data)
+    if sys.byteorder == "big":
+        chunk.byteswap()
+    column += chunk
+
+
+def _to_little_endian(column):
+    if isinstance(column, bytearray):
+        return bytes(column)
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+class TraceRecorder:
+    """Buffers the VM writes records into.
+
+    To keep recording cheap the VM stores only each record's pc and
+    accumulator, plus the value of SCAN and PRINT records in `touched`;
+    the opcode and the touched address come from the program when records
+    are written out.  The VM keeps the fill position in `n`, calls full()
+    before storing into full buffers, and counts down the instructions
+    until the next sampled one in `skip`.
+    """
+
+    def __init__(self, path=None, capacity=1 << 16, sample=1):
+        if capacity < 1 or sample < 1:
+            raise ValueError("Trace capacity and sample must be positive")
+        self.capacity = capacity
+        self.sample = sample
+        self.program = None  # Set by the VM
+        self.pcs = array('I', bytes(4 * capacity))
+        self.accumulators = array('Q', bytes(8 * capacity))
+        self.touched = array('q', bytes(8 * capacity))
+        self.n = 0
+        self.skip = 0
+        self.laps = 0  # Times the buffers filled up
+        self.wide = set()  # Numbers of the records holding truncated values
+        self.file = None
+        if path is not None:
+            self.file = open(path, 'wb')
+            self.file.write(_HEADER.pack(MAGIC, FORMAT_VERSION, sample, 0))
+
+    def widen(self, index):
+        """Mark the record at buffer index as truncated"""
+        self.wide.add(self.laps * self.capacity + index)
+
+    def full(self):
+        """Make room in full buffers; returns the new fill position"""
+        if self.file is not None:
+            self._write_chunk(self.file, self._records(0, self.capacity))
+            self.wide.clear()
+        else:
+            # The records of the previous lap are about to be overwritten
+            self.wide = {number for number in self.wide if number >= self.laps * self.capacity}
+        self.laps += 1
+        return 0
+
+    def _records(self, start, stop):
+        """Columns of the records in buffer positions start to stop"""
+        if self.program is None:
+            raise TraceError("The recorder has not been attached to a VM")
+        program_ops, program_args = self.program.ops, self.program.args
+        pcs = self.pcs[start:stop]
+        ops = bytearray(map(program_ops.__getitem__, pcs))
+        touched = array('q', map(program_args.__getitem__, pcs))
+        for io in (OPCODE["SCAN"], OPCODE["PRINT"]):
+            j = ops.find(io)
+            while j >= 0:
+                touched[j] = self.touched[start + j]
+                j = ops.find(io, j + 1)
+        base = self.laps * self.capacity
+        for number in self.wide:
+            if base + start <= number < base + stop:
+                ops[number - base - start] |= TRUNCATED
+        return pcs, ops, self.accumulators[start:stop], touched
+
+    @staticmethod
+    def _write_chunk(f, columns):
+        f.write(_CHUNK.pack(len(columns[0])))
+        for column in columns:
+            f.write(_to_little_endian(column))
+
+    def close(self):
+        """Write what is left to the trace file"""
+        if self.file is not None:
+            if self.n:
+                self._write_chunk(self.file, self._records(0, self.n))
+            self.file.close()
+            self.file = None
+            self.n = 0
+
+    def trace(self):
+        """The records held in memory as a Trace, oldest first"""
+        n = self.n
+        if not self.laps:
+            return Trace(*self._records(0, n), sample=self.sample)
+        # The oldest records are those of the previous lap after n
+        self.laps -= 1
+        try:
+            older = self._records(n, self.capacity)
+        finally:
+            self.laps += 1
+        newer = self._records(0, n)
+        first = ((self.laps - 1) * self.capacity + n) * self.sample
+        return Trace(*(old + new for old, new in zip(older, newer)), sample=self.sample, first=first)
+
+    def save(self, path):
+        """Write the records held in memory, oldest first, as a trace file"""
+        trace = self.trace()
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, self.sample, trace.first))
+            self._write_chunk(f, (trace.pcs, trace.ops, trace.accumulators, trace.touched))
+
+
+def first_divergence(left, right):
+    """Number of the first instruction both traces recorded differently, or None.
+
+    Only the instructions both traces cover are compared; a trace that
+    ends early diverges where it ends.
+    """
+    sample = left.sample
+    if right.sample != sample or (left.first - right.first) % sample:
+        raise TraceError("The traces were not sampled alike")
+    start = max(left.first, right.first)
+    i, j = left.position(start), right.position(start)
+    count = min(len(left) - i, len(right) - j)
+    if count < 0:
+        raise TraceError("The traces do not overlap")
+
+    columns = [(getattr(left, name), getattr(right, name)) for name in ("pcs", "ops", "accumulators", "touched")]
+    if all(ours[i:i + count] == theirs[j:j + count] for ours, theirs in columns):
+        if len(left) - i == len(right) - j:
+            return None
+        return start + count * sample
+    for offset in range(count):
+        if any(ours[i + offset] != theirs[j + offset] for ours, theirs in columns):
+            return start + offset * sample
+
+
+def replay(trace, program):
+    """Run program on the inputs the trace read and return its own trace of the same length"""
+    import asyncio
+    from vm import VM
+
+    if trace.sample != 1 or trace.first != 0:
+        raise TraceError("Replay needs an unsampled trace from the first instruction")
+    scan = OPCODE["SCAN"]
+    if any(op == scan | TRUNCATED for op in trace.ops):
+        raise TraceError("The trace read values wider than 64 bits, so its inputs are lost")
+    recorder = TraceRecorder(capacity=max(len(trace), 1))
+    vm = VM(program, trace.inputs(), quiet=True, trace=recorder, max_instructions=len(trace))
+    try:
+        # Without a source SCAN fails instead of asking once the inputs run out
+        asyncio.run(vm.run_async())
+    except RuntimeError:
+        pass  # Out of recorded instructions or inputs
+    return recorder.trace()
+
+
+def hot_loops(trace, top=10):
+    """[(header, latch, iterations, instructions)] of the loops taking most instructions.
+
+    A loop is a backward transfer from latch to header between consecutive
+    records; its instructions are the records between two iterations.
+    """
+    if trace.sample != 1:
+        raise TraceError("Hot loops need an unsampled trace")
+    iterations, instructions = Counter(), Counter()
+    last_entry = {}
+    pcs = trace.pcs
+    for i in range(1, len(pcs)):
+        if pcs[i] <= pcs[i - 1]:
+            loop = (pcs[i], pcs[i - 1])
+            iterations[loop] += 1
+            if loop in last_entry:
+                instructions[loop] += i - last_entry[loop]
+            last_entry[loop] = i
+    return [(header, latch, count, instructions[(header, latch)])
+            for (header, latch), count in sorted(iterations.items(), key=lambda item: -instructions[item[0]])[:top]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect VM execution traces')
+    commands = parser.add_subparsers(dest='command', required=True)
+    show = commands.add_parser('show', help='Print trace records')
+    show.add_argument('trace')
+    show.add_argument('--start', type=int, default=0, help='First record to print')
+    show.add_argument('--count', type=int, default=50, help='Records to print')
+    check = commands.add_parser('replay', help='Run the program on the recorded inputs and compare')
+    check.add_argument('trace')
+    check.add_argument('program', help='Compiled program, text or binary')
+    check.add_argument('--context', type=int, default=3, help='Records to print before the divergence')
+    diff = commands.add_parser('diff', help='Find the first instruction two traces recorded differently')
+    diff.add_argument('left')
+    diff.add_argument('right')
+    diff.add_argument('--context', type=int, default=3, help='Records to print before the divergence')
+    hot = commands.add_parser('hot', help='Summarize the loops that executed the most instructions')
+    hot.add_argument('trace')
+    hot.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'show':
+            trace = Trace.load(args.trace)
+            print(f"{len(trace)} records, every {trace.sample} instruction(s) from instruction {trace.first}")
+            for i in range(args.start, min(len(trace), args.start + args.count)):
+                print(trace[i])
+            return 0
+
+        if args.command == 'hot':
+            trace = Trace.load(args.trace)
+            print(f"{'header':>8} {'latch':>8} {'iterations':>11} {'instructions':>13} {'share':>7}")
+            for header, latch, iterations, instructions in hot_loops(trace, args.top):
+                print(f"{header:>8} {latch:>8} {iterations:>11} {instructions:>13} "
+                      f"{instructions / len(trace):>7.1%}")
+            return 0
+
+        if args.command == 'replay':
+            left = Trace.load(args.trace)
+            right = replay(left, load(args.program))
+        else:
+            left, right = Trace.load(args.left), Trace.load(args.right)
+        instruction = first_divergence(left, right)
+        if instruction is None:
+            print("No divergence where the traces overlap")
+            return 0
+        print(f"First divergence at instruction {instruction}")
+        for number in range(instruction - args.context * left.sample, instruction + 1, left.sample):
+            for name, trace in (("<", left), (">", right)):
+                if 0 <= trace.position(number) < len(trace):
+                    print(f"{name} {trace[trace.position(number)]}")
+        return 1
+    except (OSError, ValueError, TraceError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
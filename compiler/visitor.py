@@ -0,0 +1,59 @@
+"""Type-dispatched walks over the statement AST.
+
+A Visitor subclass handles a kind of node with a method named after the
+node class's `kind` tag: visit_assignment for Assignment, visit_if for
+IfElse and so on.  Handler names are resolved once per Visitor class and
+bound once per instance, so visiting a node is one dict lookup on its
+type instead of a chain of isinstance tests:
+
+    class Writes(Visitor):
+        def __init__(self):
+            super().__init__()
+            self.names = []
+
+        def visit_write(self, node):
+            self.names.append(node.name)
+
+Handlers get the node and any extra arguments given to visit().  A
+subclass may change `prefix` to keep its own naming (the interpreter's
+handlers are exec_*).
+"""
+
+from .parser import NODE_TYPES
+
+
+class Visitor:
+    prefix = "visit_"
+    handlers = {}  # Node class -> handler method name, per subclass
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.handlers = {node_type: cls.prefix + node_type.kind for node_type in NODE_TYPES
+                        if hasattr(cls, cls.prefix + node_type.kind)}
+
+    def __init__(self):
+        # Node class -> bound handler, generic_visit for the kinds without
+        # one; hot loops index it directly instead of calling visit()
+        generic = self.generic_visit
+        self.dispatch = {node_type: getattr(self, self.handlers[node_type]) if node_type in self.handlers
+                         else generic for node_type in NODE_TYPES}
+
+    def visit(self, node, *args):
+        try:
+            handler = self.dispatch[type(node)]
+        except KeyError:
+            return self.generic_visit(node, *args)
+        return handler(node, *args)
+
+    def visit_all(self, nodes, *args):
+        dispatch = self.dispatch
+        if args:
+            for node in nodes:
+                dispatch[type(node)](node, *args)
+        else:  # A plain call is cheaper than unpacking no arguments
+            for node in nodes:
+                dispatch[type(node)](node)
+
+    def generic_visit(self, node, *args):
+        """Called for node types without a handler"""
+        raise TypeError(f"{type(self).__name__} cannot visit {node!r}")
@@ -1,12 +1,63 @@
+import os
 import sys
 import argparse
-from compiler.lexer import lexer
-from compiler.parser import parse
-from compiler.semantic import SemanticAnalyzer
 from compiler.codegen import CodeGenerator
+from compiler.stats import CompileStats, parse_source, analyze_source
+from compiler import pgo, costs, machine, scanner
+from compiler.cache import ResultCache, cached_run, replay_output
+from compiler.specialize import specialize
+from compiler.stream import compile_stream
+from compiler.target import get_target
+from compiler.trace import TraceRecorder
 from vm import VM
 
 
+def read_input(path):
+    if not path:
+        return []
+    with open(path, 'r') as f:
+        return [int(line.strip()) for line in f]
+
+
+def stream(args, stats):
+    """--stream: compile straight into the output file, then optionally run it"""
+    unsupported = [flag for flag, value in (("-Os", args.opt_level == 's'), ("--dump-ir", args.dump_ir),
+                                            ("--profile-out", args.profile_out), ("--profile-use", args.profile_use),
+                                            ("--annotate", args.annotate), ("--cost-report", args.cost_report),
+                                            ("--trace", args.trace), ("--specialize", args.specialize)) if value]
+    if unsupported:
+        raise Exception(f"--stream cannot be combined with {', '.join(unsupported)}")
+    if not args.output:
+        raise Exception("--stream needs --output")
+
+    target = get_target(args.target)
+    with stats.phase("stream") as counts, scanner.mapped(args.file) as source:
+        counts.update(compile_stream(source, args.output, int(args.opt_level), target, binary=args.binary))
+    if args.verbose:
+        print(f"Compilation successful. Generated {counts['instructions']} instructions.")
+
+    if args.run:
+        with stats.phase("vm") as counts:
+            program, input_data = machine.load(args.output), read_input(args.input)
+            if args.cache:
+                cache = ResultCache(args.cache)
+                result, _ = cached_run(cache, program, input_data, target, verified=True)
+            else:
+                result = VM(program, input_data, verified=True, target=target).run()
+            counts["instructions"] = result["instructions"]
+            counts["steps"] = result["steps"]
+        print("Program output:")
+        for value in result["output"]:
+            print(value)
+        if args.verbose:
+            print(f"\nExecution statistics:")
+            print(f"Instructions executed: {result['instructions']}")
+            print(f"Steps executed: {result['steps']}")
+            if args.cache:
+                print(cache.report())
+    return 0
+
+
 def main():
     parser = argparse.ArgumentParser(description='Compiler for a simple imperative language')
     parser.add_argument('file', help='Source file to compile')
@@ -14,44 +65,186 @@ def main():
     parser.add_argument('--run', '-r', action='store_true', help='Run the program after compilation')
     parser.add_argument('--input', '-i', help='Input file for program execution', default=None)
     parser.add_argument('--verbose', '-v', action='store_true', help='Verbose mode')
+    parser.add_argument('-O', dest='opt_level', choices=['0', '1', 's'], default='1',
+                        help='Optimization level: 0 disables LICM and CSE, s shares one copy of '
+                             'each arithmetic routine to shrink code (default: 1)')
+    parser.add_argument('--dump-ir', action='store_true', help='Print the IR after optimization passes')
+    parser.add_argument('--profile-out', metavar='FILE',
+                        help='Record execution counts of the run in FILE, adding to the counts already there')
+    parser.add_argument('--profile-use', metavar='FILE',
+                        help='Optimize with execution counts recorded by --profile-out')
+    parser.add_argument('--annotate', action='store_true',
+                        help='Write each instruction\'s step cost and per-block costs as comments in the output')
+    parser.add_argument('--cost-report', metavar='FILE',
+                        help='Write the static step-cost analysis as JSON to FILE')
+    parser.add_argument('--binary', action='store_true',
+                        help='Write the output in the binary program form instead of text')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Record a binary execution trace of the run in FILE (see python -m compiler.trace)')
+    parser.add_argument('--trace-ring', type=int, metavar='N',
+                        help='Keep only the last N trace records in memory and write them to the --trace file '
+                             'when the run ends or fails')
+    parser.add_argument('--trace-sample', type=int, metavar='N',
+                        help='Record every N-th instruction only (default: 1)')
+    parser.add_argument('--target', metavar='NAME|FILE',
+                        help='Machine description to optimize for and charge steps by: a registered '
+                             "target name or a JSON file (see compiler/target.py; default: 'default')")
+    parser.add_argument('--stream', action='store_true',
+                        help='Compile and write each top-level command as soon as it is parsed, in memory '
+                             'that does not grow with the program (-O0/-O1, needs --output)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='Reuse the result of an earlier --run of the same program on the same input, '
+                             'kept in DIR (see compiler/cache.py)')
+    parser.add_argument('--specialize', metavar='FILE',
+                        help='Inputs known at compile time, one per line: evaluate what depends only on them '
+                             'and compile the residual program (see compiler/specialize.py)')
+    parser.add_argument('--residual', metavar='FILE', help='Write the residual program of --specialize as source')
+    parser.add_argument('--stats', action='store_true',
+                        help='Print wall time, CPU time, peak memory and item counts of every phase to stderr')
+    parser.add_argument('--stats-format', choices=['text', 'json'],
+                        help='Print --stats as a table or as JSON (default: text; implies --stats)')
 
     args = parser.parse_args()
 
+    stats = CompileStats(enabled=args.stats or args.stats_format is not None)
     try:
-        with open(args.file, 'r') as f:
-            source_code = f.read()
+        if args.stream:
+            return stream(args, stats)
 
-        # Parse the source code using the lexer and parser
-        ast = parse(source_code, lexer=lexer)
+        # Lexing, parsing and semantic analysis; the AST keeps nothing of the mapping
+        with scanner.mapped(args.file) as source:
+            ast = parse_source(source, stats)
+        analyzer = analyze_source(ast, stats)
 
-        # Semantic analysis
-        analyzer = SemanticAnalyzer()
-        is_valid, errors = analyzer.analyze(ast)
-        if not is_valid:
-            raise Exception(f"Semantic errors: {errors}")
+        # Partial evaluation on the known inputs; the rest compiles as usual
+        specialization = None
+        if args.residual and not args.specialize:
+            raise Exception("--residual needs --specialize")
+        if args.specialize:
+            with stats.phase("specialize") as counts:
+                specialization = specialize(ast, read_input(args.specialize))
+                ast = specialization.program
+                counts["steps"] = specialization.steps
+            if args.residual:
+                with open(args.residual, 'w') as f:
+                    f.write(specialization.source())
+            if args.verbose:
+                print(specialization.report())
+            analyzer = analyze_source(ast, stats)
+
+        if args.binary and args.annotate:
+            raise Exception("--annotate writes text; it cannot be combined with --binary")
+        if args.trace and not args.run:
+            raise Exception("--trace needs --run")
+        if (args.trace_ring is not None or args.trace_sample is not None) and not args.trace:
+            raise Exception("--trace-ring and --trace-sample need --trace")
+        if args.profile_out and not args.run:
+            raise Exception("--profile-out needs --run")
+        if args.cache and (args.trace or args.profile_out):
+            raise Exception("--cache may skip the run; it cannot be combined with --trace or --profile-out")
+        cache = ResultCache(args.cache) if args.cache else None
 
-        # Code generation
-        code_gen = CodeGenerator(analyzer)
+        # A profile recorded for a different program would mislead every decision
+        program_id = pgo.fingerprint(ast)
+        profile = None
+        if args.profile_use:
+            profile = pgo.Profile.load(args.profile_use)
+            if profile.program != program_id:
+                print(f"Warning: {args.profile_use} was recorded for another program; ignoring it",
+                      file=sys.stderr)
+                profile = None
+            elif args.verbose:
+                print(f"Using profile {args.profile_use} ({profile.runs} runs).")
+
+        # IR construction, optimization passes and code generation
+        target = get_target(args.target)
+        opt_level = args.opt_level if args.opt_level == 's' else int(args.opt_level)
+        code_gen = CodeGenerator(analyzer, opt_level=opt_level, profile=profile, stats=stats, target=target,
+                                 measure_passes=args.verbose)
         program, _ = code_gen.generate(ast)
 
+        # -Os trades steps for size; build the -O1 program to compare against
+        baseline = None
+        if opt_level == 's' and args.verbose:
+            baseline, _ = CodeGenerator(analyzer, opt_level=1, target=target).generate(ast)
+            print(f"Size mode: {len(program)} instructions ({len(program) - len(baseline):+} vs -O1), "
+                  f"shared routines for {', '.join(code_gen.routine_sites) or 'nothing'}.")
+
+        if args.dump_ir:
+            print(code_gen.ir)
+        if args.verbose and code_gen.pass_manager.records:
+            print(code_gen.pass_manager.report())
+
+        # Static step costs, only when something asks for them
+        report = None
+        if args.annotate or args.cost_report or args.verbose:
+            with stats.phase("costs") as counts:
+                report = costs.analyze(program, code_gen)
+                counts["blocks"] = len(report.blocks)
+                counts["loops"] = len(report.loops)
+        if args.cost_report:
+            with open(args.cost_report, 'w') as f:
+                f.write(report.to_json())
+        if args.verbose:
+            print(f"Static cost: {report.functions['main'][1]} steps")
+
         # Output generated code
         if args.output:
-            with open(args.output, 'w') as f:
-                for instr in program:
-                    f.write(f"{instr.op} {instr.arg if instr.arg is not None else ''}\n")
+            with stats.phase("output") as counts:
+                if args.annotate:
+                    with open(args.output, 'w') as f:
+                        f.write(report.annotate())
+                else:
+                    machine.save(program, args.output, binary=args.binary)
+                counts["bytes"] = os.path.getsize(args.output)
 
         if args.verbose:
             print(f"Compilation successful. Generated {len(program)} instructions.")
 
         # Run the program
         if args.run:
-            input_data = []
-            if args.input:
-                with open(args.input, 'r') as f:
-                    input_data = [int(line.strip()) for line in f]
+            # Known inputs the specialization could not place are read at run time, first
+            input_data = read_input(args.input)
+            if specialization is not None:
+                input_data = specialization.leftover + input_data
+
+            trace = None
+            if args.trace and args.trace_ring is not None:
+                trace = TraceRecorder(capacity=args.trace_ring, sample=args.trace_sample or 1)
+            elif args.trace:
+                trace = TraceRecorder(args.trace, sample=args.trace_sample or 1)
+            with stats.phase("vm") as counts:
+                # A cached result is the run's result: the language is deterministic
+                result = cache.get(program, input_data, target) if cache is not None else None
+                used_inputs = input_data
+                if result is not None:
+                    replay_output(result)
+                else:
+                    given = len(input_data)
+                    vm = VM(program, input_data, profile=bool(args.profile_out), trace=trace, verified=True,
+                            target=target)
+                    try:
+                        result = vm.run()
+                    finally:
+                        # The trace of a failed run is the one worth having
+                        if args.trace_ring is not None:
+                            trace.save(args.trace)
+                        elif trace is not None:
+                            trace.close()
+                    # vm.input_data also holds the values typed in, which the key does not cover
+                    used_inputs = vm.input_data
+                    if cache is not None and vm.input_pos <= given:
+                        cache.put(program, input_data, result, target)
+                counts["instructions"] = result["instructions"]
+                counts["steps"] = result["steps"]
 
-            vm = VM(program, input_data)
-            result = vm.run()
+            if args.profile_out:
+                recorded = pgo.collect(code_gen, vm, program_id)
+                if os.path.exists(args.profile_out):
+                    recorded = pgo.Profile.load(args.profile_out).merge(recorded)
+                recorded.save(args.profile_out)
+                if args.verbose:
+                    print(f"Profile written to {args.profile_out} ({recorded.runs} runs).")
 
             print("Program output:")
             for value in result["output"]:
@@ -61,10 +254,22 @@ def main():
                 print(f"\nExecution statistics:")
                 print(f"Instructions executed: {result['instructions']}")
                 print(f"Steps executed: {result['steps']}")
+                print(f"Jumps executed: {result['jumps']} ({result['jumps_taken']} taken)")
+                if cache is not None:
+                    print(cache.report())
+                if baseline is not None:
+                    # The values typed in are passed along, so they are not asked again
+                    baseline_steps = VM(baseline, list(used_inputs), quiet=True, target=target).run()["steps"]
+                    print(f"Steps at -O1: {baseline_steps} ({result['steps'] - baseline_steps:+} in size mode)")
 
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         return 1
+    finally:
+        if args.stats_format == 'json':
+            print(stats.to_json(), file=sys.stderr)
+        elif stats.enabled:
+            print(stats.report(), file=sys.stderr)
 
     return 0
 
@@ -0,0 +1,709 @@
+# tests/benchmark.py
+"""Benchmark suite over the program corpus in tests/corpus.
+
+Every NAME.gbl there runs on the fixed input in NAME.in through the real
+pipeline (parse, SemanticAnalyzer, CodeGenerator, VM); its output must
+match the reference interpreter.  `run` records compile time, instruction
+count, executed steps, VM wall-clock and peak memory per program into a
+JSON baseline; `compare` measures again and flags every metric that grew
+beyond its threshold.  `run --target` compiles for and charges steps by
+another machine description (compiler.target); the baseline records it,
+so `compare` measures on the same machine.
+
+    python -m tests.benchmark run -o tests/corpus/baseline.json
+    python -m tests.benchmark compare tests/corpus/baseline.json
+
+`incremental` times recompiling a large generated program after a
+one-command edit with compiler.incremental against a full compile;
+`lexer` compares the token throughput of compiler.scanner with the PLY
+lexer on multi-megabyte sources; `ast` measures the memory the AST of a
+large program holds and the time semantic analysis and IR building take
+to walk it; `stream` compares the peak memory of compiling a large
+program file with compiler.stream against holding it all; `sessions`
+runs thousands of interactive VM sessions of a corpus program on one
+event loop.  `trace` measures the VM's slowdown while compiler.trace
+records every step.  `division` sweeps `/` and `%` over operand bit
+lengths and compares the steps of the long division template with the
+one it replaced (ClassicDivision).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from compiler.lexer import lexer
+from compiler.parser import parse
+from compiler.semantic import SemanticAnalyzer
+from compiler.codegen import CodeGenerator
+from compiler.incremental import IncrementalCompiler
+from compiler.ir import IRBuilder
+from compiler.machine import save
+from compiler.scanner import Scanner, scan, mapped
+from compiler.stats import count_nodes
+from compiler.stream import compile_stream
+from compiler.target import DEFAULT, Target, TargetError, get_target
+from compiler.trace import TraceRecorder
+from compiler.interpreter import interpret
+from vm import VM
+
+CORPUS = os.path.join(os.path.dirname(__file__), "corpus")
+FORMAT_VERSION = 1
+
+# Metric -> growth too small to tell from noise; counts are exact
+METRICS = {
+    "compile_time": 0.001,
+    "instructions": 0,
+    "steps": 0,
+    "vm_time": 0.001,
+    "peak_memory": 4096,
+}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def load_corpus(directory=CORPUS, names=None):
+    """[(name, source, inputs)] for the corpus programs, by name"""
+    programs = []
+    for filename in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(filename)
+        if ext != ".gbl" or (names and name not in names):
+            continue
+        with open(os.path.join(directory, filename)) as f:
+            source = f.read()
+        inputs = []
+        input_path = os.path.join(directory, name + ".in")
+        if os.path.exists(input_path):
+            with open(input_path) as f:
+                inputs = [int(line) for line in f if line.strip()]
+        programs.append((name, source, inputs))
+    if names and len(programs) != len(set(names)):
+        missing = set(names) - {name for name, _, _ in programs}
+        raise BenchmarkError(f"No corpus program named {', '.join(sorted(missing))}")
+    return programs
+
+
+def compile_source(source, opt_level=1, target=DEFAULT):
+    ast = parse(source, lexer=lexer.clone())
+    analyzer = SemanticAnalyzer()
+    is_valid, errors = analyzer.analyze(ast)
+    if not is_valid:
+        raise BenchmarkError(f"Semantic errors: {errors}")
+    program, _ = CodeGenerator(analyzer, opt_level=opt_level, target=target).generate(ast)
+    return ast, program
+
+
+def measure(source, inputs, opt_level=1, repeat=3, target=DEFAULT):
+    """Metrics of one program; times are the best of `repeat` runs"""
+    compile_time = vm_time = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ast, program = compile_source(source, opt_level, target)
+        compile_time = min(compile_time, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        result = VM(program, list(inputs), quiet=True, verified=True, target=target).run()
+        vm_time = min(vm_time, time.perf_counter() - start)
+
+    expected = interpret(ast, inputs)
+    if result["output"] != expected:
+        raise BenchmarkError(f"printed {result['output']}, the interpreter printed {expected}")
+
+    # Tracing slows everything down, so memory gets a run of its own
+    tracemalloc.start()
+    try:
+        _, program = compile_source(source, opt_level, target)
+        VM(program, list(inputs), quiet=True, verified=True, target=target).run()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "compile_time": compile_time,
+        "instructions": len(program),
+        "steps": result["steps"],
+        "vm_time": vm_time,
+        "peak_memory": peak_memory,
+    }
+
+
+def run_suite(names=None, opt_level=1, repeat=3, directory=CORPUS, target=DEFAULT):
+    programs = {}
+    for name, source, inputs in load_corpus(directory, names):
+        try:
+            programs[name] = measure(source, inputs, opt_level, repeat, target)
+        except BenchmarkError as e:
+            raise BenchmarkError(f"{name}: {e}")
+    return {
+        "format": FORMAT_VERSION,
+        "opt_level": opt_level,
+        "target": target.to_dict(),
+        "python": platform.python_version(),
+        "programs": programs,
+    }
+
+
+def compare(baseline, current, threshold=0.0, time_threshold=0.25):
+    """Regressions of `current` against `baseline` as (name, metric, old, new).
+
+    Counts may grow by `threshold` and measurements by `time_threshold`,
+    both relative to the baseline; measurements must also grow by more
+    than their noise floor in METRICS.
+    """
+    regressions = []
+    for name, old in baseline["programs"].items():
+        new = current["programs"].get(name)
+        if new is None:
+            continue
+        for metric, noise in METRICS.items():
+            limit = time_threshold if noise else threshold
+            if new[metric] > old[metric] * (1 + limit) and new[metric] - old[metric] > noise:
+                regressions.append((name, metric, old[metric], new[metric]))
+    return regressions
+
+
+def large_program(commands, edited=None):
+    """Source of a program with the given number of top-level commands.
+
+    Commands cycle through arithmetic, IF, WHILE and WRITE, the IFs and
+    WHILEs with a literal of their own so they are not alike; `edited` changes the operator
+    of the command with that index.
+    """
+    lines = ["CONST", "zero := 0", "one := 1", "three := 3", "VAR", "k " + " ".join(f"v{i}" for i in range(8)),
+             "BEGIN"]
+    for i in range(commands):
+        a, b, c = (f"v{(i * step) % 8}" for step in (1, 3, 5))
+        op = '-' if i == edited else '*'
+        shape = i % 4
+        if shape == 0:
+            lines.append(f"  {a} := {b} {op} {c};")
+        elif shape == 1:
+            lines.append(f"  IF {a} < {b} THEN {c} := {i}; ELSE {c} := {b} % three; END")
+        elif shape == 2:
+            lines.append(f"  WHILE k > zero DO {a} := {a} {op} {b}; {c} := {i}; k := k - one; END")
+        else:
+            lines.append(f"  WRITE {a};")
+    lines.append("END")
+    return "\n".join(lines) + "\n"
+
+
+def incremental_benchmark(commands, repeat=3):
+    """Seconds for a full compile, a cold incremental build and a rebuild after an edit"""
+    ast = parse(large_program(commands), lexer=lexer.clone())
+    edited = parse(large_program(commands, edited=commands // 8 * 4), lexer=lexer.clone())
+    analyzer = SemanticAnalyzer()
+    analyzer.analyze(ast)
+
+    result = {"commands": commands, "full": float("inf"), "cold": float("inf"), "edit": float("inf")}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        code_gen = CodeGenerator(analyzer)
+        program, _ = code_gen.generate(ast)
+        result["full"] = min(result["full"], time.perf_counter() - start)
+
+        compiler = IncrementalCompiler()
+        start = time.perf_counter()
+        compiler.compile(ast, analyzer)
+        result["cold"] = min(result["cold"], time.perf_counter() - start)
+
+        start = time.perf_counter()
+        compiler.compile(edited, analyzer)
+        result["edit"] = min(result["edit"], time.perf_counter() - start)
+
+    result["instructions"] = len(program)
+    result["compiled"] = compiler.stats["compiled"]
+    return result
+
+
+def ast_benchmark(commands, repeat=3):
+    """Memory the AST of a large generated program holds, and seconds to walk it.
+
+    `check` is semantic analysis and `lower` building the IR, both visitor
+    walks over the whole tree.
+    """
+    source = large_program(commands)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    ast = parse(source, lexer=Scanner())
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    result = {"commands": commands, "nodes": count_nodes(ast), "bytes": size,
+              "check": float("inf"), "lower": float("inf")}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyzer = SemanticAnalyzer()
+        analyzer.analyze(ast)
+        result["check"] = min(result["check"], time.perf_counter() - start)
+
+        start = time.perf_counter()
+        IRBuilder(analyzer).build(ast)
+        result["lower"] = min(result["lower"], time.perf_counter() - start)
+    return result
+
+
+def _peak(compile):
+    """Seconds and peak traced bytes of a call"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        compile()
+        return time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def stream_benchmark(commands):
+    """Peak memory of compiling a large generated program file by streaming and in memory.
+
+    Both build the same code (IncrementalCompiler's); the in-memory build
+    holds the whole AST and program first.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path, output = os.path.join(directory, "large.gbl"), os.path.join(directory, "large.out")
+        with open(path, 'w') as f:
+            f.write(large_program(commands))
+
+        def in_memory():
+            with mapped(path) as data:
+                ast = parse(data, lexer=Scanner())
+            analyzer = SemanticAnalyzer()
+            analyzer.analyze(ast)
+            save(IncrementalCompiler().compile(ast, analyzer), output)
+
+        def streaming():
+            with mapped(path) as data:
+                result["instructions"] = compile_stream(data, output)["instructions"]
+
+        result = {"commands": commands, "bytes": os.path.getsize(path)}
+        result["memory_time"], result["memory_peak"] = _peak(in_memory)
+        result["stream_time"], result["stream_peak"] = _peak(streaming)
+    return result
+
+
+def large_source(megabytes):
+    """A generated program of at least the given size, with comments spanning lines"""
+    commands = 64
+    while True:
+        source = large_program(commands).replace("BEGIN\n", "BEGIN\n  (* generated\n     program *)\n", 1)
+        if len(source) >= megabytes * 2**20:
+            return source
+        commands *= 2
+
+
+def lexer_benchmark(megabytes, repeat=3):
+    """Seconds to tokenize a source of the given size with PLY, the scanner and the scanner over mmap"""
+    source = large_source(megabytes)
+    result = {"bytes": len(source), "ply": float("inf"), "scanner": float("inf"), "mmap": float("inf")}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "large.gbl")
+        with open(path, 'w') as f:
+            f.write(source)
+
+        for _ in range(repeat):
+            start = time.perf_counter()
+            ply = lexer.clone()
+            ply.input(source)
+            tokens = sum(1 for _ in iter(ply.token, None))
+            result["ply"] = min(result["ply"], time.perf_counter() - start)
+
+            start = time.perf_counter()
+            scanned = sum(1 for _ in scan(source))
+            result["scanner"] = min(result["scanner"], time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with mapped(path) as data:
+                sum(1 for _ in scan(data))
+            result["mmap"] = min(result["mmap"], time.perf_counter() - start)
+
+    if scanned != tokens:
+        raise BenchmarkError(f"the scanner read {scanned} tokens, the PLY lexer {tokens}")
+    result["tokens"] = tokens
+    return result
+
+
+async def _sessions(program, inputs, sessions, yield_every):
+    """Run the sessions side by side, feeding each its inputs one round at a time"""
+    queues = [asyncio.Queue() for _ in range(sessions)]
+    tasks = [asyncio.create_task(VM(program, quiet=True).run_async(queue.get, yield_every=yield_every))
+             for queue in queues]
+
+    # Like interactive users: every session waits on SCAN until its next value arrives
+    for value in inputs:
+        for queue in queues:
+            queue.put_nowait(value)
+        await asyncio.sleep(0)
+    return await asyncio.gather(*tasks)
+
+
+def session_benchmark(name, sessions, yield_every=1000):
+    """Wall and CPU seconds to run `sessions` concurrent sessions of a corpus program"""
+    _, source, inputs = load_corpus(names=[name])[0]
+    ast, program = compile_source(source)
+    expected = interpret(ast, inputs)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    results = asyncio.run(_sessions(program, inputs, sessions, yield_every))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    if any(result["output"] != expected for result in results):
+        raise BenchmarkError(f"{name}: a session printed something other than {expected}")
+    return {"sessions": sessions, "wall": wall, "cpu": cpu, "steps": results[0]["steps"],
+            "instructions": results[0]["instructions"]}
+
+
+def trace_benchmark(names=None, capacity=1 << 16, sample=10, repeat=3):
+    """{program: VM seconds untraced, into a ring, into a file and sampled into a ring}"""
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "run.trace")
+        recorders = {
+            "plain": lambda: None,
+            "ring": lambda: TraceRecorder(capacity=capacity),
+            "file": lambda: TraceRecorder(path, capacity=capacity),
+            "sampled": lambda: TraceRecorder(capacity=capacity, sample=sample),
+        }
+        for name, source, inputs in load_corpus(names=names):
+            _, program = compile_source(source)
+            times = dict.fromkeys(recorders, float("inf"))
+            for _ in range(repeat):
+                for mode, recorder in recorders.items():
+                    trace = recorder()
+                    start = time.perf_counter()
+                    VM(program, list(inputs), quiet=True, trace=trace).run()
+                    if trace is not None:
+                        trace.close()
+                    times[mode] = min(times[mode], time.perf_counter() - start)
+            results[name] = times
+    return results
+
+
+class ClassicDivision(CodeGenerator):
+    """CodeGenerator with the long division template before the biased remainder.
+
+    It keeps a shift counter in a fifth scratch cell, reloads the divisor
+    from memory for every compare and subtracts twice per quotient bit
+    that fits; `division` measures the current template against it.
+    """
+
+    SCRATCH = CodeGenerator.SCRATCH + ("%4",)
+    TEMPLATE_CELLS = dict(CodeGenerator.TEMPLATE_CELLS, **{'/': SCRATCH, '%': SCRATCH[1:]})
+
+    def optimize_modulo(self, left, right):
+        self.load_operands(left, right)
+        self.modulo_loop()
+        self.emit("LOAD", self.scratch[1])
+
+    def division_loop(self):
+        self.classic_division(*self.scratch)
+
+    def modulo_loop(self):
+        self.classic_division(None, *self.scratch[1:])
+
+    def classic_division(self, quotient_addr, remainder_addr, divisor_addr, temp_addr, count_addr):
+        zero_div_label = self.get_new_label()
+        end_label = self.get_new_label()
+
+        if quotient_addr is not None:
+            self.emit("ZERO")
+            self.emit("STORE", quotient_addr)
+        self.emit("LOAD", divisor_addr)
+        self.emit("JZ", zero_div_label)
+
+        # Count the doublings that keep divisor <= remainder
+        self.emit("ZERO")
+        self.emit("STORE", count_addr)
+        shift_start_label = self.get_new_label()
+        shift_end_label = self.get_new_label()
+        self.emit_label(shift_start_label)
+        self.emit("LOAD", divisor_addr)
+        self.emit("SHL")
+        self.emit("STORE", temp_addr)
+        self.emit("SUB", remainder_addr)
+        self.emit("JG", shift_end_label)
+        self.emit("LOAD", temp_addr)
+        self.emit("STORE", divisor_addr)
+        self.emit("LOAD", count_addr)
+        self.emit("INC")
+        self.emit("STORE", count_addr)
+        self.emit("JUMP", shift_start_label)
+
+        # One quotient bit per halving, count + 1 bits in all
+        self.emit_label(shift_end_label)
+        div_loop_label = self.get_new_label()
+        no_sub_label = self.get_new_label()
+        next_bit_label = self.get_new_label()
+        self.emit_label(div_loop_label)
+        self.emit("LOAD", divisor_addr)
+        self.emit("SUB", remainder_addr)
+        self.emit("JG", no_sub_label)
+        self.emit("LOAD", remainder_addr)
+        self.emit("SUB", divisor_addr)
+        self.emit("STORE", remainder_addr)
+        if quotient_addr is not None:
+            self.emit("LOAD", quotient_addr)
+            self.emit("SHL")
+            self.emit("INC")
+            self.emit("STORE", quotient_addr)
+            self.emit("JUMP", next_bit_label)
+            self.emit_label(no_sub_label)
+            self.emit("LOAD", quotient_addr)
+            self.emit("SHL")
+            self.emit("STORE", quotient_addr)
+        else:
+            self.emit_label(no_sub_label)
+
+        self.emit_label(next_bit_label)
+        self.emit("LOAD", count_addr)
+        self.emit("JZ", end_label)
+        self.emit("DEC")
+        self.emit("STORE", count_addr)
+        self.emit("LOAD", divisor_addr)
+        self.emit("SHR")
+        self.emit("STORE", divisor_addr)
+        self.emit("JUMP", div_loop_label)
+
+        self.emit_label(zero_div_label)
+        self.emit("ZERO")
+        self.emit("STORE", remainder_addr)
+        self.emit_label(end_label)
+
+
+DIVISION_SOURCE = """
+CONST
+VAR a b c
+BEGIN
+  READ a;
+  READ b;
+  c := a {op} b;
+  WRITE c;
+END
+"""
+
+
+def _fit(points):
+    """Least-squares (intercept, slope) of (x, y) points"""
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread if spread else 0.0
+    return mean_y - slope * mean_x, slope
+
+
+def division_benchmark(max_bits=128, samples=8, seed=1, target=DEFAULT):
+    """Steps of a / b and a % b by k = bits(a) - bits(b), classic template against the current one.
+
+    For every k and sample, b has a random length and a is k bits longer;
+    the samples include a == b * 2**k, where every compare is an exact
+    fit.  Returns {op: {"rows": [(k, classic mean, current mean)],
+    "classic": fit, "current": fit}} with the (intercept, steps per bit)
+    least-squares fit of each.  Outputs are checked against Python.
+    """
+    rng = random.Random(seed)
+    operands = []
+    for k in range(max_bits):
+        for sample in range(samples):
+            b_bits = rng.randint(1, max_bits - k)
+            b = rng.randrange(2 ** (b_bits - 1), 2 ** b_bits)
+            a = b << k if sample == 0 else rng.randrange(2 ** (b_bits + k - 1), 2 ** (b_bits + k))
+            operands.append((k, a, b))
+
+    results = {}
+    for op, expected in (('/', lambda a, b: a // b), ('%', lambda a, b: a % b)):
+        ast = parse(DIVISION_SOURCE.format(op=op), lexer=lexer.clone())
+        analyzer = SemanticAnalyzer()
+        analyzer.analyze(ast)
+        programs = {name: generator(analyzer, target=target).generate(ast)[0]
+                    for name, generator in (("classic", ClassicDivision), ("current", CodeGenerator))}
+        steps = {name: {} for name in programs}
+        for k, a, b in operands:
+            for name, program in programs.items():
+                result = VM(program, [a, b], quiet=True, verified=True, target=target).run()
+                if result["output"] != [expected(a, b)]:
+                    raise BenchmarkError(f"{name} template: {a} {op} {b} printed {result['output']}")
+                steps[name].setdefault(k, []).append(result["steps"])
+        means = {name: {k: sum(values) / len(values) for k, values in by_k.items()} for name, by_k in steps.items()}
+        results[op] = {
+            "rows": [(k, means["classic"][k], means["current"][k]) for k in range(max_bits)],
+            "classic": _fit(list(means["classic"].items())),
+            "current": _fit(list(means["current"].items())),
+        }
+    return results
+
+
+def _format(metric, value):
+    if metric.endswith("_time"):
+        return f"{value * 1000:.1f}ms"
+    if metric == "peak_memory":
+        return f"{value / 1024:.0f}KiB"
+    return str(value)
+
+
+def print_table(results, baseline=None):
+    print(f"{'program':<12}" + "".join(f"{metric:>16}" for metric in METRICS))
+    for name, metrics in results["programs"].items():
+        row = f"{name:<12}"
+        old = baseline["programs"].get(name) if baseline else None
+        for metric in METRICS:
+            cell = _format(metric, metrics[metric])
+            if old and old[metric]:
+                cell += f" {(metrics[metric] - old[metric]) / old[metric]:+.0%}"
+            row += f"{cell:>16}"
+        print(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the compiler on the program corpus')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Measure the corpus and optionally save a baseline')
+    run.add_argument('programs', nargs='*', help='Corpus programs to run (default: all)')
+    run.add_argument('--output', '-o', metavar='FILE', help='Write the results as a JSON baseline')
+    run.add_argument('-O', dest='opt_level', choices=['0', '1', 's'], default='1', help='Optimization level')
+    run.add_argument('--repeat', type=int, default=3, help='Runs per program; times are the best run')
+    run.add_argument('--target', metavar='NAME|FILE', help='Machine description to compile for and run on')
+
+    check = commands.add_parser('compare', help='Measure again and flag regressions against a baseline')
+    check.add_argument('baseline', help='JSON baseline written by run')
+    check.add_argument('--threshold', type=float, default=0.0,
+                       help='Allowed relative growth of instruction and step counts (default: 0)')
+    check.add_argument('--time-threshold', type=float, default=0.25,
+                       help='Allowed relative growth of times and peak memory (default: 0.25)')
+    check.add_argument('--repeat', type=int, default=3, help='Runs per program; times are the best run')
+    incremental = commands.add_parser('incremental', help='Time recompiling a large program after a small edit')
+    incremental.add_argument('--commands', type=int, nargs='+', default=[250, 1000, 2000],
+                             help='Top-level commands of the generated programs')
+    incremental.add_argument('--repeat', type=int, default=3, help='Runs per size; times are the best run')
+    trees = commands.add_parser('ast', help='Measure AST memory and tree-walk time on large programs')
+    trees.add_argument('--commands', type=int, nargs='+', default=[1000, 10000, 50000],
+                       help='Top-level commands of the generated programs')
+    trees.add_argument('--repeat', type=int, default=3, help='Runs per size; times are the best run')
+    streams = commands.add_parser('stream', help='Compare peak memory of streaming and in-memory compiles')
+    streams.add_argument('--commands', type=int, nargs='+', default=[1000, 4000, 16000],
+                         help='Top-level commands of the generated programs')
+    lexers = commands.add_parser('lexer', help='Compare scanner and PLY lexer throughput on large sources')
+    lexers.add_argument('--megabytes', type=float, nargs='+', default=[1, 4, 16],
+                        help='Sizes of the generated sources')
+    lexers.add_argument('--repeat', type=int, default=3, help='Runs per size; times are the best run')
+    sessions = commands.add_parser('sessions', help='Run many concurrent VM sessions on one event loop')
+    sessions.add_argument('program', nargs='?', default='gcd', help='Corpus program each session runs')
+    sessions.add_argument('--sessions', type=int, nargs='+', default=[100, 1000, 5000],
+                          help='Concurrent sessions per run')
+    sessions.add_argument('--yield-every', type=int, default=1000,
+                          help='Instructions a session runs before yielding to the event loop')
+    traces = commands.add_parser('trace', help='Measure the VM slowdown of recording execution traces')
+    traces.add_argument('programs', nargs='*', help='Corpus programs to run (default: all)')
+    traces.add_argument('--sample', type=int, default=10, help='Sampling rate of the sampled run')
+    traces.add_argument('--repeat', type=int, default=3, help='Runs per program; times are the best run')
+    divisions = commands.add_parser('division', help='Sweep / and %% over operand bit lengths against the '
+                                                     'classic long division template')
+    divisions.add_argument('--bits', type=int, default=128, help='Longest dividend in bits')
+    divisions.add_argument('--samples', type=int, default=8, help='Operand pairs per bit-length difference')
+    divisions.add_argument('--every', type=int, default=8, help='Print every N-th bit-length difference')
+    divisions.add_argument('--target', metavar='NAME|FILE', help='Machine description to compile for and run on')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'sessions':
+            print(f"{'sessions':>8} {'instrs':>8} {'wall ms':>9} {'cpu ms':>9} {'sessions/core-s':>16}")
+            for count in args.sessions:
+                result = session_benchmark(args.program, count, args.yield_every)
+                print(f"{count:>8} {result['instructions']:>8} {result['wall'] * 1000:>9.1f} "
+                      f"{result['cpu'] * 1000:>9.1f} {count / result['cpu']:>16.0f}")
+            return 0
+
+        if args.command == 'division':
+            for op, result in division_benchmark(args.bits, args.samples, target=get_target(args.target)).items():
+                print(f"a {op} b{'k':>6} {'classic':>10} {'current':>10} {'saved':>7}")
+                for k, classic, current in result["rows"]:
+                    if k % args.every == 0 or k == args.bits - 1:
+                        print(f"{'':<5}{k:>6} {classic:>10.0f} {current:>10.0f} {1 - current / classic:>7.0%}")
+                for name in ("classic", "current"):
+                    intercept, slope = result[name]
+                    print(f"  {name:<8} {intercept:.0f} + {slope:.1f}*k steps")
+            return 0
+
+        if args.command == 'trace':
+            print(f"{'program':<12} {'vm ms':>8} {'ring':>7} {'file':>7} {'sampled':>8}")
+            for name, times in trace_benchmark(args.programs, sample=args.sample, repeat=args.repeat).items():
+                plain = times["plain"]
+                print(f"{name:<12} {plain * 1000:>8.1f} {times['ring'] / plain:>6.2f}x {times['file'] / plain:>6.2f}x "
+                      f"{times['sampled'] / plain:>7.2f}x")
+            return 0
+
+        if args.command == 'lexer':
+            print(f"{'MiB':>6} {'tokens':>9} {'PLY Mtok/s':>11} {'scan Mtok/s':>12} {'mmap Mtok/s':>12} {'speedup':>8}")
+            for megabytes in args.megabytes:
+                result = lexer_benchmark(megabytes, args.repeat)
+                rates = [result["tokens"] / result[lexer_name] / 1e6 for lexer_name in ("ply", "scanner", "mmap")]
+                print(f"{result['bytes'] / 2**20:>6.1f} {result['tokens']:>9} {rates[0]:>11.2f} {rates[1]:>12.2f} "
+                      f"{rates[2]:>12.2f} {result['ply'] / result['scanner']:>7.1f}x")
+            return 0
+
+        if args.command == 'ast':
+            print(f"{'commands':>8} {'nodes':>8} {'KiB':>8} {'B/node':>7} {'check ms':>9} {'lower ms':>9}")
+            for count in args.commands:
+                result = ast_benchmark(count, args.repeat)
+                print(f"{count:>8} {result['nodes']:>8} {result['bytes'] / 1024:>8.0f} "
+                      f"{result['bytes'] / result['nodes']:>7.1f} {result['check'] * 1000:>9.1f} "
+                      f"{result['lower'] * 1000:>9.1f}")
+            return 0
+
+        if args.command == 'stream':
+            print(f"{'commands':>8} {'KiB':>8} {'instrs':>8} {'memory s':>9} {'peak KiB':>9} "
+                  f"{'stream s':>9} {'peak KiB':>9}")
+            for count in args.commands:
+                result = stream_benchmark(count)
+                print(f"{count:>8} {result['bytes'] / 1024:>8.0f} {result['instructions']:>8} "
+                      f"{result['memory_time']:>9.2f} {result['memory_peak'] / 1024:>9.0f} "
+                      f"{result['stream_time']:>9.2f} {result['stream_peak'] / 1024:>9.0f}")
+            return 0
+
+        if args.command == 'incremental':
+            print(f"{'commands':>8} {'instrs':>8} {'full ms':>9} {'cold ms':>9} {'edit ms':>9} {'compiled':>8} {'speedup':>8}")
+            for count in args.commands:
+                result = incremental_benchmark(count, args.repeat)
+                print(f"{count:>8} {result['instructions']:>8} {result['full'] * 1000:>9.1f} "
+                      f"{result['cold'] * 1000:>9.1f} {result['edit'] * 1000:>9.1f} {result['compiled']:>8} "
+                      f"{result['full'] / result['edit']:>7.1f}x")
+            return 0
+
+        if args.command == 'run':
+            opt_level = args.opt_level if args.opt_level == 's' else int(args.opt_level)
+            results = run_suite(args.programs, opt_level, args.repeat, target=get_target(args.target))
+            print_table(results)
+            if args.output:
+                with open(args.output, 'w') as f:
+                    json.dump(results, f, indent=1)
+                    f.write("\n")
+            return 0
+
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("format") != FORMAT_VERSION:
+            raise BenchmarkError(f"{args.baseline} has format {baseline.get('format')}, expected {FORMAT_VERSION}")
+        # Baselines from before targets were recorded ran on the default machine
+        target = Target.from_dict(baseline["target"]) if "target" in baseline else DEFAULT
+        results = run_suite(list(baseline["programs"]), baseline["opt_level"], args.repeat, target=target)
+        print_table(results, baseline)
+        regressions = compare(baseline, results, args.threshold, args.time_threshold)
+        for name, metric, old, new in regressions:
+            print(f"REGRESSION {name} {metric}: {_format(metric, old)} -> {_format(metric, new)}")
+        print(f"{len(regressions)} regressions")
+        return 1 if regressions else 0
+    except (BenchmarkError, TargetError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
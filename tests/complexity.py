@@ -0,0 +1,248 @@
+# tests/complexity.py
+"""Asymptotic step counts of the arithmetic templates.
+
+`*`, `/` and `%` must run in steps linear in the bit length of their
+operands (logarithmic in their values).  For every operator and operand
+order (a long and b short, a short and b long, both long) `c := a op b`
+runs on random operands of 1 to 256 bits, in a process pool, and the
+mean steps per length are fitted as intercept + slope * bits.  A curve
+fails when its slope over the upper half of the lengths exceeds its slope
+over the lower half by more than GROWTH_TOLERANCE (quadratic growth
+triples it, n log n still shows), or, against a baseline written by
+`run -o`, when its slope or intercept grew.
+
+    python -m tests.complexity run -o tests/corpus/complexity.json
+    python -m tests.complexity compare tests/corpus/complexity.json --csv curves.csv --plot curves.png
+
+The baseline keeps each curve's fit; `--csv` writes the points of the
+curves.  Plots need matplotlib; the CSV is written without it.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+
+from compiler.lexer import lexer
+from compiler.parser import parse
+from compiler.semantic import SemanticAnalyzer
+from compiler.codegen import CodeGenerator
+from compiler.target import DEFAULT, Target, TargetError, get_target
+from tests.benchmark import DIVISION_SOURCE, BenchmarkError, _fit
+from vm import VM
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:  # Plots are optional; the curves are written either way
+    plt = None
+
+FORMAT_VERSION = 1
+OPERATORS = {'*': lambda a, b: a * b, '/': lambda a, b: a // b, '%': lambda a, b: a % b}
+SHORT_BITS = 4  # Length of the short operand
+ORDERS = {
+    "long-short": lambda bits: (bits, SHORT_BITS),
+    "short-long": lambda bits: (SHORT_BITS, bits),
+    "long-long": lambda bits: (bits, bits),
+}
+GROWTH_TOLERANCE = 1.1  # Upper-half slope over lower-half slope
+SLOPE_FLOOR = 1.0  # Steps per bit a flat curve may drift by
+
+
+def operand(rng, bits):
+    """A random value of exactly `bits` bits"""
+    return rng.randrange(2 ** (bits - 1), 2 ** bits)
+
+
+_programs = {}
+
+
+def _program(op, opt_level, target):
+    key = (op, opt_level, json.dumps(target.to_dict(), sort_keys=True))
+    if key not in _programs:
+        ast = parse(DIVISION_SOURCE.format(op=op), lexer=lexer.clone())
+        analyzer = SemanticAnalyzer()
+        analyzer.analyze(ast)
+        _programs[key] = CodeGenerator(analyzer, opt_level=opt_level, target=target).generate(ast)[0]
+    return _programs[key]
+
+
+def measure_point(task):
+    """Worker: mean steps of `samples` runs of one operator, order and length"""
+    op, order, bits, samples, seed, opt_level, target = task
+    target = Target.from_dict(target)
+    program = _program(op, opt_level, target)
+    rng = random.Random(f"{seed}:{op}:{order}:{bits}")
+    a_bits, b_bits = ORDERS[order](bits)
+    total = 0
+    for _ in range(samples):
+        a, b = operand(rng, a_bits), operand(rng, b_bits)
+        result = VM(program, [a, b], quiet=True, verified=True, target=target).run()
+        if result["output"] != [OPERATORS[op](a, b)]:
+            raise BenchmarkError(f"{a} {op} {b} printed {result['output']}")
+        total += result["steps"]
+    return op, order, bits, total / samples
+
+
+def growth(points):
+    """(lower-half slope, upper-half slope) of a curve's (bits, steps) points"""
+    middle = len(points) // 2
+    return _fit(points[:middle + 1])[1], _fit(points[middle:])[1]
+
+
+def sweep(max_bits=256, samples=4, seed=1, opt_level=1, target=DEFAULT, jobs=None):
+    """Curves of every operator and order over 1..max_bits bit operands.
+
+    Returns per "op order" curve its [(bits, mean steps)] points, the (intercept, slope) fit and the
+    (lower, upper) half slopes above SHORT_BITS, where the long operand
+    is the longer one.
+    """
+    tasks = [(op, order, bits, samples, seed, opt_level, target.to_dict())
+             for op in OPERATORS for order in ORDERS for bits in range(1, max_bits + 1)]
+    if jobs == 1:
+        measured = list(map(measure_point, tasks))
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            measured = pool.map(measure_point, tasks, chunksize=16)
+
+    curves = {}
+    for op, order, bits, steps in measured:
+        curves.setdefault(f"{op} {order}", []).append((bits, steps))
+    settled = SHORT_BITS if max_bits > 2 * SHORT_BITS else 0
+    return {
+        "format": FORMAT_VERSION,
+        "max_bits": max_bits,
+        "samples": samples,
+        "seed": seed,
+        "opt_level": opt_level,
+        "target": target.to_dict(),
+        "curves": {name: {"points": points, "fit": _fit(points), "growth": growth(points[settled:])}
+                   for name, points in curves.items()},
+    }
+
+
+def check(results, baseline=None, threshold=0.0):
+    """Failures as (curve, reason): growth worse than linear, or a fit above the baseline's"""
+    failures = []
+    for name, curve in results["curves"].items():
+        lower, upper = curve["growth"]
+        if upper > max(lower, 0) * GROWTH_TOLERANCE + SLOPE_FLOOR:
+            failures.append((name, f"superlinear: {lower:.1f} steps/bit, then {upper:.1f}"))
+        old = baseline["curves"].get(name) if baseline else None
+        if old is None:
+            continue
+        # The operands are the baseline's, so the fits are exact; flat curves regress in their intercept
+        for label, before, after in zip(("intercept", "slope"), old["fit"], curve["fit"]):
+            if after > abs(before) * threshold + before and after - before > 1e-9:
+                failures.append((name, f"{label} {before:.1f} -> {after:.1f} steps"))
+    return failures
+
+
+def save_baseline(results, path):
+    """Write results without their points, one line per setting and curve; --csv keeps the points"""
+    curves = {name: {"fit": curve["fit"], "growth": curve["growth"]} for name, curve in results["curves"].items()}
+    lines = [f" {json.dumps(key)}: {json.dumps(value)}," for key, value in results.items() if key != "curves"]
+    lines.append(' "curves": {')
+    lines.append(",\n".join(f"  {json.dumps(name)}: {json.dumps(curve)}" for name, curve in curves.items()))
+    with open(path, 'w') as f:
+        f.write("{\n" + "\n".join(lines) + "\n }\n}\n")
+
+
+def write_csv(results, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["op", "order", "bits", "steps"])
+        for name, curve in results["curves"].items():
+            op, order = name.split(" ")
+            for bits, steps in curve["points"]:
+                writer.writerow([op, order, bits, f"{steps:.1f}"])
+
+
+def plot(results, path):
+    figure, axes = plt.subplots(1, len(OPERATORS), figsize=(5 * len(OPERATORS), 4), sharey=True)
+    for ax, op in zip(axes, OPERATORS):
+        for order in ORDERS:
+            points = results["curves"][f"{op} {order}"]["points"]
+            ax.plot([bits for bits, _ in points], [steps for _, steps in points], label=order)
+        ax.set_title(f"a {op} b")
+        ax.set_xlabel("operand bits")
+        ax.legend()
+    axes[0].set_ylabel("steps")
+    figure.tight_layout()
+    figure.savefig(path)
+    plt.close(figure)
+
+
+def print_table(results, baseline=None):
+    print(f"{'curve':<14} {'intercept':>10} {'steps/bit':>10} {'lower':>8} {'upper':>8}")
+    for name, curve in results["curves"].items():
+        intercept, slope = curve["fit"]
+        row = f"{name:<14} {intercept:>10.0f} {slope:>10.1f} {curve['growth'][0]:>8.1f} {curve['growth'][1]:>8.1f}"
+        old = baseline["curves"].get(name) if baseline else None
+        if old and old["fit"][1]:
+            row += f" {(slope - old['fit'][1]) / old['fit'][1]:+.0%}"
+        print(row)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check that *, / and % take steps linear in operand bits')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='Sweep operand lengths and optionally save a baseline')
+    run.add_argument('--output', '-o', metavar='FILE', help='Write the results as a JSON baseline')
+    run.add_argument('--bits', type=int, default=256, help='Longest operand in bits')
+    run.add_argument('--samples', type=int, default=4, help='Operand pairs per length')
+    run.add_argument('--seed', type=int, default=1, help='Seed of the operands')
+    run.add_argument('-O', dest='opt_level', choices=['0', '1', 's'], default='1', help='Optimization level')
+    run.add_argument('--target', metavar='NAME|FILE', help='Machine description to compile for and run on')
+    check_parser = commands.add_parser('compare', help='Sweep again and flag fits that grew past a baseline')
+    check_parser.add_argument('baseline', help='JSON baseline written by run')
+    check_parser.add_argument('--threshold', type=float, default=0.0,
+                              help='Allowed relative growth of the intercepts and slopes (default: 0)')
+    for command in (run, check_parser):
+        command.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='Worker processes')
+        command.add_argument('--csv', metavar='FILE', help='Write the curves as CSV')
+        command.add_argument('--plot', metavar='FILE', help='Plot the curves (needs matplotlib)')
+    args = parser.parse_args(argv)
+
+    try:
+        baseline = None
+        if args.command == 'run':
+            opt_level = args.opt_level if args.opt_level == 's' else int(args.opt_level)
+            results = sweep(args.bits, args.samples, args.seed, opt_level, get_target(args.target), args.jobs)
+        else:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            if baseline.get("format") != FORMAT_VERSION:
+                raise BenchmarkError(f"{args.baseline} has format {baseline.get('format')}, "
+                                     f"expected {FORMAT_VERSION}")
+            # The same operands as the baseline, so the slopes compare exactly
+            results = sweep(baseline["max_bits"], baseline["samples"], baseline["seed"], baseline["opt_level"],
+                            Target.from_dict(baseline["target"]), args.jobs)
+    except (BenchmarkError, TargetError, OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    print_table(results, baseline)
+    if args.command == 'run' and args.output:
+        save_baseline(results, args.output)
+    if args.csv:
+        write_csv(results, args.csv)
+    if args.plot:
+        if plt is None:
+            print("matplotlib is not installed; no plot written", file=sys.stderr)
+        else:
+            plot(results, args.plot)
+
+    failures = check(results, baseline, getattr(args, 'threshold', 0.0))
+    for name, reason in failures:
+        print(f"FAIL {name}: {reason}")
+    print(f"{len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+# tests/fuzz.py
+"""Differential fuzzing of the compiler against the reference interpreter.
+
+Random programs are run by compiler.interpreter and, at every optimization
+level, compiled with CodeGenerator and run on the VM; the -O1 run also
+records a profile and the program is rebuilt with it.  Every run must print
+the same values.  Failing programs are shrunk to a minimal reproducer.
+
+    python -m tests.fuzz --programs 2000 --jobs 4 --seed 1
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from compiler.lexer import lexer
+from compiler.parser import parse, Assignment, IfElse, While, For, BinOp
+from compiler.semantic import SemanticAnalyzer
+from compiler.codegen import CodeGenerator
+from compiler.interpreter import Interpreter, LimitExceeded
+from compiler.printer import format_program
+from compiler import pgo
+from vm import VM
+
+OPT_LEVELS = (0, 1, 's')
+OPERATORS = ('+', '-', '*', '/', '%')
+RELOPS = ('==', '!=', '<', '>', '<=', '>=')
+
+MAX_STEPS = 20000          # Interpreter commands before a program is discarded
+MAX_BITS = 128             # Largest value a kept program may compute
+MAX_INSTRUCTIONS = 2000000  # VM instructions before a compiled run counts as hung
+
+
+class ProgramGenerator:
+    """Random programs that always terminate.
+
+    Every WHILE runs on a counter of its own that nothing else assigns:
+    it is set from a small constant before the loop and decremented as
+    the body's last command.  FOR loops run between small constants or an
+    enclosing iterator, and their bodies read the iterator.  READs get
+    enough input for every iteration.
+    """
+
+    def __init__(self, rng, max_depth=2, max_commands=6, max_trip=3):
+        self.rng = rng
+        self.max_depth = max_depth
+        self.max_commands = max_commands
+        self.max_trip = max_trip
+
+    def value(self):
+        rng = self.rng
+        kind = rng.random()
+        if kind < 0.3:
+            return rng.randint(0, 3)
+        if kind < 0.6:
+            return rng.randint(0, 100)
+        bits = rng.randint(1, 40)
+        return rng.choice([2 ** bits, 2 ** bits - 1, rng.getrandbits(bits)])
+
+    def generate(self):
+        """Return (source, input values)"""
+        rng = self.rng
+        self.consts = {"zero": 0, "one": 1}
+        for i in range(rng.randint(0, 3)):
+            self.consts[f"c{i}"] = self.value()
+        self.trips = {f"t{n}": n for n in range(1, self.max_trip + 1)}
+        self.consts.update(self.trips)
+        self.variables = [f"v{i}" for i in range(rng.randint(2, 6))]
+        self.counters = []
+        self.iterators = []  # Iterators of the FOR loops being generated, outermost first
+        self.loops = 0
+        self.reads = 0
+
+        commands = [f"READ {name};" for name in rng.sample(self.variables, rng.randint(1, 2))]
+        self.reads += len(commands)
+        commands += self.commands(0, 1)
+        commands += [f"WRITE {name};" for name in self.variables]
+
+        lines = ["CONST"]
+        lines += [f"{name} := {value}" for name, value in self.consts.items()]
+        lines.append("VAR")
+        lines.append(" ".join(self.variables + self.counters))
+        lines.append("BEGIN")
+        lines += ["  " + line for line in commands]
+        lines.append("END")
+        inputs = [self.value() for _ in range(self.reads)]
+        return "\n".join(lines) + "\n", inputs
+
+    def operand(self):
+        names = self.variables + list(self.consts) + self.counters + self.iterators
+        return self.rng.choice(names)
+
+    def commands(self, depth, trips):
+        """Indented source lines of a command list; `trips` is how often it runs"""
+        lines = []
+        for _ in range(self.rng.randint(1, self.max_commands)):
+            lines += self.command(depth, trips)
+        return lines
+
+    def command(self, depth, trips):
+        rng = self.rng
+        kind = rng.random()
+        if depth < self.max_depth and kind < 0.1:
+            return self.while_loop(depth, trips)
+        if depth < self.max_depth and kind < 0.15:
+            return self.for_loop(depth, trips)
+        if depth < self.max_depth and kind < 0.3:
+            condition = f"{self.operand()} {rng.choice(RELOPS)} {self.operand()}"
+            return ([f"IF {condition} THEN"] + self.indent(self.commands(depth + 1, trips))
+                    + ["ELSE"] + self.indent(self.commands(depth + 1, trips)) + ["END"])
+        if kind < 0.35:
+            self.reads += trips
+            return [f"READ {rng.choice(self.variables)};"]
+        if kind < 0.45:
+            return [f"WRITE {self.operand()};"]
+
+        target = rng.choice(self.variables)
+        form = rng.random()
+        if form < 0.15:
+            return [f"{target} := {self.value()};"]
+        if form < 0.3:
+            return [f"{target} := {self.operand()};"]
+        return [f"{target} := {self.operand()} {rng.choice(OPERATORS)} {self.operand()};"]
+
+    def while_loop(self, depth, trips):
+        rng = self.rng
+        counter = f"k{len(self.counters)}"
+        trip = rng.randint(1, self.max_trip)
+        self.counters.append(counter)
+        condition = rng.choice([f"{counter} > zero", f"{counter} != zero",
+                                f"zero < {counter}", f"{counter} >= one"])
+        body = self.commands(depth + 1, trips * trip) + [f"{counter} := {counter} - one;"]
+        return [f"{counter} := t{trip};", f"WHILE {condition} DO"] + self.indent(body) + ["END"]
+
+    def for_loop(self, depth, trips):
+        rng = self.rng
+        iterator = f"i{self.loops}"
+        self.loops += 1
+        # Outer iterators never exceed max_trip, so no loop runs more often
+        low = rng.choice(["zero", "one"] + self.iterators)
+        high = rng.choice([f"t{n}" for n in range(1, self.max_trip + 1)] + [str(self.max_trip)])
+        self.iterators.append(iterator)
+        body = self.commands(depth + 1, trips * (self.max_trip + 1))
+        self.iterators.pop()
+        if rng.random() < 0.5:
+            header = f"FOR {iterator} FROM {high} DOWNTO {low} DO"
+        else:
+            header = f"FOR {iterator} FROM {low} TO {high} DO"
+        return [header] + self.indent([f"WRITE {iterator};"] + body) + ["END"]
+
+    @staticmethod
+    def indent(lines):
+        return ["  " + line for line in lines]
+
+
+def generate_program(seed):
+    return ProgramGenerator(random.Random(seed)).generate()
+
+
+def check(ast, inputs):
+    """Compare compiled runs with the interpreter.
+
+    Returns None when they agree, "skip" when the program exceeds the
+    interpreter's limits, or a description of the first mismatch.
+    """
+    try:
+        expected = Interpreter(ast, inputs, max_steps=MAX_STEPS, max_bits=MAX_BITS).run()["output"]
+    except LimitExceeded:
+        return "skip"
+
+    analyzer = SemanticAnalyzer()
+    is_valid, errors = analyzer.analyze(ast)
+    if not is_valid:
+        return f"semantic errors: {errors}"
+
+    def run_build(opt_level, profile=None, record=False):
+        code_gen = CodeGenerator(analyzer, opt_level=opt_level, profile=profile)
+        program, _ = code_gen.generate(ast)
+        vm = VM(program, list(inputs), quiet=True, profile=record, max_instructions=MAX_INSTRUCTIONS)
+        output = vm.run()["output"]
+        return output, pgo.collect(code_gen, vm, pgo.fingerprint(ast)) if record else None
+
+    profile = None
+    for build in OPT_LEVELS + ("1 with profile",):
+        try:
+            if build == 1:
+                output, profile = run_build(1, record=True)
+            elif build in OPT_LEVELS:
+                output, _ = run_build(build)
+            else:
+                output, _ = run_build(1, profile)
+        except Exception as e:
+            return f"-O{build}: {type(e).__name__}: {e}"
+        if output != expected:
+            return f"-O{build}: printed {output}, expected {expected}"
+    return None
+
+
+def fails(ast, inputs):
+    result = check(ast, inputs)
+    return result is not None and result != "skip"
+
+
+def _smaller(commands):
+    """Variants of a command list with one command removed or simplified"""
+    for i, command in enumerate(commands):
+        before, after = commands[:i], commands[i + 1:]
+        if len(commands) > 1:
+            yield before + after
+        if isinstance(command, IfElse):
+            yield before + command.then_cmds + after
+            yield before + command.else_cmds + after
+            for then_cmds in _smaller(command.then_cmds):
+                yield before + [IfElse(command.condition, then_cmds, command.else_cmds)] + after
+            for else_cmds in _smaller(command.else_cmds):
+                yield before + [IfElse(command.condition, command.then_cmds, else_cmds)] + after
+        elif isinstance(command, While):
+            yield before + command.commands + after
+            for body in _smaller(command.commands):
+                yield before + [While(command.condition, body)] + after
+        elif isinstance(command, For):
+            for body in _smaller(command.commands):
+                yield before + [For(command.iterator, command.start, command.end, command.downto, body)] + after
+        elif isinstance(command, Assignment) and isinstance(command.expr, BinOp):
+            yield before + [Assignment(command.name, command.expr.left)] + after
+            yield before + [Assignment(command.name, command.expr.right)] + after
+
+
+def shrink(ast, inputs, predicate=fails):
+    """Greedily apply the first simplification that keeps predicate true"""
+    changed = True
+    while changed:
+        changed = False
+        for commands in _smaller(ast.commands):
+            candidate = type(ast)(ast.const_decls, ast.var_decls, commands)
+            if predicate(candidate, inputs):
+                ast, changed = candidate, True
+                break
+    return ast
+
+
+def run_seed(seed):
+    """Worker: generate, check and time one program"""
+    start = time.perf_counter()
+    source, inputs = generate_program(seed)
+    result = check(parse(source, lexer=lexer.clone()), inputs)
+    return seed, result, time.perf_counter() - start
+
+
+def fuzz(seeds, jobs=None):
+    """Check the programs of the given seeds in parallel.
+
+    Returns (failures as [(seed, reason)], skipped count, elapsed seconds).
+    """
+    failures, skipped = [], 0
+    start = time.perf_counter()
+    if jobs == 1:
+        results = map(run_seed, seeds)
+        for seed, result, _ in results:
+            if result == "skip":
+                skipped += 1
+            elif result is not None:
+                failures.append((seed, result))
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            for seed, result, _ in pool.imap_unordered(run_seed, seeds, chunksize=8):
+                if result == "skip":
+                    skipped += 1
+                elif result is not None:
+                    failures.append((seed, result))
+    return sorted(failures), skipped, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Differential fuzzing of the compiler')
+    parser.add_argument('--programs', '-n', type=int, default=1000, help='Programs to generate')
+    parser.add_argument('--seed', type=int, default=0, help='First seed')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count(), help='Worker processes')
+    parser.add_argument('--save', metavar='DIR', help='Write shrunk failing programs and inputs to DIR')
+    args = parser.parse_args(argv)
+
+    seeds = range(args.seed, args.seed + args.programs)
+    failures, skipped, elapsed = fuzz(seeds, args.jobs)
+    checked = args.programs - skipped
+    print(f"{args.programs} programs ({skipped} over limits) in {elapsed:.2f}s: "
+          f"{args.programs / elapsed:.1f} programs/s with {args.jobs} jobs, "
+          f"{len(OPT_LEVELS) + 1} builds each")
+
+    for seed, reason in failures:
+        source, inputs = generate_program(seed)
+        ast = shrink(parse(source, lexer=lexer.clone()), inputs)
+        reduced = format_program(ast)
+        print(f"\nseed {seed}: {reason}\ninput: {inputs}\n{reduced}", end="")
+        if args.save:
+            os.makedirs(args.save, exist_ok=True)
+            with open(os.path.join(args.save, f"fuzz_{seed}.gbl"), 'w') as f:
+                f.write(reduced)
+            with open(os.path.join(args.save, f"fuzz_{seed}.in"), 'w') as f:
+                f.writelines(f"{value}\n" for value in inputs)
+
+    print(f"\n{len(failures)} of {checked} checked programs failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,15 @@
 # tests/profiler.py
-import time
-import matplotlib.pyplot as plt
-from compiler.lexer import Lexer
-from compiler.parser import Parser
+from compiler.lexer import lexer
+from compiler.parser import parse
 from compiler.semantic import SemanticAnalyzer
 from compiler.codegen import CodeGenerator
 from vm import VM
 
+try:
+    import matplotlib.pyplot as plt
+except ImportError:  # Plots are optional; the step counts are printed either way
+    plt = None
+
 
 def profile_arithmetic_operation(operation, values, title):
     """Profile an arithmetic operation with different operand sizes"""
@@ -15,6 +18,7 @@ def profile_arithmetic_operation(operation, values, title):
 
     for n in values:
         source = f"""
+        CONST
         VAR x y z
         BEGIN
           x := {n};
@@ -25,20 +29,18 @@ def profile_arithmetic_operation(operation, values, title):
         """
 
         # Compile
-        lexer = Lexer()
-        tokens = lexer.tokenize(source)
-
-        parser = Parser()
-        ast = parser.parse(tokens)
+        ast = parse(source, lexer=lexer.clone())
 
         analyzer = SemanticAnalyzer()
-        symbol_table = analyzer.analyze(ast)
+        is_valid, errors = analyzer.analyze(ast)
+        if not is_valid:
+            raise Exception(f"Semantic errors: {errors}")
 
-        code_gen = CodeGenerator(symbol_table)
-        program = code_gen.generate(ast)
+        code_gen = CodeGenerator(analyzer)
+        program, _ = code_gen.generate(ast)
 
         # Run
-        vm = VM(program)
+        vm = VM(program, quiet=True)
         result = vm.run()
 
         steps_list.append(result["steps"])
@@ -46,6 +48,9 @@ def profile_arithmetic_operation(operation, values, title):
 
         print(f"Operation: {n} {operation} 42, Steps: {result['steps']}")
 
+    if plt is None:
+        return
+
     # Plot results
     plt.figure(figsize=(10, 6))
     plt.plot(sizes, steps_list, marker='o')
@@ -78,7 +83,10 @@ def run_profiling():
     print("Profiling modulo...")
     profile_arithmetic_operation("%", values, "Modulo")
 
-    print("Profiling complete. Check the generated PNG files for visualization.")
+    if plt is None:
+        print("Profiling complete. Install matplotlib to plot the results.")
+    else:
+        print("Profiling complete. Check the generated PNG files for visualization.")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,25 @@
+# tests/support.py
+"""Front-end and code generation helpers shared by the test modules."""
+
+from compiler.lexer import lexer
+from compiler.parser import parse
+from compiler.semantic import SemanticAnalyzer
+from compiler.codegen import CodeGenerator
+
+
+def analyze(source_code):
+    """(ast, analyzer) of a source that must pass semantic analysis"""
+    ast = parse(source_code, lexer=lexer.clone())
+    analyzer = SemanticAnalyzer()
+    is_valid, errors = analyzer.analyze(ast)
+    if not is_valid:
+        raise AssertionError(f"Semantic errors: {errors}")
+    return ast, analyzer
+
+
+def compile_source(source_code, **options):
+    """(program, code generator) of a source; options go to CodeGenerator"""
+    ast, analyzer = analyze(source_code)
+    code_gen = CodeGenerator(analyzer, **options)
+    program, _ = code_gen.generate(ast)
+    return program, code_gen
@@ -0,0 +1,93 @@
+# tests/test_async_vm.py
+import asyncio
+import unittest
+from compiler.machine import Code
+from tests.benchmark import compile_source, load_corpus, session_benchmark
+from vm import VM
+
+# Reads two values and prints their sum, then counts down from a large number
+PROGRAM = Code.from_text("""
+SCAN 3
+SCAN 4
+LOAD 3
+ADD 4
+STORE 5
+PRINT 5
+LOAD 4
+DEC
+JZ 11
+JUMP 7
+HALT
+""")
+
+
+class TestAsyncVM(unittest.TestCase):
+    def test_same_result_as_run(self):
+        _, source, inputs = load_corpus(names=["gcd"])[0]
+        _, program = compile_source(source)
+        expected = VM(program, list(inputs), quiet=True).run()
+        result = asyncio.run(VM(program, list(inputs), quiet=True).run_async(yield_every=100))
+        self.assertEqual(result, expected)
+
+    def test_source_and_sink(self):
+        async def session():
+            values = asyncio.Queue()
+            printed = []
+
+            async def sink(value):
+                printed.append(value)
+
+            task = asyncio.create_task(VM(PROGRAM).run_async(values.get, sink))
+            await asyncio.sleep(0)
+            self.assertFalse(task.done())  # Suspended on the first SCAN
+            values.put_nowait(3)
+            values.put_nowait(40)
+            result = await task
+            return printed, result
+
+        printed, result = asyncio.run(session())
+        self.assertEqual(printed, [43])
+        self.assertEqual(result["output"], [43])
+
+    def test_input_data_used_first(self):
+        async def source():
+            return 5
+        result = asyncio.run(VM(PROGRAM, [1], quiet=True).run_async(source))
+        self.assertEqual(result["output"], [6])
+
+    def test_no_source(self):
+        with self.assertRaises(RuntimeError):
+            asyncio.run(VM(PROGRAM, [1], quiet=True).run_async())
+
+    def test_long_runs_interleave(self):
+        order = []
+
+        async def session(name):
+            vm = VM(PROGRAM, [0, 5000], quiet=True)
+            task = asyncio.create_task(vm.run_async(yield_every=500))
+            while not task.done():
+                order.append(name)
+                await asyncio.sleep(0)
+            return await task
+
+        async def both():
+            return await asyncio.gather(session("a"), session("b"))
+
+        results = asyncio.run(both())
+        self.assertEqual([result["output"] for result in results], [[5000], [5000]])
+        self.assertGreater(order.count("a"), 10)
+        self.assertIn("b", order[:order.index("a") + 3])
+
+    def test_limit_applies_across_pauses(self):
+        vm = VM(PROGRAM, [0, 5000], quiet=True, max_instructions=1234)
+        with self.assertRaises(RuntimeError):
+            asyncio.run(vm.run_async(yield_every=100))
+        self.assertEqual(vm.instructions_executed, 1234)
+
+    def test_many_sessions(self):
+        result = session_benchmark("gcd", 200)
+        self.assertEqual(result["sessions"], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
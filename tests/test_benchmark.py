@@ -0,0 +1,55 @@
+# tests/test_benchmark.py
+import unittest
+from tests import benchmark
+
+
+def results(**programs):
+    return {"format": benchmark.FORMAT_VERSION, "opt_level": 1, "programs": programs}
+
+
+def metrics(**changes):
+    values = {"compile_time": 0.01, "instructions": 100, "steps": 5000, "vm_time": 0.02, "peak_memory": 40000}
+    values.update(changes)
+    return values
+
+
+class BenchmarkTests(unittest.TestCase):
+    """The corpus and the regression check"""
+
+    def test_corpus(self):
+        names = [name for name, _, _ in benchmark.load_corpus()]
+        for name in ("factorize", "primes", "gcd", "power", "digits", "nested"):
+            self.assertIn(name, names)
+        with self.assertRaises(benchmark.BenchmarkError):
+            benchmark.load_corpus(names=["missing"])
+
+    def test_measure(self):
+        # measure checks the output against the interpreter
+        (_, source, inputs), = benchmark.load_corpus(names=["gcd"])
+        measured = benchmark.measure(source, inputs, repeat=1)
+        self.assertEqual(set(measured), set(benchmark.METRICS))
+        self.assertGreater(measured["steps"], 0)
+        self.assertGreater(measured["peak_memory"], 0)
+
+    def test_compare(self):
+        baseline = results(a=metrics(), b=metrics())
+        self.assertEqual(benchmark.compare(baseline, results(a=metrics(steps=4000), b=metrics(vm_time=0.022))), [])
+        self.assertEqual(benchmark.compare(baseline, results(a=metrics(steps=5001), b=metrics(vm_time=0.03))),
+                         [("a", "steps", 5000, 5001), ("b", "vm_time", 0.02, 0.03)])
+        self.assertEqual(benchmark.compare(baseline, results(a=metrics(steps=5001)), threshold=0.01), [])
+
+    def test_division_sweep(self):
+        results = benchmark.division_benchmark(max_bits=12, samples=2)
+        for op, result in results.items():
+            self.assertEqual([k for k, _, _ in result["rows"]], list(range(12)))
+            for k, classic, current in result["rows"][1:]:
+                self.assertLess(current, classic, f"{op} k={k}")
+            self.assertLess(result["current"][1], result["classic"][1] / 2, op)
+
+    def test_noise_floor(self):
+        baseline = results(a=metrics(compile_time=0.0001))
+        self.assertEqual(benchmark.compare(baseline, results(a=metrics(compile_time=0.0005))), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# tests/test_cache.py
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from compiler.cache import ResultCache, cached_run
+from compiler.target import Target
+from tests.support import compile_source
+from vm import VM
+
+SOURCE = """
+CONST
+VAR a b
+BEGIN
+  READ a;
+  READ b;
+  a := a * b;
+  WRITE a;
+END
+"""
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.program, _ = compile_source(SOURCE)
+
+    def test_hit_returns_the_original_result(self):
+        cache = ResultCache()
+        result, hit = cached_run(cache, self.program, [6, 7], quiet=True)
+        self.assertFalse(hit)
+        self.assertEqual(result, VM(self.program, [6, 7], quiet=True).run())
+        again, hit = cached_run(cache, self.program, [6, 7], quiet=True)
+        self.assertTrue(hit)
+        self.assertEqual(again, result)
+        self.assertEqual(cache.stats, {"memory_hits": 1, "disk_hits": 0, "misses": 1, "stores": 1, "evictions": 0})
+
+    def test_hit_prints_like_a_run(self):
+        cache = ResultCache()
+        printed = []
+        for _ in range(2):
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                cached_run(cache, self.program, [6, 7])
+            printed.append(out.getvalue())
+        self.assertEqual(printed, ["Output: 42\n"] * 2)
+
+    def test_key_covers_inputs_and_target(self):
+        cache = ResultCache()
+        cached_run(cache, self.program, [6, 7], quiet=True)
+        self.assertIsNone(cache.get(self.program, [7, 6]))
+        cheap = Target("cheap", [(None, 1)])
+        self.assertIsNone(cache.get(self.program, [6, 7], cheap))
+        result, hit = cached_run(cache, self.program, [6, 7], cheap, quiet=True)
+        self.assertFalse(hit)
+        self.assertLess(result["steps"], cache.get(self.program, [6, 7])["steps"])
+
+    def test_disk_tier_is_shared(self):
+        first = ResultCache(self.directory.name)
+        result, _ = cached_run(first, self.program, [3, 5], quiet=True)
+        second = ResultCache(self.directory.name)
+        self.assertEqual(second.get(self.program, [3, 5]), result)
+        self.assertEqual(second.get(self.program, [3, 5]), result)
+        self.assertEqual((second.stats["disk_hits"], second.stats["memory_hits"]), (1, 1))
+
+        # A damaged file is a miss
+        for _, _, path in second.entries():
+            with open(path, 'w') as f:
+                f.write("{")
+        self.assertIsNone(ResultCache(self.directory.name).get(self.program, [3, 5]))
+
+    def test_size_limits(self):
+        size = len(json.dumps(VM(self.program, [9, 2], quiet=True).run()))
+        cache = ResultCache(self.directory.name, memory_bytes=3 * size, disk_bytes=3 * size)
+        for value in range(10):
+            cached_run(cache, self.program, [value, 2], quiet=True)
+        self.assertLessEqual(cache.memory_size, 3 * size)
+        self.assertLessEqual(sum(size for _, size, _ in cache.entries()), 3 * size)
+        self.assertGreater(cache.stats["evictions"], 0)
+        # The most recent result survives in both tiers
+        self.assertIsNotNone(cache.get(self.program, [9, 2]))
+        self.assertIsNotNone(ResultCache(self.directory.name).get(self.program, [9, 2]))
+
+    def test_writes_under_the_limit_do_not_list_the_directory(self):
+        cache = ResultCache(self.directory.name)
+        cached_run(cache, self.program, [0, 2], quiet=True)
+        listed = []
+        entries = cache.entries
+        cache.entries = lambda: listed.append(1) or entries()
+        for value in range(1, 20):
+            cached_run(cache, self.program, [value, 2], quiet=True)
+        self.assertEqual(listed, [])
+        self.assertEqual(cache.disk_size, sum(size for _, size, _ in entries()))
+
+    def test_runs_needing_more_input_are_not_stored(self):
+        cache = ResultCache(self.directory.name)
+        with self.assertRaises(RuntimeError):
+            cached_run(cache, self.program, [4], interactive=False, quiet=True)
+        self.assertEqual(cache.stats["stores"], 0)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+# tests/test_codegen.py
+import unittest
+from compiler.constants import build_sequence, derive_sequence, plan_pool
+from tests import support
+from vm import VM, Instruction
+
+
+def compile_source(source_code, opt_level=1):
+    return support.compile_source(source_code, opt_level=opt_level)[0]
+
+
+def run_program(program, input_data=None):
+    return VM(program, list(input_data or []), quiet=True).run()
+
+
+class ConstantTests(unittest.TestCase):
+    """Cost-based constant materialization"""
+
+    def test_build_sequence_values(self):
+        for value in [0, 1, 2, 5, 255, 256, 12345678901234567890]:
+            vm = VM([Instruction(op, arg) for op, arg in build_sequence(value)])
+            vm.run()
+            self.assertEqual(vm.a, value)
+
+    def test_derive_sequence(self):
+        self.assertEqual(derive_sequence(12, 13, 100), [("INC", None)])
+        self.assertEqual(derive_sequence(5, 20, 100), [("SHL", None), ("SHL", None)])
+        self.assertEqual(derive_sequence(20, 5, 100), [("SHR", None), ("SHR", None)])
+        self.assertIsNone(derive_sequence(0, 1000, 3))
+
+    def test_pool_only_for_long_chains_in_loops(self):
+        huge = 2 ** 128 - 1
+        self.assertEqual(plan_pool({huge: [2]}, 100, 100), [huge])
+        self.assertEqual(plan_pool({huge: [0]}, 100, 100), [])
+        self.assertEqual(plan_pool({1000: [3]}, 100, 100), [])
+
+    def test_constants_keep_their_values(self):
+        source = """
+        CONST one := 1 two := 2 big := 1000000007
+        VAR n i x y
+        BEGIN
+          READ n;
+          i := one;
+          WHILE i <= n DO
+            x := 340282366920938463463374607431768211455;
+            y := 12;
+            y := 13;
+            i := i + one;
+          END
+          x := two;
+          WRITE x;
+          WRITE y;
+          WRITE big;
+        END
+        """
+        result = run_program(compile_source(source), [30])
+        self.assertEqual(result["output"], [2, 13, 1000000007])
+
+
+class ConditionTests(unittest.TestCase):
+    """Every relation against saturating subtraction"""
+
+    def test_all_relations(self):
+        relations = {
+            '==': lambda a, b: a == b, '!=': lambda a, b: a != b,
+            '<': lambda a, b: a < b, '>': lambda a, b: a > b,
+            '<=': lambda a, b: a <= b, '>=': lambda a, b: a >= b,
+        }
+        for relop, expected in relations.items():
+            source = f"""
+            CONST yes := 1 no := 0
+            VAR a b
+            BEGIN
+              READ a; READ b;
+              IF a {relop} b THEN WRITE yes; ELSE WRITE no; END
+            END
+            """
+            program = compile_source(source)
+            for a, b in [(3, 5), (5, 3), (4, 4), (0, 0), (0, 7)]:
+                result = run_program(program, [a, b])
+                self.assertEqual(result["output"], [int(expected(a, b))], f"{a} {relop} {b}")
+
+
+class ArithmeticTests(unittest.TestCase):
+    """Multiplication, division and modulo templates"""
+
+    SOURCE = """
+    CONST
+    VAR a b c d e
+    BEGIN
+      READ a; READ b;
+      c := a * b; d := a / b; e := a % b;
+      WRITE c; WRITE d; WRITE e;
+    END
+    """
+
+    def test_small_operands(self):
+        for opt_level in (1, 's'):
+            program = compile_source(self.SOURCE, opt_level)
+            for a in range(0, 20):
+                for b in range(0, 9):
+                    expected = [a * b, a // b if b else 0, a % b if b else 0]
+                    self.assertEqual(run_program(program, [a, b])["output"], expected, f"{a}, {b}")
+
+    def test_large_operands(self):
+        program = compile_source(self.SOURCE)
+        for a, b in [(2 ** 64, 2 ** 32), (2 ** 64 - 1, 3), (12345678901234567890, 987654321), (5, 2 ** 70)]:
+            self.assertEqual(run_program(program, [a, b])["output"], [a * b, a // b, a % b])
+
+    def test_exact_fits(self):
+        # Every compare of b * 2**k by b is an equality, the case a JG after
+        # SUB used to send down the wrong branch
+        program = compile_source(self.SOURCE)
+        for b in (1, 2, 3, 7, 2 ** 40 + 1):
+            for k in range(0, 12):
+                for a in (b << k, (b << k) - 1, (b << k) + b - 1):
+                    self.assertEqual(run_program(program, [a, b])["output"][1:], [a // b, a % b], f"{a}, {b}")
+
+    def test_steps_per_quotient_bit(self):
+        # A fixed cost per bit of bits(a) - bits(b), whatever the operand size
+        for op in ('/', '%'):
+            program = compile_source(self.SOURCE.replace("c := a * b; d := a / b; e := a % b;", f"c := a {op} b;")
+                                     .replace("WRITE d; WRITE e;", ""))
+            for b in (3, 2 ** 64 + 1):
+                steps = [run_program(program, [b << k, b])["steps"] for k in range(1, 8)]
+                self.assertEqual(len({later - earlier for earlier, later in zip(steps, steps[1:])}), 1, op)
+
+
+class SizeModeTests(unittest.TestCase):
+    """-Os shares one copy of each arithmetic routine"""
+
+    SOURCE = """
+    CONST
+    VAR a b c d e
+    BEGIN
+      READ a; READ b;
+      c := a * b;
+      d := b * c;
+      e := c * d;
+      WRITE c; WRITE d; WRITE e;
+      c := a * a;
+      WRITE c;
+    END
+    """
+
+    def test_same_output_smaller_code(self):
+        inline = compile_source(self.SOURCE)
+        shared = compile_source(self.SOURCE, opt_level='s')
+        self.assertLess(len(shared), len(inline))
+        for inputs in ([3, 7], [0, 5], [12345, 678]):
+            self.assertEqual(run_program(shared, inputs)["output"], run_program(inline, inputs)["output"])
+
+    def test_single_use_stays_inline(self):
+        source = """
+        CONST
+        VAR a b c
+        BEGIN
+          READ a; READ b;
+          c := a * b;
+          WRITE c;
+        END
+        """
+        self.assertEqual(len(compile_source(source, opt_level='s')), len(compile_source(source)))
+
+
+class LayoutTests(unittest.TestCase):
+    """Loop rotation, inverted tests and threading cut executed jumps"""
+
+    def test_fewer_jumps_same_output(self):
+        for relop in ('<', '<=', '!='):
+            source = f"""
+            CONST one := 1 two := 2
+            VAR i n s r
+            BEGIN
+              READ n;
+              i := one;
+              s := one;
+              WHILE i {relop} n DO
+                r := i % two;
+                IF r == one THEN
+                  s := s + i;
+                ELSE
+                  s := s + two;
+                END
+                i := i + one;
+              END
+              WRITE s;
+            END
+            """
+            plain = run_program(compile_source(source, opt_level=0), [40])
+            laid_out = run_program(compile_source(source), [40])
+            self.assertEqual(laid_out["output"], plain["output"])
+            self.assertLess(laid_out["jumps"], plain["jumps"], relop)
+            self.assertLessEqual(laid_out["steps"], plain["steps"], relop)
+
+    def test_loop_that_never_runs(self):
+        source = """
+        CONST one := 1
+        VAR i n
+        BEGIN
+          READ n;
+          i := one;
+          WHILE i < n DO
+            i := i + one;
+          END
+          WRITE i;
+        END
+        """
+        program = compile_source(source)
+        self.assertEqual(run_program(program, [0])["output"], [1])
+        self.assertEqual(run_program(program, [5])["output"], [5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# tests/test_complexity.py
+import csv
+import json
+import math
+import os
+import tempfile
+import unittest
+from tests import complexity
+
+
+def curve(steps, max_bits=64):
+    points = [(bits, steps(bits)) for bits in range(1, max_bits + 1)]
+    return {"points": points, "fit": complexity._fit(points), "growth": complexity.growth(points)}
+
+
+def results(**curves):
+    return {"curves": {name.replace("_", " "): value for name, value in curves.items()}}
+
+
+class ComplexityTests(unittest.TestCase):
+    """The operand-length sweep and its growth and baseline checks"""
+
+    def test_sweep_is_linear(self):
+        swept = complexity.sweep(max_bits=32, samples=2, jobs=1)
+        self.assertEqual(len(swept["curves"]), len(complexity.OPERATORS) * len(complexity.ORDERS))
+        self.assertEqual(complexity.check(swept), [])
+        self.assertEqual(complexity.check(swept, swept), [])
+        for name in ("* long-long", "/ long-short", "% long-short"):
+            self.assertGreater(swept["curves"][name]["fit"][1], 10, name)
+        # The pool measures the same operands
+        self.assertEqual(complexity.sweep(max_bits=8, samples=1, jobs=2),
+                         complexity.sweep(max_bits=8, samples=1, jobs=1))
+
+    def test_growth(self):
+        linear = results(a_b=curve(lambda bits: 900 + 212 * bits), flat=curve(lambda bits: 800 + bits % 2))
+        self.assertEqual(complexity.check(linear), [])
+        for steps in (lambda bits: 50 * bits * bits, lambda bits: 200 * bits * math.log2(bits)):
+            failures = complexity.check(results(a_b=curve(steps, 256)))
+            self.assertEqual([name for name, _ in failures], ["a b"])
+            self.assertIn("superlinear", failures[0][1])
+
+    def test_baseline(self):
+        baseline = results(a_b=curve(lambda bits: 900 + 212 * bits), flat=curve(lambda bits: 800))
+        current = results(a_b=curve(lambda bits: 900 + 214 * bits), flat=curve(lambda bits: 810))
+        self.assertEqual([(name, reason.split()[0]) for name, reason in complexity.check(current, baseline)],
+                         [("a b", "slope"), ("flat", "intercept")])
+        self.assertEqual(complexity.check(current, baseline, threshold=0.02), [])
+        self.assertEqual(complexity.check(baseline, current), [])
+
+    def test_outputs(self):
+        swept = complexity.sweep(max_bits=4, samples=1, jobs=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "curves.csv")
+            complexity.write_csv(swept, path)
+            with open(path) as f:
+                rows = list(csv.DictReader(f))
+            path = os.path.join(directory, "baseline.json")
+            complexity.save_baseline(swept, path)
+            with open(path) as f:
+                baseline = json.load(f)
+        # Only the growth of a sweep this short can fail, never its fit against itself
+        self.assertEqual(complexity.check(swept, baseline), complexity.check(swept))
+        self.assertNotIn("points", baseline["curves"]["* long-short"])
+        self.assertEqual(len(rows), 4 * len(swept["curves"]))
+        self.assertEqual((rows[0]["op"], rows[0]["order"], rows[0]["bits"]), ("*", "long-short", "1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# tests/test_costs.py
+import json
+import unittest
+from compiler import costs
+from tests.support import compile_source
+from vm import VM, parse_program
+
+
+def analyze_source(source_code, opt_level=1):
+    program, code_gen = compile_source(source_code, opt_level=opt_level)
+    return program, costs.analyze(program, code_gen)
+
+
+def run_steps(program, input_data):
+    return VM(program, list(input_data), quiet=True).run()["steps"]
+
+
+ARITHMETIC = """
+CONST
+VAR a b c d e
+BEGIN
+  READ a; READ b;
+  c := a * b; d := a / b; e := a % b;
+  WRITE c; WRITE d; WRITE e;
+  d := b / a; e := b % a;
+  WRITE d; WRITE e;
+END
+"""
+
+LOOP = """
+CONST one := 1
+VAR i n s
+BEGIN
+  READ n;
+  WHILE i < n DO
+    s := s + i;
+    i := i + one;
+  END
+  WRITE s;
+END
+"""
+
+
+class CostTests(unittest.TestCase):
+    """Static step costs against measured VM steps"""
+
+    def test_straight_line_is_exact(self):
+        source = """
+        CONST two := 2
+        VAR a b
+        BEGIN
+          READ a;
+          b := a + two;
+          WRITE b;
+        END
+        """
+        program, report = analyze_source(source)
+        cost = report.functions["main"][1]
+        self.assertEqual(cost.terms, {})
+        self.assertEqual(cost.low, run_steps(program, [5]))
+        self.assertEqual(cost.high, cost.low)
+
+    def test_loop_bound(self):
+        for opt_level in (0, 1):
+            program, report = analyze_source(LOOP, opt_level)
+            (loop,) = report.loops.values()
+            self.assertEqual(loop.trips, "n[1]")
+            for n in (0, 1, 7, 30):
+                self.assertGreaterEqual(report.bound({"n[1]": n}), run_steps(program, [n]), n)
+            self.assertIsNone(report.bound())
+
+    def test_template_bounds(self):
+        for opt_level in (0, 1, 's'):
+            program, report = analyze_source(ARITHMETIC, opt_level)
+            self.assertEqual(sorted({t["op"] for t in report.templates}), ['%', '*', '/'])
+            for a, b in [(0, 0), (1, 7), (255, 3), (2 ** 40 - 1, 12345), (2 ** 63, 2 ** 63)]:
+                bits = max(a.bit_length(), b.bit_length(), 1)
+                self.assertGreaterEqual(report.bound(bits=bits), run_steps(program, [a, b]), (opt_level, a, b))
+
+    def test_routines_are_calls(self):
+        _, report = analyze_source(ARITHMETIC, 's')
+        self.assertEqual(report.functions["main"][1].terms.get("call /"), 2)
+        self.assertIn("call %", report.functions)
+
+    def test_annotated_output_loads(self):
+        program, report = analyze_source(LOOP)
+        text = report.annotate()
+        self.assertIn("; block 0:", text)
+        self.assertEqual([(i.op, i.arg) for i in parse_program(text)], [(i.op, i.arg) for i in program])
+
+    def test_json_report(self):
+        program, report = analyze_source(ARITHMETIC)
+        data = json.loads(report.to_json())
+        self.assertEqual(data["instructions"], len(program))
+        self.assertEqual(sum(b["end"] - b["start"] for b in data["blocks"]), len(program))
+        for template in data["templates"]:
+            self.assertEqual(template["bound"], f"{template['constant']} + {template['per_bit']}*n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# tests/test_incremental.py
+import unittest
+from compiler.codegen import CodeGenerator
+from compiler.incremental import IncrementalCompiler, command_key
+from compiler.interpreter import Interpreter, LimitExceeded
+from tests import fuzz
+from tests.support import analyze
+from vm import VM
+
+SOURCE = """
+CONST one := 1 two := 2
+VAR n i s p
+BEGIN
+  READ n;
+  WHILE i < n DO
+    p := i * two;
+    s := s + p;
+    i := i + one;
+  END
+  IF s > n THEN WRITE s; ELSE WRITE n; END
+  p := s % n;
+  WRITE p;
+END
+"""
+
+
+def run_program(program, input_data):
+    return VM(program, list(input_data), quiet=True, max_instructions=fuzz.MAX_INSTRUCTIONS).run()["output"]
+
+
+class IncrementalTests(unittest.TestCase):
+    """Fragment caching, relinking and agreement with full builds"""
+
+    def test_edit_compiles_one_command(self):
+        ast, analyzer = analyze(SOURCE)
+        compiler = IncrementalCompiler()
+        compiler.compile(ast, analyzer)
+        self.assertEqual(compiler.stats["compiled"], 5)
+
+        edited, _ = analyze(SOURCE.replace("p := i * two;", "p := i + two;"))
+        program = compiler.compile(edited, analyzer)
+        self.assertEqual(compiler.stats, {"commands": 5, "reused": 4, "compiled": 1})
+
+        fresh, _ = CodeGenerator(analyzer).generate(edited)
+        for n in (0, 1, 9):
+            self.assertEqual(run_program(program, [n]), run_program(fresh, [n]))
+
+    def test_layout_does_not_matter(self):
+        ast, _ = analyze(SOURCE)
+        reformatted, _ = analyze(SOURCE.replace("\n  ", "\n").replace(";", " ;"))
+        self.assertEqual([command_key(c) for c in ast.commands], [command_key(c) for c in reformatted.commands])
+
+    def test_declarations_reset_the_cache(self):
+        ast, analyzer = analyze(SOURCE)
+        compiler = IncrementalCompiler()
+        compiler.compile(ast, analyzer)
+        ast, analyzer = analyze(SOURCE.replace("VAR n i s p", "VAR extra n i s p"))
+        program = compiler.compile(ast, analyzer)
+        self.assertEqual(compiler.stats["reused"], 0)
+        self.assertEqual(run_program(program, [5]), [20, 0])
+
+    def test_generated_programs(self):
+        checked = 0
+        for seed in range(60):
+            source, inputs = fuzz.generate_program(seed)
+            ast, analyzer = analyze(source)
+            try:
+                expected = Interpreter(ast, inputs, max_steps=fuzz.MAX_STEPS, max_bits=fuzz.MAX_BITS).run()["output"]
+            except LimitExceeded:
+                continue
+            for opt_level in (0, 1):
+                program = IncrementalCompiler(opt_level).compile(ast, analyzer)
+                self.assertEqual(run_program(program, inputs), expected, f"seed {seed} at -O{opt_level}")
+            checked += 1
+        self.assertGreater(checked, 30)
+
+    def test_size_mode_unsupported(self):
+        with self.assertRaises(ValueError):
+            IncrementalCompiler('s')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+# tests/test_interpreter.py
+import unittest
+from compiler.lexer import lexer
+from compiler.parser import parse, Write
+from compiler.interpreter import interpret, InterpreterError, LimitExceeded
+from tests import fuzz
+
+
+def run_source(source_code, input_data=None, **limits):
+    return interpret(parse(source_code, lexer=lexer.clone()), input_data, **limits)
+
+
+class InterpreterTests(unittest.TestCase):
+    """Language semantics the compiled code must match"""
+
+    def test_arithmetic(self):
+        source = """
+        CONST
+        zero := 0
+        VAR
+        a b c d e f g
+        BEGIN
+          READ a;
+          READ b;
+          c := b - a;
+          d := a / b;
+          e := a % b;
+          f := a / zero;
+          g := a % zero;
+          WRITE c;
+          WRITE d;
+          WRITE e;
+          WRITE f;
+          WRITE g;
+        END
+        """
+        self.assertEqual(run_source(source, [17, 5]), [0, 3, 2, 0, 0])
+
+    def test_control_flow(self):
+        source = """
+        CONST
+        one := 1
+        VAR
+        n s
+        BEGIN
+          READ n;
+          WHILE n > s DO
+            s := s + one;
+          END
+          IF s == n THEN
+            WRITE one;
+          ELSE
+            WRITE s;
+          END
+          WRITE s;
+        END
+        """
+        self.assertEqual(run_source(source, [4]), [1, 4])
+
+    def test_limits(self):
+        loop = """
+        CONST
+        one := 1
+        VAR
+        a
+        BEGIN
+          WHILE one > a DO
+            WRITE a;
+          END
+        END
+        """
+        with self.assertRaises(LimitExceeded):
+            run_source(loop, max_steps=100)
+        with self.assertRaises(InterpreterError):
+            run_source("CONST VAR a BEGIN READ a; END", [])
+
+
+class FuzzTests(unittest.TestCase):
+    """The generator, the differential check and shrinking"""
+
+    def test_generated_programs_agree(self):
+        failures, skipped, _ = fuzz.fuzz(range(40), jobs=1)
+        self.assertEqual(failures, [])
+        self.assertLess(skipped, 40)
+
+    def test_generator_is_deterministic(self):
+        self.assertEqual(fuzz.generate_program(7), fuzz.generate_program(7))
+
+    def test_format_round_trip(self):
+        source, _ = fuzz.generate_program(3)
+        ast = parse(source, lexer=lexer.clone())
+        self.assertEqual(fuzz.format_program(parse(fuzz.format_program(ast), lexer=lexer.clone())),
+                         fuzz.format_program(ast))
+
+    def test_shrink_keeps_failure(self):
+        source, inputs = fuzz.generate_program(11)
+        ast = parse(source, lexer=lexer.clone())
+
+        # Pretend any program that still writes something fails
+        def writes(candidate, _):
+            return any(isinstance(command, Write) for command in candidate.commands)
+
+        reduced = fuzz.shrink(ast, inputs, writes)
+        self.assertEqual(len(reduced.commands), 1)
+        self.assertIsInstance(reduced.commands[0], Write)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# tests/test_machine.py
+import os
+import sys
+import tempfile
+import unittest
+from compiler.machine import Code, Instruction, NO_ARG, VerificationError, load, save, verify
+from tests import support
+from vm import VM, parse_program
+
+SOURCE = """
+CONST one := 1 ten := 10
+VAR n i s q
+BEGIN
+  READ n;
+  WHILE i < n DO
+    s := s + i;
+    i := i + one;
+  END
+  q := s / ten;
+  WRITE s;
+  WRITE q;
+END
+"""
+
+
+def compile_source(source):
+    return support.compile_source(source)[0]
+
+
+class TestCode(unittest.TestCase):
+    def setUp(self):
+        self.program = compile_source(SOURCE)
+
+    def test_codegen_emits_code(self):
+        self.assertIsInstance(self.program, Code)
+        self.assertEqual(len(self.program.ops), len(self.program.args))
+        self.assertEqual(self.program[-1], Instruction("HALT"))
+        self.assertEqual(self.program.args[-1], NO_ARG)
+
+    def test_text_round_trip(self):
+        text = self.program.to_text()
+        self.assertEqual(Code.from_text(text), self.program)
+        self.assertEqual(parse_program(text), self.program)
+        self.assertEqual(Code.from_text("LOAD 3 ; comment\n\n  HALT\n"),
+                         Code.from_instructions([("LOAD", 3), ("HALT", None)]))
+
+    def test_text_errors(self):
+        with self.assertRaises(ValueError):
+            Code.from_text("LOAD 3\nFETCH 2\n")
+        with self.assertRaises(ValueError):
+            Code.from_text("LOAD 3 4\n")
+
+    def test_binary_round_trip(self):
+        data = self.program.to_bytes()
+        self.assertEqual(Code.from_bytes(data), self.program)
+        with self.assertRaises(ValueError):
+            Code.from_bytes(data[:-1])
+        with self.assertRaises(ValueError):
+            Code.from_bytes(b"XXXX" + data[4:])
+
+    def test_load_detects_form(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for binary in (False, True):
+                path = os.path.join(directory, "program.out")
+                save(self.program, path, binary=binary)
+                self.assertEqual(load(path), self.program)
+
+    def test_views_are_copies(self):
+        view = self.program[0]
+        view.arg = 999
+        self.assertNotEqual(self.program[0].arg, 999)
+        self.assertEqual(self.program[2:4], Code.from_instructions(list(self.program)[2:4]))
+
+    def test_smaller_than_instruction_list(self):
+        instructions = list(self.program)
+        code_size = sys.getsizeof(self.program.ops) + sys.getsizeof(self.program.args)
+        list_size = sys.getsizeof(instructions) + sum(sys.getsizeof(instr) for instr in instructions)
+        self.assertLess(code_size * 4, list_size)
+
+
+class TestVMOnCode(unittest.TestCase):
+    def test_code_and_instruction_list_agree(self):
+        program = compile_source(SOURCE)
+        from_code = VM(program, [7], quiet=True).run()
+        from_list = VM(list(program), [7], quiet=True).run()
+        self.assertEqual(from_code, from_list)
+        self.assertEqual(from_code["output"], [21, 2])
+
+    def test_profile_counts(self):
+        program = Code.from_text("ZERO\nINC\nSTORE 1\nJODD 5\nHALT\nJZ 4\nJUMP 4\n")
+        vm = VM(program, profile=True)
+        result = vm.run()
+        self.assertEqual(vm.counts, [1] * 7)
+        self.assertEqual(vm.taken, [0, 0, 0, 1, 0, 0, 1])
+        self.assertEqual(result["jumps"], 3)
+        self.assertEqual(result["jumps_taken"], 2)
+        self.assertEqual(result["steps"], 1 + 1 + 10 + 1 + 1 + 1)
+
+    def test_instruction_limit_keeps_state(self):
+        vm = VM(Code.from_text("INC\nJUMP 0\n"), max_instructions=11)
+        with self.assertRaises(RuntimeError):
+            vm.run()
+        self.assertEqual(vm.instructions_executed, 11)
+        self.assertEqual(vm.a, 6)
+
+
+
+class TestVerifier(unittest.TestCase):
+    def problems(self, text):
+        with self.assertRaises(VerificationError) as caught:
+            verify(Code.from_text(text))
+        return caught.exception.problems
+
+    def test_compiled_programs_verify(self):
+        verify(compile_source(SOURCE))
+
+    def test_argument_checks(self):
+        problems = self.problems("LOAD\nHALT 2\nJUMP 9\nSTORE 1000\nINC 4\nJZ -3\nHALT\n")
+        self.assertEqual(problems, ["[0] LOAD needs an argument", "[1] HALT takes no argument, got 2",
+                                    "[2] JUMP target 9 outside 0..6", "[3] STORE address 1000 outside 0..999",
+                                    "[4] INC takes no argument, got 4", "[5] JZ target -3 outside 0..6"])
+        ops = bytearray(Code.from_text("HALT").ops)
+        ops[0] = 99
+        with self.assertRaises(VerificationError):
+            verify(Code(ops, Code.from_text("HALT").args))
+
+    def test_control_flow_checks(self):
+        self.assertEqual(self.problems("INC\nJUMP 0\nHALT\n"), ["no HALT is reachable from the entry"])
+        self.assertIn("[3] INC runs off the end of the program", self.problems("ZERO\nJZ 3\nHALT\nINC\n"))
+        self.assertEqual(self.problems(""), ["empty program has no HALT"])
+        verify(Code.from_text("ZERO\nJZ 3\nJUMP 2\nHALT\n"))  # An endless loop may still reach HALT
+
+    def test_parse_program_verifies(self):
+        with self.assertRaises(VerificationError):
+            parse_program("LOAD 3\nJUMP 7\n")
+        self.assertEqual(len(parse_program("LOAD 3\nJUMP 7\n", check=False)), 2)
+
+    def test_verified_run_matches(self):
+        program = compile_source(SOURCE)
+        checked = VM(program, [9], quiet=True).run()
+        vm = VM(program, [9], quiet=True, verified=True)
+        self.assertTrue(vm._unchecked())
+        self.assertEqual(vm.run(), checked)
+        self.assertFalse(VM(program, [9], quiet=True, verified=True, profile=True)._unchecked())
+        with self.assertRaises(VerificationError):
+            VM(Code.from_text("INC\n"), verified=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,225 @@
+# tests/test_optimizer.py
+import unittest
+from compiler.codegen import CodeGenerator
+from compiler.ir import IRBuilder, IRError, Op
+from compiler.passes import Pass, PassManager
+from tests.support import analyze
+from vm import VM
+
+
+def compile_and_run(source_code, input_data=None, optimize=True):
+    ast, analyzer = analyze(source_code)
+    code_gen = CodeGenerator(analyzer, opt_level=1 if optimize else 0)
+    program, _ = code_gen.generate(ast)
+    result = VM(program, list(input_data or [])).run()
+
+    stats = {"hoisted": 0, "reused": 0}
+    for record in code_gen.pass_manager.records:
+        for key in stats:
+            stats[key] += record.stats.get(key, 0)
+    return result, stats
+
+
+class OptimizerTests(unittest.TestCase):
+    """LICM and CSE must keep program output while saving steps"""
+
+    def assert_same_output_fewer_steps(self, source, input_data):
+        plain, _ = compile_and_run(source, input_data, optimize=False)
+        optimized, stats = compile_and_run(source, input_data)
+        self.assertEqual(optimized["output"], plain["output"])
+        self.assertLess(optimized["steps"], plain["steps"])
+        return stats
+
+    def test_loop_invariant_multiplication_is_hoisted(self):
+        source = """
+        CONST one := 1
+        VAR n x y i s a
+        BEGIN
+          READ n; READ x; READ y;
+          i := one;
+          s := one;
+          WHILE i <= n DO
+            a := x * y;
+            s := s + a;
+            i := i + one;
+          END
+          WRITE s;
+        END
+        """
+        stats = self.assert_same_output_fewer_steps(source, [10, 123, 456])
+        self.assertEqual(stats["hoisted"], 1)
+
+    def test_operand_assigned_in_loop_is_not_hoisted(self):
+        source = """
+        CONST one := 1
+        VAR n x y i a
+        BEGIN
+          READ n; READ y;
+          i := one;
+          x := one;
+          WHILE i <= n DO
+            a := x * y;
+            x := x + one;
+            i := i + one;
+          END
+          WRITE a;
+        END
+        """
+        plain, _ = compile_and_run(source, [5, 7], optimize=False)
+        optimized, stats = compile_and_run(source, [5, 7])
+        self.assertEqual(optimized["output"], plain["output"])
+        self.assertEqual(stats["hoisted"], 0)
+
+    def test_common_subexpression_across_branches(self):
+        source = """
+        CONST
+        VAR x y a b c
+        BEGIN
+          READ x; READ y; READ c;
+          IF x <= c THEN
+            a := x * y;
+          ELSE
+            a := y * x;
+          END
+          b := x * y;
+          WRITE a;
+          WRITE b;
+        END
+        """
+        stats = self.assert_same_output_fewer_steps(source, [12, 34, 5])
+        self.assertEqual(stats["reused"], 1)
+
+    def test_read_kills_available_expression(self):
+        source = """
+        CONST
+        VAR x y a b
+        BEGIN
+          READ x; READ y;
+          a := x * y;
+          READ x;
+          b := x * y;
+          WRITE a;
+          WRITE b;
+        END
+        """
+        result, stats = compile_and_run(source, [3, 4, 5])
+        self.assertEqual(result["output"], [12, 20])
+        self.assertEqual(stats["reused"], 0)
+
+
+class DeadCodeTests(unittest.TestCase):
+    """Dead stores, unused CONSTs and unused variables are dropped"""
+
+    SOURCE = """
+    CONST one := 1 two := 2 unused := 7
+    VAR n m reszta potega dzielnik
+    BEGIN
+      READ n;
+      READ reszta;
+      potega := n * n;
+      dzielnik := two;
+      WHILE dzielnik <= n DO
+        m := dzielnik * dzielnik;
+        WRITE m;
+        dzielnik := dzielnik + one;
+      END
+    END
+    """
+
+    def dce_record(self, code_gen):
+        return next(record for record in code_gen.pass_manager.records if record.name == "dce")
+
+    def test_removes_dead_code_and_saves_steps(self):
+        ast, analyzer = analyze(self.SOURCE)
+        code_gen = CodeGenerator(analyzer, measure_passes=True)
+        program, memory_map = code_gen.generate(ast)
+        record = self.dce_record(code_gen)
+        self.assertEqual(record.stats, {"stores": 1, "consts": 1, "variables": 1})
+        self.assertLess(record.steps, 0)
+        self.assertNotIn("potega", memory_map)
+        self.assertNotIn("unused", memory_map)
+        # READ still consumes its input when the value is never used
+        self.assertIn("reszta", memory_map)
+        self.assertEqual(VM(program, [4, 9]).run()["output"], [4, 9, 16])
+
+    def test_materialized_const_gets_no_cell(self):
+        ast, analyzer = analyze(self.SOURCE)
+        _, memory_map = CodeGenerator(analyzer).generate(ast)
+        # two is only copied into dzielnik, one is added from memory
+        self.assertNotIn("two", memory_map)
+        self.assertIn("one", memory_map)
+
+    def test_hot_cells_take_fast_addresses(self):
+        ast, analyzer = analyze(self.SOURCE)
+        code_gen = CodeGenerator(analyzer)
+        _, memory_map = code_gen.generate(ast)
+        # The multiplication loop's cells, then the loop counter, then cold cells
+        self.assertEqual(code_gen.scratch[:3], [0, 1, 2])
+        self.assertEqual(memory_map["dzielnik"], 3)
+        self.assertEqual(max(memory_map.values()), memory_map["reszta"])
+
+    def test_value_read_in_a_later_iteration_stays(self):
+        source = """
+        CONST one := 1
+        VAR n i last
+        BEGIN
+          READ n;
+          WHILE i < n DO
+            WRITE last;
+            last := i;
+            i := i + one;
+          END
+        END
+        """
+        result, _ = compile_and_run(source, [3])
+        self.assertEqual(result["output"], [0, 0, 1])
+
+
+class PassManagerTests(unittest.TestCase):
+    """IR construction, verification and pass bookkeeping"""
+
+    SOURCE = """
+    CONST one := 1
+    VAR n i x
+    BEGIN
+      READ n;
+      i := one;
+      WHILE i <= n DO
+        x := n * n;
+        i := i + one;
+      END
+      WRITE x;
+    END
+    """
+
+    def test_builder_output_verifies(self):
+        ast, analyzer = analyze(self.SOURCE)
+        program = IRBuilder(analyzer).build(ast)
+        program.verify()
+        self.assertEqual(len(program.blocks), 4)
+
+    def test_records_time_and_deltas_per_pass(self):
+        ast, analyzer = analyze(self.SOURCE)
+        code_gen = CodeGenerator(analyzer, measure_passes=True)
+        code_gen.generate(ast)
+        names = [record.name for record in code_gen.pass_manager.records]
+        self.assertEqual(names, ["licm", "cse", "dce", "thread", "rotate", "layout"])
+        licm = code_gen.pass_manager.records[0]
+        self.assertGreaterEqual(licm.seconds, 0)
+        self.assertLess(licm.steps, 0)
+
+    def test_broken_pass_is_caught_by_verifier(self):
+        class UndeclaredWrite(Pass):
+            name = "broken"
+
+            def run(self, program):
+                program.entry.ops.append(Op('write', a='nowhere'))
+
+        ast, analyzer = analyze(self.SOURCE)
+        program = IRBuilder(analyzer).build(ast)
+        with self.assertRaises(IRError):
+            PassManager([UndeclaredWrite()]).run(program)
+
+
+if __name__ == "__main__":
+    unittest.main()
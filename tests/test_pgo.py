@@ -0,0 +1,132 @@
+# tests/test_pgo.py
+import os
+import tempfile
+import unittest
+from compiler.codegen import CodeGenerator
+from compiler import pgo
+from tests.support import analyze
+from vm import VM
+
+TWO_LOOPS = """
+CONST
+one := 1
+VAR
+n i a b c j d e f
+BEGIN
+  READ n;
+  i := one;
+  a := one;
+  b := one;
+  WHILE i <= n DO
+    a := a + i;
+    b := b + a;
+    i := i + one;
+  END
+  j := one;
+  d := one;
+  e := one;
+  WHILE j <= n DO
+    d := d + j;
+    e := e + d;
+    f := e - d;
+    j := j + one;
+  END
+  WRITE b;
+  WRITE e;
+  WRITE f;
+END
+"""
+
+
+def train(source_code, input_data, opt_level=1):
+    ast, analyzer = analyze(source_code)
+    code_gen = CodeGenerator(analyzer, opt_level=opt_level)
+    program, _ = code_gen.generate(ast)
+    vm = VM(program, list(input_data), quiet=True, profile=True)
+    vm.run()
+    return pgo.collect(code_gen, vm, pgo.fingerprint(ast))
+
+
+def run(source_code, input_data, profile=None):
+    ast, analyzer = analyze(source_code)
+    code_gen = CodeGenerator(analyzer, profile=profile)
+    program, _ = code_gen.generate(ast)
+    return VM(program, list(input_data), quiet=True).run(), code_gen
+
+
+class ProfileTests(unittest.TestCase):
+    """Recording, mapping and merging execution counts"""
+
+    def test_counts_map_to_commands(self):
+        for opt_level in (0, 1, 's'):
+            profile = train(TWO_LOOPS, [7], opt_level)
+            loop = profile.nodes["4"]  # first WHILE
+            self.assertEqual((loop["true"], loop["false"], loop["count"]), (7, 1, 8))
+            self.assertEqual(profile.nodes["4.b1"]["count"], 7)
+            self.assertEqual(profile.nodes["0"]["count"], 1)
+            self.assertEqual(profile.cells["n"], 1 + 16)
+
+    def test_steps_add_up(self):
+        ast, analyzer = analyze(TWO_LOOPS)
+        code_gen = CodeGenerator(analyzer)
+        program, _ = code_gen.generate(ast)
+        vm = VM(program, [5], quiet=True, profile=True)
+        result = vm.run()
+        profile = pgo.collect(code_gen, vm, pgo.fingerprint(ast))
+        attributed = sum(node["steps"] for node in profile.nodes.values())
+        self.assertLessEqual(attributed, result["steps"])
+        self.assertEqual(sum(vm.counts), result["instructions"])
+
+    def test_merge_and_round_trip(self):
+        merged = train(TWO_LOOPS, [3]).merge(train(TWO_LOOPS, [4]))
+        self.assertEqual(merged.runs, 2)
+        self.assertEqual(merged.nodes["4"]["true"], 7)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.json")
+            merged.save(path)
+            loaded = pgo.Profile.load(path)
+        self.assertEqual(loaded.to_dict(), merged.to_dict())
+
+    def test_merge_rejects_other_program(self):
+        other = TWO_LOOPS.replace("WRITE f;", "WRITE a;")
+        with self.assertRaises(pgo.ProfileError):
+            train(TWO_LOOPS, [3]).merge(train(other, [3]))
+
+    def test_fingerprint_ignores_formatting(self):
+        reformatted = TWO_LOOPS.replace("\n  ", "\n\t\t").replace(";", " ;\n")
+        self.assertEqual(pgo.fingerprint(analyze(reformatted)[0]), pgo.fingerprint(analyze(TWO_LOOPS)[0]))
+
+
+class ProfileUseTests(unittest.TestCase):
+    """Compiling with a profile must keep output and save steps"""
+
+    def test_profile_use_saves_steps(self):
+        profile = train(TWO_LOOPS, [50], opt_level=0)
+        plain, _ = run(TWO_LOOPS, [50])
+        guided, code_gen = run(TWO_LOOPS, [50], profile)
+        self.assertEqual(guided["output"], plain["output"])
+        self.assertLess(guided["steps"], plain["steps"] * 0.6)
+
+        promote = next(r for r in code_gen.pass_manager.records if r.name == "promote")
+        self.assertEqual(promote.stats, {"loops": 2, "promoted": 6})
+        # The shared loop copies hold the fast cells
+        fast = {name for name, address in code_gen.memory_map.items() if address < 3}
+        self.assertTrue(all(name.startswith('$') for name in fast))
+
+    def test_other_inputs_stay_correct(self):
+        profile = train(TWO_LOOPS, [50])
+        for n in (0, 1, 2, 9):
+            plain, _ = run(TWO_LOOPS, [n])
+            guided, _ = run(TWO_LOOPS, [n], profile)
+            self.assertEqual(guided["output"], plain["output"])
+
+    def test_cold_loop_not_promoted(self):
+        profile = train(TWO_LOOPS, [0])
+        _, code_gen = run(TWO_LOOPS, [0], profile)
+        promote = next(r for r in code_gen.pass_manager.records if r.name == "promote")
+        self.assertEqual(promote.stats["loops"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
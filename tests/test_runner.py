@@ -1,12 +1,9 @@
 # tests/test_runner.py
-import os
-import sys
-import timeit
 import unittest
-from compiler.lexer import Lexer
-from compiler.parser import Parser
+from compiler.lexer import lexer
+from compiler.parser import parse
 from compiler.semantic import SemanticAnalyzer
-from compiler.codegen import CodeGenerator
+from tests.support import compile_source
 from vm import VM
 
 
@@ -15,19 +12,8 @@ class CompilerTestCase(unittest.TestCase):
 
     def compile_and_run(self, source_code, input_data=None):
         """Compile the source code and run it in the VM"""
-        lexer = Lexer()
-        tokens = lexer.tokenize(source_code)
-
-        parser = Parser()
-        ast = parser.parse(tokens)
-
-        analyzer = SemanticAnalyzer()
-        symbol_table = analyzer.analyze(ast)
-
-        code_gen = CodeGenerator(symbol_table)
-        program = code_gen.generate(ast)
-
-        vm = VM(program, input_data)
+        program, _ = compile_source(source_code)
+        vm = VM(program, list(input_data or []), quiet=True)
         return vm.run()
 
 
@@ -36,7 +22,7 @@ class BasicTests(CompilerTestCase):
 
     def test_arithmetic(self):
         source = """
-        CONST zero=0 one=1
+        CONST zero := 0 one := 1
         VAR x y z
         BEGIN
           x := 5;
@@ -58,7 +44,7 @@ class BasicTests(CompilerTestCase):
 
     def test_conditions(self):
         source = """
-        CONST zero=0 one=1
+        CONST zero := 0 one := 1 five := 5
         VAR x y z
         BEGIN
           x := 5;
@@ -77,7 +63,7 @@ class BasicTests(CompilerTestCase):
           END
           WRITE z;
 
-          IF x == 5 THEN
+          IF x == five THEN
             z := 1;
           ELSE
             z := 0;
@@ -90,14 +76,14 @@ class BasicTests(CompilerTestCase):
 
     def test_loops(self):
         source = """
-        CONST zero=0 one=1
+        CONST zero := 0 one := 1 five := 5
         VAR i sum
         BEGIN
           i := 1;
           sum := 0;
-          WHILE i <= 5 DO
+          WHILE i <= five DO
             sum := sum + i;
-            i := i + 1;
+            i := i + one;
           END
           WRITE sum;
         END
@@ -107,13 +93,15 @@ class BasicTests(CompilerTestCase):
 
     def test_io(self):
         source = """
-        VAR x y
+        CONST
+        VAR x y z
         BEGIN
           READ x;
           READ y;
           WRITE x;
           WRITE y;
-          WRITE x + y;
+          z := x + y;
+          WRITE z;
         END
         """
         input_data = [42, 58]
@@ -121,11 +109,138 @@ class BasicTests(CompilerTestCase):
         self.assertEqual(result["output"], [42, 58, 100])
 
 
+class RegressionTests(CompilerTestCase):
+    """Behaviour the baseline code generator got wrong"""
+
+    def test_relations(self):
+        # The baseline inverted or never took ==, !=, <, > and >=; only <= was right
+        relations = ["==", "!=", "<", ">", "<=", ">="]
+        lines = ["CONST zero := 0 one := 1", "VAR x y z", "BEGIN", "  READ x;", "  READ y;"]
+        for relation in relations:
+            lines.append(f"  IF x {relation} y THEN z := one; ELSE z := zero; END")
+            lines.append("  WRITE z;")
+        lines.append("END")
+        source = "\n".join(lines)
+
+        checks = {"==": lambda x, y: x == y, "!=": lambda x, y: x != y, "<": lambda x, y: x < y,
+                  ">": lambda x, y: x > y, "<=": lambda x, y: x <= y, ">=": lambda x, y: x >= y}
+        for x, y in [(3, 7), (7, 3), (5, 5), (0, 0), (0, 9)]:
+            with self.subTest(x=x, y=y):
+                expected = [int(checks[relation](x, y)) for relation in relations]
+                self.assertEqual(self.compile_and_run(source, [x, y])["output"], expected)
+
+    def test_division_and_modulo(self):
+        # The baseline division template jumped to a label it never defined
+        source = """
+        CONST zero := 0
+        VAR x y q r
+        BEGIN
+          READ x;
+          READ y;
+          q := x / y;
+          r := x % y;
+          WRITE q;
+          WRITE r;
+        END
+        """
+        for x, y in [(100, 7), (7, 100), (42, 42), (0, 5), (5, 0), (1 << 40, 3)]:
+            with self.subTest(x=x, y=y):
+                expected = [x // y, x % y] if y else [0, 0]
+                self.assertEqual(self.compile_and_run(source, [x, y])["output"], expected)
+
+
+class ForLoopTests(CompilerTestCase):
+    """Counted FOR loops"""
+
+    def analyze_errors(self, source_code):
+        analyzer = SemanticAnalyzer()
+        _, errors = analyzer.analyze(parse(source_code, lexer=lexer.clone()))
+        return errors
+
+    def test_ranges(self):
+        source = """
+        CONST one := 1
+        VAR a b s
+        BEGIN
+          READ a;
+          READ b;
+          FOR i FROM a TO b DO WRITE i; END
+          FOR i FROM b DOWNTO a DO WRITE i; END
+          FOR i FROM 1 TO 3 DO
+            FOR j FROM i DOWNTO one DO s := s + j; END
+          END
+          WRITE s;
+        END
+        """
+        for a, b, expected in [(2, 4, [2, 3, 4, 4, 3, 2]), (3, 3, [3, 3]), (5, 2, []), (0, 1, [0, 1, 1, 0])]:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(self.compile_and_run(source, [a, b])["output"], expected + [10])
+
+    def test_bounds_are_read_once(self):
+        source = """
+        CONST one := 1
+        VAR n
+        BEGIN
+          READ n;
+          FOR i FROM one TO n DO
+            n := n + one;
+            WRITE i;
+          END
+          WRITE n;
+        END
+        """
+        self.assertEqual(self.compile_and_run(source, [3])["output"], [1, 2, 3, 6])
+
+    def test_iterator_rules(self):
+        body = "CONST c := 1 VAR x i BEGIN {} END"
+        self.assertIn("Assignment to loop iterator 'k'",
+                      self.analyze_errors(body.format("FOR k FROM 1 TO 2 DO k := x; END")))
+        self.assertIn("READ into loop iterator 'k'",
+                      self.analyze_errors(body.format("FOR k FROM 1 TO 2 DO READ k; END")))
+        self.assertIn("Loop iterator 'i' shadows a declared identifier",
+                      self.analyze_errors(body.format("FOR i FROM 1 TO 2 DO WRITE i; END")))
+        self.assertIn("Loop iterator 'k' is already the iterator of an enclosing loop",
+                      self.analyze_errors(body.format("FOR k FROM 1 TO 2 DO FOR k FROM 1 TO 2 DO x := c; END END")))
+        self.assertIn("WRITE undeclared identifier 'k'",
+                      self.analyze_errors(body.format("FOR k FROM 1 TO 2 DO x := k; END WRITE k;")))
+        # The iterator is not in scope in its own bounds, but a later loop may reuse the name
+        self.assertEqual(self.analyze_errors(body.format("FOR k FROM 1 TO 2 DO WRITE k; END "
+                                                         "FOR k FROM x DOWNTO c DO WRITE k; END")), [])
+
+    def test_cheaper_than_while(self):
+        counted = """
+        CONST
+        VAR n s
+        BEGIN
+          READ n;
+          FOR i FROM 1 TO n DO s := s + i; END
+          WRITE s;
+        END
+        """
+        conditional = """
+        CONST one := 1
+        VAR n i s
+        BEGIN
+          READ n;
+          i := one;
+          WHILE i <= n DO s := s + i; i := i + one; END
+          WRITE s;
+        END
+        """
+        per_iteration = {}
+        for name, source in (("for", counted), ("while", conditional)):
+            runs = [self.compile_and_run(source, [n]) for n in (0, 100)]
+            self.assertEqual(runs[1]["output"], [5050])
+            per_iteration[name] = (runs[1]["steps"] - runs[0]["steps"]) / 100
+        self.assertLess(per_iteration["for"], per_iteration["while"] / 2)
+
+
 class PerformanceTests(CompilerTestCase):
     """Performance tests for arithmetic operations"""
 
     def test_multiplication_performance(self):
         source = """
+        CONST
         VAR x y z
         BEGIN
           x := 12345;
@@ -141,6 +256,7 @@ class PerformanceTests(CompilerTestCase):
 
     def test_division_performance(self):
         source = """
+        CONST
         VAR x y z
         BEGIN
           x := 1234567;
@@ -0,0 +1,83 @@
+# tests/test_scanner.py
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from compiler.lexer import lexer
+from compiler.parser import parse
+from compiler.scanner import Scanner, scan, mapped
+from compiler.incremental import command_key
+from tests.benchmark import load_corpus
+
+
+def ply_tokens(source):
+    ply = lexer.clone()
+    ply.input(source)
+    return [(t.type, t.value, t.lineno) for t in iter(ply.token, None)]
+
+
+def scanned(source):
+    return [(t.type, t.value, t.lineno) for t in scan(source)]
+
+
+class TestScanner(unittest.TestCase):
+    def test_matches_ply_on_corpus(self):
+        for name, source, _ in load_corpus():
+            with self.subTest(name):
+                self.assertEqual(scanned(source), ply_tokens(source))
+
+    def test_keywords_case_insensitive(self):
+        self.assertEqual(scanned("While wHILE begin_x Do"),
+                         [("WHILE", "While", 1), ("WHILE", "wHILE", 1), ("IDENTIFIER", "begin_x", 1),
+                          ("DO", "Do", 1)])
+
+    def test_operators(self):
+        types = [t.type for t in scan(":= + - * / % == != < > <= >= ;")]
+        self.assertEqual(types, ["ASSIGN", "PLUS", "MINUS", "TIMES", "DIVIDE", "MODULO", "EQUAL", "NOTEQUAL",
+                                 "LESS", "GREATER", "LESSEQUAL", "GREATEREQUAL", "SEMICOLON"])
+
+    def test_multiline_comment_and_positions(self):
+        tokens = list(scan("x := 1; (* one\n two\n *) y\n\n\t  z;"))
+        self.assertEqual([(t.value, t.lineno, t.column, t.lexpos) for t in tokens],
+                         [("x", 1, 1, 0), (":=", 1, 3, 2), (1, 1, 6, 5), (";", 1, 7, 6), ("y", 3, 5, 24),
+                          ("z", 5, 4, 30), (";", 5, 5, 31)])
+
+    def test_errors_reported_and_skipped(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            tokens = scanned("a\n  @ b (* open")
+        self.assertEqual(tokens, [("IDENTIFIER", "a", 1), ("IDENTIFIER", "b", 2)])
+        self.assertIn("Illegal character '@' at line 2, column 3", out.getvalue())
+        self.assertIn("Unterminated comment at line 2, column 7", out.getvalue())
+
+    def test_parser_gets_same_ast(self):
+        for name, source, _ in load_corpus():
+            with self.subTest(name):
+                ast = parse(source, lexer=Scanner())
+                expected = parse(source, lexer=lexer.clone())
+                self.assertEqual([command_key(c) for c in ast.commands],
+                                 [command_key(c) for c in expected.commands])
+
+    def test_syntax_error_reaches_p_error(self):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            parse("CONST VAR x BEGIN x := ; END", lexer=Scanner())
+        self.assertIn("Syntax error at ';' (line 1)", out.getvalue())
+
+    def test_mapped_file(self):
+        _, source, _ = load_corpus(names=["gcd"])[0]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "gcd.gbl")
+            with open(path, 'w') as f:
+                f.write(source)
+            with mapped(path) as data:
+                self.assertEqual(scanned(data), ply_tokens(source))
+            empty = os.path.join(directory, "empty.gbl")
+            open(empty, 'w').close()
+            with mapped(empty) as data:
+                self.assertEqual(list(scan(data)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
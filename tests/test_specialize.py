@@ -0,0 +1,125 @@
+# tests/test_specialize.py
+import unittest
+from compiler.lexer import lexer
+from compiler.parser import parse, Assignment, Write, While, For, Number
+from compiler.interpreter import Interpreter, interpret, LimitExceeded
+from compiler.specialize import specialize
+from tests import fuzz
+from tests.benchmark import load_corpus
+from tests.support import compile_source
+from vm import VM
+
+SOURCE = """
+CONST one := 1
+VAR n s k
+BEGIN
+  READ n;
+  FOR i FROM one TO n DO
+    s := s + i;
+  END
+  WRITE s;
+  READ k;
+  WHILE k > one DO
+    s := s + k;
+    k := k - one;
+  END
+  WRITE s;
+END
+"""
+
+
+def compile_residual(specialization):
+    """Compile the residual program from its printed source, which must parse and check"""
+    return compile_source(specialization.source())[0]
+
+
+class SpecializeTests(unittest.TestCase):
+    def setUp(self):
+        self.ast = parse(SOURCE, lexer=lexer.clone())
+
+    def test_known_inputs_collapse_to_writes(self):
+        specialization = specialize(self.ast, [5, 4])
+        commands = specialization.program.commands
+        self.assertTrue(all(isinstance(command, Write) or isinstance(command.expr, Number) for command in commands))
+        self.assertEqual(interpret(specialization.program), [15, 24])
+        self.assertEqual((specialization.consumed, specialization.leftover), (2, []))
+        self.assertEqual(specialization.count("resolved"), 2)
+
+    def test_residual_keeps_what_is_unknown(self):
+        specialization = specialize(self.ast, [5])
+        kinds = [command.kind for command in specialization.program.commands]
+        self.assertEqual(kinds, ["assignment", "write", "read", "while", "write"])
+        self.assertEqual(specialization.commands["1"], ("FOR i", {"unrolled iterations": 5, "resolved": 1}))
+        self.assertEqual(specialization.commands["4"][1], {"residual": 1})
+        self.assertIn("Specialized on 1 of 1 known inputs", specialization.report())
+        self.assertEqual(VM(compile_residual(specialization), [4], quiet=True).run()["output"], [15, 24])
+
+    def test_reads_under_residual_control_flow_stay_in_order(self):
+        source = """
+        CONST
+        VAR a b c x
+        BEGIN
+          READ a;
+          x := a + a;
+          IF x > b THEN
+            READ b;
+          ELSE
+            b := a;
+          END
+          READ c;
+          WRITE b;
+          WRITE c;
+        END
+        """
+        ast = parse(source, lexer=lexer.clone())
+        self.assertEqual(specialize(ast, [3, 9, 6]).leftover, [])
+        # x is too large to evaluate, so whether the IF reads is only known at
+        # run time and the inputs after a are passed to the run
+        specialization = specialize(ast, [3, 9, 6], max_bits=2)
+        self.assertEqual((specialization.consumed, specialization.leftover), (1, [9, 6]))
+        self.assertEqual(specialization.commands["4"][1], {"residual": 1})
+        self.assertEqual(VM(compile_residual(specialization), specialization.leftover, quiet=True).run()["output"],
+                         [9, 6])
+
+    def test_bounds_leave_residual_loops(self):
+        specialization = specialize(self.ast, [50, 40], max_steps=40)
+        loops = [command for command in specialization.program.commands if isinstance(command, (While, For))]
+        self.assertEqual(len(loops), 2)
+        # The FOR continues from the iteration the unrolling stopped at
+        self.assertGreater(loops[0].start.value, 1)
+        self.assertEqual(VM(compile_residual(specialization), [], quiet=True).run()["output"],
+                         interpret(self.ast, [50, 40]))
+
+        # Values over max_bits are computed at run time
+        product = parse(SOURCE.replace("s := s + k", "s := s * k"), lexer=lexer.clone())
+        specialization = specialize(product, [5, 300], max_bits=64)
+        self.assertTrue(any(isinstance(command, Assignment) and not isinstance(command.expr, Number)
+                            for command in specialization.program.commands))
+        self.assertEqual(interpret(specialization.program), interpret(product, [5, 300]))
+
+    def test_matches_interpreter(self):
+        for name, source, inputs in load_corpus():
+            ast = parse(source, lexer=lexer.clone())
+            expected = interpret(ast, inputs)
+            for known in range(len(inputs) + 1):
+                with self.subTest(program=name, known=known):
+                    specialization = specialize(ast, inputs[:known], max_unroll=16)
+                    vm = VM(compile_residual(specialization), specialization.leftover + inputs[known:], quiet=True,
+                            verified=True)
+                    self.assertEqual(vm.run()["output"], expected)
+
+        for seed in range(200):
+            source, inputs = fuzz.generate_program(seed)
+            ast = parse(source, lexer=lexer.clone())
+            try:
+                expected = Interpreter(ast, inputs, max_steps=fuzz.MAX_STEPS, max_bits=fuzz.MAX_BITS).run()["output"]
+            except LimitExceeded:
+                continue
+            known = seed % (len(inputs) + 1)
+            specialization = specialize(ast, inputs[:known], max_unroll=seed % 4)
+            residual = parse(specialization.source(), lexer=lexer.clone())
+            self.assertEqual(interpret(residual, specialization.leftover + inputs[known:]), expected, f"seed {seed}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# tests/test_stats.py
+import json
+import unittest
+from compiler.lexer import lexer
+from compiler.parser import parse
+from compiler.semantic import SemanticAnalyzer
+from compiler.codegen import CodeGenerator
+from compiler.stats import CompileStats, compile_source, count_nodes, tokenize
+
+SOURCE = """
+CONST one := 1
+VAR n i s
+BEGIN
+  READ n;
+  WHILE i < n DO
+    s := s + i;
+    i := i + one;
+  END
+  WRITE s;
+END
+"""
+
+
+class StatsTests(unittest.TestCase):
+    """Phase records of the compile pipeline"""
+
+    def test_phases_and_counts(self):
+        stats = CompileStats()
+        program = compile_source(SOURCE, stats=stats)
+        names = [record.name for record in stats.records]
+        for name in ("lex", "parse", "semantic", "codegen", "ir", "optimize", "licm", "emit", "backpatch"):
+            self.assertIn(name, names)
+
+        self.assertEqual(stats["lex"].counts["tokens"], len(tokenize(SOURCE)))
+        self.assertEqual(stats["parse"].counts["nodes"], count_nodes(parse(SOURCE, lexer=lexer.clone())))
+        self.assertEqual(stats["codegen"].counts["instructions"], len(program))
+        self.assertEqual(stats["codegen"].depth, 0)
+        self.assertEqual(stats["licm"].depth, 2)
+        for record in stats.records:
+            self.assertGreaterEqual(record.wall, 0)
+            self.assertGreaterEqual(record.peak_memory, 0)
+        self.assertGreaterEqual(stats["codegen"].peak_memory, stats["optimize"].peak_memory)
+
+    def test_same_program(self):
+        ast = parse(SOURCE, lexer=lexer.clone())
+        analyzer = SemanticAnalyzer()
+        analyzer.analyze(ast)
+        expected, _ = CodeGenerator(analyzer).generate(ast)
+        program = compile_source(SOURCE, stats=CompileStats(memory=False))
+        self.assertEqual([str(instr) for instr in program], [str(instr) for instr in expected])
+
+    def test_disabled_records_nothing(self):
+        stats = CompileStats(enabled=False)
+        compile_source(SOURCE, stats=stats)
+        self.assertEqual(stats.records, [])
+
+    def test_json(self):
+        stats = CompileStats(memory=False)
+        compile_source(SOURCE, stats=stats)
+        phases = json.loads(stats.to_json())["phases"]
+        self.assertEqual(len(phases), len(stats.records))
+        self.assertIsNone(phases[0]["peak_memory"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# tests/test_stream.py
+import os
+import tempfile
+import unittest
+from compiler import machine
+from compiler.lexer import lexer
+from compiler.parser import parse
+from compiler.semantic import SemanticAnalyzer
+from compiler.incremental import IncrementalCompiler
+from compiler.stream import StreamError, compile_stream
+from tests.benchmark import load_corpus
+from vm import VM
+
+SOURCE = """
+CONST one := 1
+VAR n s
+BEGIN
+  READ n;
+  FOR i FROM one TO n DO
+    s := s + i;
+  END
+  WRITE s;
+  s := s * n;
+  WRITE s;
+END
+"""
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def declare(self, const_decls, var_decls):
+        self.events.append(("declare", [decl.name for decl in const_decls + var_decls]))
+
+    def command(self, command):
+        self.events.append(("command", command.kind))
+
+
+class StreamTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = os.path.join(self.directory.name, "out")
+
+    def test_listener_sees_commands_as_parsed(self):
+        recorder = Recorder()
+        ast = parse(SOURCE, lexer=lexer.clone(), listener=recorder)
+        self.assertEqual(recorder.events, [("declare", ["one", "n", "s"]), ("command", "read"),
+                                           ("command", "for"), ("command", "write"),
+                                           ("command", "assignment"), ("command", "write")])
+        self.assertEqual(ast.commands, [])
+        self.assertEqual(len(parse(SOURCE, lexer=lexer.clone()).commands), 5)
+
+    def test_matches_incremental_build(self):
+        for name, source, inputs in load_corpus():
+            for binary in (False, True):
+                with self.subTest(program=name, binary=binary):
+                    counts = compile_stream(source, self.output, binary=binary)
+                    program = machine.load(self.output)
+                    ast = parse(source, lexer=lexer.clone())
+                    analyzer = SemanticAnalyzer()
+                    analyzer.analyze(ast)
+                    self.assertEqual(program, IncrementalCompiler().compile(ast, analyzer))
+                    self.assertEqual(counts, {"commands": len(ast.commands), "instructions": len(program)})
+
+    def test_runs(self):
+        compile_stream(SOURCE, self.output, opt_level=0)
+        program = machine.load(self.output)
+        self.assertEqual(VM(program, [4], quiet=True, verified=True).run()["output"], [10, 40])
+
+    def test_errors_leave_no_output(self):
+        with open(self.output, 'w') as f:
+            f.write("old\n")
+        with self.assertRaisesRegex(StreamError, "undeclared variable 'x'"):
+            compile_stream(SOURCE.replace("s := s * n", "x := s * n"), self.output)
+        with self.assertRaisesRegex(StreamError, "Syntax error"):
+            compile_stream(SOURCE.replace("WRITE s;\n  s", "WRITE s\n  s"), self.output)
+        self.assertEqual(os.listdir(self.directory.name), ["out"])
+        with open(self.output) as f:
+            self.assertEqual(f.read(), "old\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+# tests/test_target.py
+import json
+import os
+import tempfile
+import unittest
+from compiler.target import DEFAULT, Target, TargetError, get_target
+from tests import support
+from vm import VM
+
+SOURCE = """
+CONST one := 1
+VAR n i s a
+BEGIN
+  READ n;
+  a := 1000;
+  WHILE i < n DO
+    s := s + a;
+    i := i + one;
+  END
+  WRITE s;
+END
+"""
+
+WIDE = Target("wide", [(16, 10), (None, 100)])
+
+
+def compile_for(target, source=SOURCE):
+    return support.compile_source(source, target=target)
+
+
+class TargetTests(unittest.TestCase):
+    def test_default_is_the_assignment_machine(self):
+        self.assertEqual(DEFAULT.fast_cells, 3)
+        self.assertEqual([DEFAULT.memory_cost(address) for address in (0, 2, 3, 999)], [10, 10, 100, 100])
+        self.assertEqual(DEFAULT.instruction_cost("SCAN", 5), 100)
+        self.assertEqual(DEFAULT.instruction_cost("HALT", None), 0)
+        self.assertEqual(DEFAULT.instruction_cost("JODD", 7), 1)
+
+    def test_vm_charges_the_target(self):
+        program, _ = compile_for(DEFAULT)
+        for target in (DEFAULT, WIDE, Target("slow io", [(3, 10), (None, 100)], {"PRINT": 1000})):
+            vm = VM(program, [5], quiet=True, profile=True, target=target)
+            result = vm.run()
+            expected = sum(count * target.instruction_cost(instr.op, instr.arg)
+                           for count, instr in zip(vm.counts, program))
+            self.assertEqual(result["steps"], expected, target)
+            # The unchecked loop of verified programs charges the same
+            self.assertEqual(VM(program, [5], quiet=True, verified=True, target=target).run(), result)
+
+    def test_codegen_optimizes_for_the_target(self):
+        source = """
+        CONST one := 1
+        VAR n i x s
+        BEGIN
+          READ n;
+          WHILE i < n DO
+            x := 1000; s := s + x;
+            i := i + one;
+          END
+          WRITE s;
+        END
+        """
+        # Rebuilding 1000 takes 16 steps: more than a fast LOAD, less than a slow one
+        default_program, code_gen = compile_for(DEFAULT, source)
+        self.assertNotIn(1000, code_gen.pool_cells.values())
+        wide_program, code_gen = compile_for(WIDE, source)
+        self.assertLess(code_gen.pool[1000], WIDE.fast_cells)
+        self.assertEqual(VM(wide_program, [5], quiet=True).run()["output"], [5000])
+        self.assertLess(VM(wide_program, [5], quiet=True, target=WIDE).run()["steps"],
+                        VM(default_program, [5], quiet=True, target=WIDE).run()["steps"])
+
+        # With slow INC and SHL even a slow cell beats rebuilding it
+        slow_alu = Target("slow alu", [(3, 10), (None, 100)], {"SHL": 40, "INC": 40})
+        _, code_gen = compile_for(slow_alu, source)
+        self.assertIn(1000, code_gen.pool)
+
+    def test_json_round_trip(self):
+        target = Target("io", [(4, 5), (60, 20), (None, 100)], {"SCAN": 7}, memory_size=500)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "io.json")
+            with open(path, "w") as f:
+                json.dump(target.to_dict(), f)
+            loaded = get_target(path)
+        self.assertEqual(loaded.to_dict(), target.to_dict())
+        self.assertEqual([loaded.memory_cost(address) for address in (3, 4, 63, 64)], [5, 20, 20, 100])
+        self.assertEqual(len(VM([], target=loaded).p), 500)
+
+    def test_bad_descriptions(self):
+        with self.assertRaises(TargetError):
+            Target("x", [(None, 10), (3, 100)])
+        with self.assertRaises(TargetError):
+            Target("x", [(3, 10)], {"LOAD": 5})
+        with self.assertRaises(TargetError):
+            Target.from_dict({"name": "x"})
+        with self.assertRaises(TargetError):
+            get_target("no such target")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# tests/test_trace.py
+import os
+import tempfile
+import unittest
+from compiler.machine import Code
+from compiler.trace import Trace, TraceError, TraceRecorder, TRUNCATED, first_divergence, hot_loops, replay
+from tests.benchmark import compile_source, load_corpus
+from vm import VM
+
+# Reads n and counts it down to zero, printing n first
+COUNTDOWN = Code.from_text("""
+SCAN 3
+PRINT 3
+LOAD 3
+DEC
+JZ 6
+JUMP 3
+HALT
+""")
+
+
+def record(program, inputs, max_instructions=None, **options):
+    recorder = TraceRecorder(**options)
+    vm = VM(program, list(inputs), quiet=True, trace=recorder, max_instructions=max_instructions)
+    try:
+        vm.run()
+    except RuntimeError:
+        if max_instructions is None:
+            raise
+    return recorder
+
+
+class TestTraceRecorder(unittest.TestCase):
+    def test_records(self):
+        trace = record(COUNTDOWN, [2]).trace()
+        self.assertEqual([(r.pc, r.op, r.a, r.x) for r in trace], [
+            (0, "SCAN", 0, 2), (1, "PRINT", 0, 2), (2, "LOAD", 0, 3), (3, "DEC", 2, -1), (4, "JZ", 1, 6),
+            (5, "JUMP", 1, 3), (3, "DEC", 1, -1), (4, "JZ", 0, 6), (6, "HALT", 0, -1)])
+        self.assertEqual(trace.inputs(), [2])
+
+    def test_ring_keeps_last_records(self):
+        full = record(COUNTDOWN, [50]).trace()
+        ring = record(COUNTDOWN, [50], capacity=7).trace()
+        self.assertEqual(len(ring), 7)
+        self.assertEqual(ring.first, len(full) - 7)
+        self.assertEqual(list(ring), list(full)[-7:])
+        self.assertIsNone(first_divergence(full, ring))
+
+    def test_sampling(self):
+        full = record(COUNTDOWN, [50]).trace()
+        sampled = record(COUNTDOWN, [50], sample=4).trace()
+        self.assertEqual(list(sampled), list(full)[::4])
+        self.assertEqual(sampled[3].index, 12)
+
+    def test_file_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "run.trace")
+            recorder = record(COUNTDOWN, [50], path=path, capacity=16)
+            recorder.close()
+            self.assertEqual(list(Trace.load(path)), list(record(COUNTDOWN, [50]).trace()))
+
+            ring = record(COUNTDOWN, [50], capacity=10)
+            ring.save(path)
+            saved = Trace.load(path)
+            self.assertEqual((saved.first, list(saved)), (ring.trace().first, list(ring.trace())))
+
+    def test_wide_values_truncated(self):
+        # Counting 2**64 down would never end; the first few steps are enough
+        trace = record(COUNTDOWN, [2 ** 64 + 5], max_instructions=20).trace()
+        self.assertEqual(len(trace), 20)
+        self.assertTrue(trace[0].truncated)
+        self.assertEqual(trace[0].x, 5)
+        self.assertTrue(trace[3].truncated)  # a before the DEC
+        self.assertFalse(trace[2].truncated)
+        self.assertEqual(trace.ops[0], Code.from_text("SCAN 0").ops[0] | TRUNCATED)
+        with self.assertRaises(TraceError):
+            replay(trace, COUNTDOWN)
+
+
+class TestTraceTools(unittest.TestCase):
+    def test_replay_and_diff(self):
+        _, source, inputs = load_corpus(names=["primes"])[0]
+        _, program = compile_source(source)
+        trace = record(program, inputs, capacity=1 << 18).trace()
+        self.assertEqual(trace.first, 0)
+        self.assertIsNone(first_divergence(trace, replay(trace, program)))
+
+        trace = record(COUNTDOWN, [5]).trace()
+        changed = Code.from_text(COUNTDOWN.to_text().replace("LOAD 3", "LOAD 4"))
+        self.assertEqual(first_divergence(trace, replay(trace, changed)), 2)
+
+    def test_replay_rejects_partial_traces(self):
+        wrapped = record(COUNTDOWN, [50], capacity=10).trace()
+        self.assertGreater(wrapped.first, 0)
+        with self.assertRaises(TraceError):
+            replay(wrapped, COUNTDOWN)
+        with self.assertRaises(TraceError):
+            replay(record(COUNTDOWN, [50], sample=2).trace(), COUNTDOWN)
+
+    def test_diff_early_end(self):
+        left, right = record(COUNTDOWN, [5]).trace(), record(COUNTDOWN, [6]).trace()
+        self.assertEqual(first_divergence(left, right), 0)
+        self.assertEqual(first_divergence(left, Trace(left.pcs[:4], left.ops[:4], left.accumulators[:4],
+                                                      left.touched[:4])), 4)
+
+    def test_hot_loops(self):
+        trace = record(COUNTDOWN, [100]).trace()
+        ((header, latch, iterations, instructions),) = hot_loops(trace)
+        self.assertEqual((header, latch, iterations), (3, 5, 99))
+        self.assertEqual(instructions, 98 * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
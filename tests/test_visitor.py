@@ -0,0 +1,96 @@
+# tests/test_visitor.py
+import unittest
+from compiler.lexer import lexer
+from compiler.parser import parse, NODE_TYPES, Assignment, BinOp, Identifier, Number
+from compiler.visitor import Visitor
+
+SOURCE = """
+CONST one := 1
+VAR n s
+BEGIN
+  READ n;
+  WHILE n > s DO
+    s := s + one;
+    IF s == n THEN WRITE s; ELSE s := 0; END
+  END
+  FOR i FROM 1 TO n DO WRITE i; END
+END
+"""
+
+
+class Names(Visitor):
+    """Names read anywhere in a program, in visiting order"""
+
+    def __init__(self):
+        super().__init__()
+        self.names = []
+
+    def visit_program(self, node):
+        self.visit_all(node.commands)
+
+    def visit_assignment(self, node):
+        self.visit(node.expr)
+
+    def visit_if(self, node):
+        self.visit(node.condition)
+        self.visit_all(node.then_cmds)
+        self.visit_all(node.else_cmds)
+
+    def visit_while(self, node):
+        self.visit(node.condition)
+        self.visit_all(node.commands)
+
+    def visit_for(self, node):
+        self.visit(node.start)
+        self.visit(node.end)
+        self.visit_all(node.commands)
+
+    def visit_read(self, node):
+        pass
+
+    def visit_write(self, node):
+        self.names.append(node.name)
+
+    def visit_number(self, node):
+        pass
+
+    def visit_identifier(self, node):
+        self.names.append(node.name)
+
+    def visit_binop(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    visit_condition = visit_binop
+
+
+class VisitorTests(unittest.TestCase):
+    def test_walks_every_kind(self):
+        names = Names()
+        names.visit(parse(SOURCE, lexer=lexer.clone()))
+        self.assertEqual(names.names, ["n", "s", "s", "one", "s", "n", "s", "n", "i"])
+        self.assertEqual(set(names.dispatch), set(NODE_TYPES))
+
+    def test_missing_handler(self):
+        class Writes(Visitor):
+            def visit_write(self, node):
+                return node.name
+
+        writes = Writes()
+        self.assertEqual(set(Writes.handlers.values()), {"visit_write"})
+        with self.assertRaises(TypeError):
+            writes.visit(Number(1))
+        with self.assertRaises(TypeError):
+            writes.visit("not a node")
+
+    def test_nodes_are_slotted(self):
+        node = Assignment("x", BinOp(Identifier("a"), "+", Identifier("b")))
+        self.assertFalse(hasattr(node, "__dict__"))
+        with self.assertRaises(AttributeError):
+            node.line = 3
+        self.assertEqual(node.fields()[0], ("name", "x"))
+        self.assertEqual(repr(node.expr.left), "Identifier(name='a')")
+
+
+if __name__ == "__main__":
+    unittest.main()
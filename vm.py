@@ -1,51 +1,373 @@
-class Instruction:
-    def __init__(self, op, arg=None):
-        self.op = op
-        self.arg = arg
+import asyncio
 
-    def __str__(self):
-        if self.arg is not None:
-            return f"{self.op} {self.arg}"
-        return self.op
+from compiler.machine import Code, Instruction, OPCODE, OPCODES, NO_ARG, verify
+from compiler.target import DEFAULT
+from compiler.trace import MASK
+
+(HALT, ZERO, INC, DEC, SHL, SHR, LOAD, STORE, ADD, SUB,
+ SCAN, PRINT, JUMP, JZ, JG, JODD) = (OPCODE[name] for name in OPCODES)
+
+# What the machine generator stops for
+SCAN_EVENT, PRINT_EVENT, PAUSE_EVENT = range(3)
 
 
 class VM:
     """Virtual Machine simulating the register machine architecture"""
 
-    def __init__(self, program, input_data=None, debug=False):
-        self.program = program
+    def __init__(self, program, input_data=None, debug=False, quiet=False, profile=False,
+                 max_instructions=None, trace=None, verified=False, target=None):
+        # Runs straight off a Code's arrays; lists of Instructions are packed first
+        self.program = Code.from_instructions(program)
+        # Machine description (compiler.target.Target) steps are charged by
+        self.target = target if target is not None else DEFAULT
+        # A verified program runs without per-step checks when nothing needs them
+        self.verified = verified
+        if verified:
+            verify(self.program, self.target.memory_size)
+        self.costs = self.target.code_costs(self.program)
         self.input_data = input_data or []
         self.input_pos = 0
         self.output = []
         self.debug = debug
+        self.quiet = quiet  # Suppress the per-PRINT echo
+        self.max_instructions = max_instructions  # Stop runaway programs
 
         # Machine state
         self.a = 0  # Accumulator register
         self.k = 0  # Instruction counter
-        self.p = [0] * 1000  # Memory (we'll use 1000 cells)
+        self.p = [0] * self.target.memory_size  # Memory
 
         # Statistics
         self.steps = 0
         self.instructions_executed = 0
+        self.jumps = 0          # JUMP/JZ/JG/JODD executed
+        self.jumps_taken = 0    # ... of which transferred control
 
-    def run(self):
-        """Execute the program until HALT instruction"""
-        while self.k < len(self.program):
-            instr = self.program[self.k]
+        # Per-instruction execution counts and taken counts of jumps
+        self.profile = profile
+        self.counts = [0] * len(self.program) if profile else None
+        self.taken = [0] * len(self.program) if profile else None
 
-            if self.debug:
-                self._print_debug_info(instr)
-
-            self.execute_instruction(instr)
-            if instr.op == "HALT":
-                break
+        # compiler.trace.TraceRecorder receiving a record per instruction
+        self.trace = trace
+        if trace is not None:
+            trace.program = self.program
 
+    def run(self):
+        """Execute the program until HALT instruction.
+
+        SCAN reads input_data and asks on the terminal once it runs out.
+        """
+        machine = self._execute_verified() if self._unchecked() else self._execute()
+        try:
+            event, value = next(machine)
+            while True:
+                if event == SCAN_EVENT:
+                    event, value = machine.send(self._scan(value))
+                else:
+                    self._print(value)
+                    event, value = next(machine)
+        except StopIteration:
+            pass
+        return self._result()
+
+    async def run_async(self, source=None, sink=None, yield_every=1000):
+        """Execute the program as a coroutine.
+
+        Once input_data runs out SCAN awaits source() for the next value,
+        and PRINT awaits sink(value) when a sink is given.  Every
+        yield_every instructions the run yields to the event loop, so one
+        loop can drive many sessions side by side.
+        """
+        machine = self._execute_verified() if not yield_every and self._unchecked() else self._execute(yield_every)
+        try:
+            event, value = next(machine)
+            while True:
+                if event == SCAN_EVENT:
+                    if self.input_pos < len(self.input_data):
+                        value = self.input_data[self.input_pos]
+                    elif source is None:
+                        raise RuntimeError("SCAN with no input left and no input source")
+                    else:
+                        value = await source()
+                    self.input_pos += 1
+                    event, value = machine.send(value)
+                elif event == PRINT_EVENT:
+                    if sink is None:
+                        self._print(value)
+                    else:
+                        self.output.append(value)
+                        await sink(value)
+                    event, value = next(machine)
+                else:
+                    await asyncio.sleep(0)
+                    event, value = next(machine)
+        except StopIteration:
+            pass
+        finally:
+            machine.close()
+        return self._result()
+
+    def _unchecked(self):
+        return (self.verified and not self.debug and not self.profile and self.trace is None
+                and self.max_instructions is None)
+
+    def _execute_verified(self):
+        """_execute for a verified program that is not debugged, profiled, traced or limited.
+
+        Verification guarantees that every argument is in range and that
+        control never runs past the end, so the loop checks nothing per
+        step and takes each instruction's cost from a table.
+        """
+        ops, args, costs = self.program.ops, self.program.args, self.costs
+        p = self.p
+        a, k = self.a, self.k
+        steps, executed = self.steps, self.instructions_executed
+        jumps, jumps_taken = self.jumps, self.jumps_taken
+
+        try:
+            while True:
+                op = ops[k]
+                i = args[k]
+                executed += 1
+                steps += costs[k]
+
+                if op == LOAD:
+                    a = p[i]
+                    k += 1
+                elif op == STORE:
+                    p[i] = a
+                    k += 1
+                elif op == ADD:
+                    a += p[i]
+                    k += 1
+                elif op == SUB:
+                    a = max(a - p[i], 0)
+                    k += 1
+                elif op == JZ:
+                    jumps += 1
+                    if a == 0:
+                        k = i
+                        jumps_taken += 1
+                    else:
+                        k += 1
+                elif op == JG:
+                    jumps += 1
+                    if a > 0:
+                        k = i
+                        jumps_taken += 1
+                    else:
+                        k += 1
+                elif op == JUMP:
+                    k = i
+                    jumps += 1
+                    jumps_taken += 1
+                elif op == JODD:
+                    jumps += 1
+                    if a % 2 == 1:
+                        k = i
+                        jumps_taken += 1
+                    else:
+                        k += 1
+                elif op == SHR:
+                    a //= 2
+                    k += 1
+                elif op == SHL:
+                    a *= 2
+                    k += 1
+                elif op == INC:
+                    a += 1
+                    k += 1
+                elif op == DEC:
+                    a = max(a - 1, 0)
+                    k += 1
+                elif op == ZERO:
+                    a = 0
+                    k += 1
+                elif op == SCAN:
+                    p[i] = yield SCAN_EVENT, executed
+                    k += 1
+                elif op == PRINT:
+                    yield PRINT_EVENT, p[i]
+                    k += 1
+                else:
+                    break  # HALT
+        finally:
+            self.a, self.k = a, k
+            self.steps, self.instructions_executed = steps, executed
+            self.jumps, self.jumps_taken = jumps, jumps_taken
+
+    def _execute(self, pause_every=None):
+        """Generator running the program up to HALT.
+
+        It yields (SCAN_EVENT, instructions executed) and expects the value
+        read to be sent back, (PRINT_EVENT, value) for every value printed
+        and, with pause_every, (PAUSE_EVENT, None) after each that many
+        instructions.  Machine state lives in locals while it runs and is
+        written back when it stops.
+        """
+        ops, args, costs = self.program.ops, self.program.args, self.costs
+        end = len(ops)
+        p = self.p
+        a, k = self.a, self.k
+        steps, executed = self.steps, self.instructions_executed
+        jumps, jumps_taken = self.jumps, self.jumps_taken
+        limit = self.max_instructions if self.max_instructions is not None else -1
+        debug, profile = self.debug, self.profile
+        counts, taken = self.counts, self.taken
+        trace = self.trace
+        if trace is not None:
+            pcs, accumulators = trace.pcs, trace.accumulators
+            n, skip, sample, capacity = trace.n, trace.skip, trace.sample, trace.capacity
+        # One comparison per instruction covers both the limit and pauses
+        pause = executed + pause_every if pause_every else -1
+        checkpoint = min(limit, pause) if limit >= 0 and pause >= 0 else max(limit, pause)
+
+        try:
+            while k < end:
+                op = ops[k]
+                i = args[k]
+                if debug:
+                    self.a, self.k, self.instructions_executed = a, k, executed
+                    self._print_debug_info(Instruction(OPCODES[op], None if i == NO_ARG else i))
+                if profile:
+                    counts[k] += 1
+                    if op >= JUMP and i != k + 1 and (op == JUMP or (op == JZ and a == 0) or (op == JG and a > 0)
+                                                      or (op == JODD and a % 2 == 1)):
+                        taken[k] += 1
+                if trace is not None:
+                    if skip:
+                        skip -= 1
+                    else:
+                        skip = sample - 1
+                        if n == capacity:
+                            n = trace.full()
+                        pcs[n] = k
+                        try:
+                            accumulators[n] = a
+                        except OverflowError:
+                            accumulators[n] = a & MASK
+                            trace.widen(n)
+                        n += 1
+                executed += 1
+                steps += costs[k]
+                if op == LOAD:
+                    a = p[i]
+                    k += 1
+                elif op == STORE:
+                    p[i] = a
+                    k += 1
+                elif op == ADD:
+                    a += p[i]
+                    k += 1
+                elif op == SUB:
+                    a = max(a - p[i], 0)
+                    k += 1
+                elif op == JZ:
+                    if a == 0:
+                        k = i
+                        jumps_taken += 1
+                    else:
+                        k += 1
+                    jumps += 1
+                elif op == JG:
+                    if a > 0:
+                        k = i
+                        jumps_taken += 1
+                    else:
+                        k += 1
+                    jumps += 1
+                elif op == JUMP:
+                    k = i
+                    jumps += 1
+                    jumps_taken += 1
+                elif op == JODD:
+                    if a % 2 == 1:
+                        k = i
+                        jumps_taken += 1
+                    else:
+                        k += 1
+                    jumps += 1
+                elif op == SHR:
+                    a //= 2
+                    k += 1
+                elif op == SHL:
+                    a *= 2
+                    k += 1
+                elif op == INC:
+                    a += 1
+                    k += 1
+                elif op == DEC:
+                    a = max(a - 1, 0)
+                    k += 1
+                elif op == ZERO:
+                    a = 0
+                    k += 1
+                elif op == SCAN:
+                    p[i] = yield SCAN_EVENT, executed
+                    if trace is not None and skip == sample - 1:
+                        self._touch(n - 1, p[i])
+                    k += 1
+                elif op == PRINT:
+                    yield PRINT_EVENT, p[i]
+                    if trace is not None and skip == sample - 1:
+                        self._touch(n - 1, p[i])
+                    k += 1
+                elif op == HALT:
+                    break
+                else:
+                    raise ValueError(f"Unknown instruction: {op}")
+
+                if executed == checkpoint:
+                    if executed == limit:
+                        raise RuntimeError(f"Instruction limit of {self.max_instructions} exceeded")
+                    self.a, self.k, self.instructions_executed = a, k, executed
+                    yield PAUSE_EVENT, None
+                    pause += pause_every
+                    checkpoint = min(limit, pause) if limit >= 0 else pause
+        finally:
+            self.a, self.k = a, k
+            self.steps, self.instructions_executed = steps, executed
+            self.jumps, self.jumps_taken = jumps, jumps_taken
+            if trace is not None:
+                trace.n, trace.skip = n, skip
+
+    def _touch(self, index, value):
+        """Record the value SCAN read or PRINT wrote in the trace record at index"""
+        try:
+            self.trace.touched[index] = value
+        except OverflowError:
+            self.trace.touched[index] = (value & MASK) - (1 << 64 if value & (1 << 63) else 0)
+            self.trace.widen(index)
+
+    def _result(self):
         return {
             "output": self.output,
             "steps": self.steps,
-            "instructions": self.instructions_executed
+            "instructions": self.instructions_executed,
+            "jumps": self.jumps,
+            "jumps_taken": self.jumps_taken
         }
 
+    def _print(self, value):
+        self.output.append(value)
+        if not self.quiet:
+            print(f"Output: {value}")
+
+    def _scan(self, executed):
+        """Next input value, asked for interactively once the given input runs out"""
+        if self.input_pos >= len(self.input_data):
+            try:
+                value = int(input(f"Enter input value for SCAN instruction {executed}: "))
+                self.input_data.append(value)
+            except ValueError:
+                print("Invalid input. Using 0 as default.")
+                value = 0
+        else:
+            value = self.input_data[self.input_pos]
+        self.input_pos += 1
+        return value
+
     def _print_debug_info(self, instr):
         """Print debug information about current VM state"""
         print(f"\nStep {self.instructions_executed + 1}")
@@ -55,132 +377,18 @@ class VM:
         print(f"First 10 memory cells (P): {self.p[:10]}")
         print(f"Output so far: {self.output}")
 
-    def execute_instruction(self, instr):
-        """Execute a single instruction"""
-        op = instr.op
-        self.instructions_executed += 1
-
-        if op == "SCAN":
-            i = instr.arg
-            if self.input_pos >= len(self.input_data):
-                try:
-                    value = int(input(f"Enter input value for SCAN instruction {self.instructions_executed}: "))
-                    self.input_data.append(value)
-                except ValueError:
-                    print("Invalid input. Using 0 as default.")
-                    value = 0
-            else:
-                value = self.input_data[self.input_pos]
-
-            self.p[i] = value
-            self.input_pos += 1
-            self.k += 1
-            self.steps += 100
-
-        elif op == "PRINT":
-            i = instr.arg
-            self.output.append(self.p[i])
-            print(f"Output: {self.p[i]}")
-            self.k += 1
-            self.steps += 100
-
-        elif op == "LOAD":
-            i = instr.arg
-            self.a = self.p[i]
-            self.k += 1
-            self.steps += 10 if i < 3 else 100
-
-        elif op == "STORE":
-            i = instr.arg
-            self.p[i] = self.a
-            self.k += 1
-            self.steps += 10 if i < 3 else 100
-
-        elif op == "ADD":
-            i = instr.arg
-            self.a += self.p[i]
-            self.k += 1
-            self.steps += 10 if i < 3 else 100
-
-        elif op == "SUB":
-            i = instr.arg
-            self.a = max(self.a - self.p[i], 0)
-            self.k += 1
-            self.steps += 10 if i < 3 else 100
-
-        elif op == "SHR":
-            self.a = self.a // 2
-            self.k += 1
-            self.steps += 1
-
-        elif op == "SHL":
-            self.a = 2 * self.a
-            self.k += 1
-            self.steps += 1
-
-        elif op == "INC":
-            self.a += 1
-            self.k += 1
-            self.steps += 1
-
-        elif op == "DEC":
-            self.a = max(self.a - 1, 0)
-            self.k += 1
-            self.steps += 1
-
-        elif op == "ZERO":
-            self.a = 0
-            self.k += 1
-            self.steps += 1
-
-        elif op == "JUMP":
-            i = instr.arg
-            self.k = i
-            self.steps += 1
-
-        elif op == "JZ":
-            i = instr.arg
-            if self.a == 0:
-                self.k = i
-            else:
-                self.k += 1
-            self.steps += 1
-
-        elif op == "JG":
-            i = instr.arg
-            if self.a > 0:
-                self.k = i
-            else:
-                self.k += 1
-            self.steps += 1
-
-        elif op == "JODD":
-            i = instr.arg
-            if self.a % 2 == 1:
-                self.k = i
-            else:
-                self.k += 1
-            self.steps += 1
-
-        elif op == "HALT":
-            self.steps += 0  # HALT costs 0 steps
 
-        else:
-            raise ValueError(f"Unknown instruction: {op}")
-
-
-def parse_program(program_text):
-    """Parse program text into list of Instructions"""
-    instructions = []
-    for line in program_text.strip().split('\n'):
-        line = line.strip()
-        if not line:
-            continue
-        parts = line.split()
-        op = parts[0]
-        arg = int(parts[1]) if len(parts) > 1 else None
-        instructions.append(Instruction(op, arg))
-    return instructions
+def parse_program(program_text, check=True):
+    """Parse program text into a Code; ';' starts a comment.
+
+    The program is verified unless check is false, so a malformed file
+    fails here with compiler.machine.VerificationError instead of midway
+    through a run.
+    """
+    program = Code.from_text(program_text)
+    if check:
+        verify(program)
+    return program
 
 
 # Example usage